@@ -1,19 +1,148 @@
 '''FastAPI backend for disease prediction.'''
 
-from fastapi import FastAPI, HTTPException
+from contextlib import AsyncExitStack, asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import List, Optional
 from pubmed_fetch import fetch_medical_info
-from symptom_matching import match_symptoms
-from tabnet_model import retrieve_top_diseases
+from symptom_matching import (
+    match_symptoms, resolve_user_input, indices_from_embeddings, indices_to_vector, symptom_names_to_indices,
+    get_symptoms_col,
+)
+from tabnet_model import retrieve_top_diseases, predict_proba_rows, top_diseases_from_proba
+from biobert_utils import model_status, get_embedding_rows, embedding_cache
+from batching import MicroBatcher
+from inference_executor import InferenceExecutor, ExecutorSaturated
+from runtime_config import load_runtime_config, apply_runtime_config, available_cpus, inference_pool
+from metrics import stage_timer, request_timings, server_timing_header, render_prometheus
+from result_cache import PredictionCache
+from batch_predict import RecordParser, score_records, DEFAULT_CHUNK_SIZE
+import startup
+import numpy as np
+import asyncio
+import tempfile
+import json
+import time
 import os
+import logging
 
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Load every artifact concurrently at startup instead of on first use (set PRELOAD_MODELS=0 to disable)
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', '1') == '1'
+
+# Cross-request micro-batching of BioBERT and TabNet inference
+MICRO_BATCHING = os.getenv('MICRO_BATCHING', '1') == '1'
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', 32))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', 5))
+
+# /predict/batch bodies are read in full before scoring starts; beyond this many bytes they go to a temporary file
+BATCH_SPOOL_MEMORY = int(os.getenv('BATCH_SPOOL_MEMORY', 8 * 1024 * 1024))
+
+# Add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.getenv('SERVER_TIMING', '0') == '1'
+
+# Required in the X-Admin-Token header of admin actions when set
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Torch threads and pool size from the environment, the autotuned runtime_config.json or the CPU quota,
+# applied before the pool is sized from them
+runtime_config = load_runtime_config()
+apply_runtime_config(runtime_config)
+
+# CPU-bound work runs here, never on the event loop. INFERENCE_MAX_PENDING bounds the
+# requests in flight; beyond it /predict answers 503. The pool only uses this uvicorn worker's share of the CPUs
+INFERENCE_EXECUTOR = os.getenv('INFERENCE_EXECUTOR', 'thread')
+inference_pool_size, inference_threads = inference_pool(runtime_config, INFERENCE_EXECUTOR)
+inference = InferenceExecutor(
+    kind=INFERENCE_EXECUTOR,
+    workers=inference_pool_size,
+    max_pending=int(os.getenv('INFERENCE_MAX_PENDING', 64)),
+    process_threads=inference_threads,
+)
+
+# Repeated inputs and repeated symptom sets skip matching and TabNet (RESULT_CACHE_SIZE=0 disables).
+# Keyed by artifact generation and cleared whenever reloaded artifacts are swapped in. Worker processes swap
+# on their own, so in process mode the cache watches the artifact files itself and caches nothing until the
+# workers have had time to reload
+prediction_cache = PredictionCache(
+    maxsize=int(os.getenv('RESULT_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('RESULT_CACHE_TTL', 3600)),
+    watch_paths=startup.watched_paths() if inference.kind == 'process' else (),
+    reload_grace=float(os.getenv('RESULT_CACHE_RELOAD_GRACE', 2 * startup.RELOAD_INTERVAL))
+    if inference.kind == 'process' else 0.0,
+)
+startup.on_swap(lambda names: prediction_cache.clear())
+
+# Batched requests are grouped by the artifact versions they are pinned to. Pinned values stay in
+# this process, so process workers run whatever versions they have loaded
+_batch_pinning = dict(group_by=startup.pinned, run_group=startup.run_pinned) if inference.kind == 'thread' else {}
+embedding_batcher = MicroBatcher('biobert', get_embedding_rows, max_batch_size=BATCH_MAX_SIZE,
+                                 max_wait_ms=BATCH_MAX_WAIT_MS, executor=inference.executor, **_batch_pinning)
+tabnet_batcher = MicroBatcher('tabnet', predict_proba_rows, max_batch_size=BATCH_MAX_SIZE,
+                              max_wait_ms=BATCH_MAX_WAIT_MS, executor=inference.executor, **_batch_pinning)
+
+
+def _preload_models():
+    if not startup.load_all():
+        raise RuntimeError(f'Artifacts failed to load: {[name for name, st in startup.status().items() if st["state"] == "failed"]}')
+
+
+async def _warm_up():
+    try:
+        await inference.warm_up(_preload_models)
+    except Exception as e:
+        logger.error(f'Model preload failed: {e}')
+
+
+@asynccontextmanager
+async def lifespan(app):
+    '''Warm the models in the background so the server binds immediately.'''
+    warm_up = asyncio.create_task(_warm_up()) if PRELOAD_MODELS else None
+    if startup.RELOAD_INTERVAL:
+        startup.watch(startup.RELOAD_INTERVAL)
+    yield
+    if warm_up is not None:
+        warm_up.cancel()
+    inference.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware('http')
+async def pin_artifacts(request: Request, call_next):
+    '''Serve the whole request from the artifact versions published when it arrived.'''
+    token = startup.pin()
+    try:
+        return await call_next(request)
+    finally:
+        startup.unpin(token)
+
+
+if SERVER_TIMING:
+    @app.middleware('http')
+    async def server_timing(request: Request, call_next):
+        '''Collect the stages timed while handling the request into a Server-Timing header.'''
+        timings = {}
+        token = request_timings.set(timings)
+        try:
+            response = await call_next(request)
+        finally:
+            request_timings.reset(token)
+        if timings:
+            response.headers['Server-Timing'] = server_timing_header(timings)
+        return response
 
 
 class UserInput(BaseModel):
-    '''User input model.'''
-    symptoms: str
+    '''User input model.
+
+    Either free-text symptoms, or dataset symptom names (which skip matching).
+    '''
+    symptoms: str = ''
+    symptom_names: Optional[List[str]] = None
 
 
 def generate_response(user_input, top_diseases):
@@ -69,14 +198,380 @@ async def predict_disease(user_input: UserInput):
         HTTPException: If prediction fails.
     '''
     try:
-        ip_vec = match_symptoms(user_input.symptoms)
-        top_diseases = retrieve_top_diseases(ip_vec)
-        response = generate_response(user_input.symptoms, top_diseases)
+        async with inference.admit():
+            with stage_timer.time('total'):
+                response = await _predict(user_input)
         return {'response': response}
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=f'Server busy: {e}', headers={'Retry-After': '1'})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Prediction failed: {str(e)}')
+
+
+async def _match(symptoms):
+    '''Match free-text symptoms to column indices.'''
+    if not MICRO_BATCHING:
+        with stage_timer.time('match'):
+            return await inference.run(match_symptoms, symptoms, as_indices=True)
+    with stage_timer.time('normalize'):
+        matched, terms = await inference.run(resolve_user_input, symptoms)
+    user_embs = None
+    if terms:
+        with stage_timer.time('embed'):
+            user_embs = np.vstack(await embedding_batcher.submit(terms))
+    with stage_timer.time('match'):
+        return await inference.run(indices_from_embeddings, user_embs, matched=matched)
+
+
+async def _top_diseases(user_input):
+    '''Match symptoms and run TabNet, each stage timed and off the event loop.
+
+    Returns:
+        tuple: (symptoms text, matched column indices, list of (disease, probability)).
+    '''
+    symptoms_text = user_input.symptoms or ', '.join(user_input.symptom_names or [])
+    # Cached results are keyed by the artifacts this request is pinned to: a request that finishes after a
+    # swap stores its old-version results where requests on the new versions never look
+    version = startup.generation()
+    if user_input.symptom_names:
+        indices = symptom_names_to_indices(user_input.symptom_names)
+    else:
+        indices = prediction_cache.get_indices(user_input.symptoms, version=version)
+        if indices is None:
+            indices = await _match(user_input.symptoms)
+            prediction_cache.put_indices(user_input.symptoms, indices, version=version)
+    top_diseases = prediction_cache.get_predictions(indices, version=version)
+    if top_diseases is None:
+        with stage_timer.time('tabnet'):
+            if MICRO_BATCHING:
+                pred_prob = (await tabnet_batcher.submit([indices_to_vector(indices)]))[0]
+                top_diseases = top_diseases_from_proba(pred_prob)
+            else:
+                top_diseases = await inference.run(retrieve_top_diseases, indices)
+        prediction_cache.put_predictions(indices, top_diseases, version=version)
+    return symptoms_text, indices, top_diseases
+
+
+async def _predict(user_input):
+    '''Predict and render the HTML response.'''
+    symptoms_text, _, top_diseases = await _top_diseases(user_input)
+    with stage_timer.time('response'):
+        # Description lookups are cheap and need no models, so a plain thread is enough
+        return await asyncio.to_thread(generate_response, symptoms_text, top_diseases)
     
 
+def _prediction_items(top_diseases):
+    return [{'rank': rank, 'disease': disease, 'probability': float(proba)}
+            for rank, (disease, proba) in enumerate(top_diseases, 1)]
+
+
+async def _describe(symptoms_text, item):
+    '''Attach the medical description of one predicted disease.'''
+    try:
+        info = await asyncio.to_thread(fetch_medical_info, item['disease'], symptoms_text)
+        return dict(item, description=info.strip())
+    except Exception as e:
+        return dict(item, description=None, error=str(e))
+
+
+async def _admitted_top_diseases(user_input):
+    '''Run _top_diseases inside an inference slot, mapping failures to HTTP errors.'''
+    try:
+        async with inference.admit():
+            return await _top_diseases(user_input)
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=503, detail=f'Server busy: {e}', headers={'Retry-After': '1'})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Prediction failed: {str(e)}')
+
+
+@app.post('/predict/json')
+async def predict_json(user_input: UserInput):
+    '''Predict diseases and return them as structured JSON instead of HTML.
+
+    Args:
+        user_input (UserInput): User input data.
+
+    Returns:
+        dict: Input text, matched symptom names and the top diseases with probability and description.
+
+    Raises:
+        HTTPException: 503 when the server is saturated, 500 if prediction fails.
+    '''
+    with stage_timer.time('total'):
+        symptoms_text, indices, top_diseases = await _admitted_top_diseases(user_input)
+        with stage_timer.time('response'):
+            # Descriptions are looked up concurrently rather than one after another
+            predictions = await asyncio.gather(*(_describe(symptoms_text, item) for item in _prediction_items(top_diseases)))
+    symptoms_col = get_symptoms_col()
+    return {
+        'symptoms': symptoms_text,
+        'matched_symptoms': [symptoms_col[idx] for idx in indices],
+        'predictions': predictions,
+    }
+
+
+@app.post('/predict/stream')
+async def predict_stream(user_input: UserInput):
+    '''Stream predictions as NDJSON: the top diseases first, then each description as it resolves.
+
+    Lines are ``{"type": "predictions", ...}`` with the matched symptoms and ranked
+    diseases, one ``{"type": "description", "rank", "disease", "description"}`` per
+    disease in completion order, and a final ``{"type": "done"}``.
+
+    Args:
+        user_input (UserInput): User input data.
+
+    Returns:
+        StreamingResponse: NDJSON stream.
+
+    Raises:
+        HTTPException: 503 when the server is saturated, 500 if prediction fails (before streaming starts).
+    '''
+    symptoms_text, indices, top_diseases = await _admitted_top_diseases(user_input)
+    items = _prediction_items(top_diseases)
+    symptoms_col = get_symptoms_col()
+
+    async def lines():
+        yield json.dumps({'type': 'predictions', 'symptoms': symptoms_text,
+                          'matched_symptoms': [symptoms_col[idx] for idx in indices], 'predictions': items}) + '\n'
+        for described in asyncio.as_completed([_describe(symptoms_text, item) for item in items]):
+            yield json.dumps(dict(await described, type='description')) + '\n'
+        yield json.dumps({'type': 'done'}) + '\n'
+
+    return StreamingResponse(lines(), media_type='application/x-ndjson')
+
+
+async def _spool_body(request):
+    '''Read the whole request body into a temporary file (in memory up to BATCH_SPOOL_MEMORY bytes).
+
+    The body has to be consumed before a StreamingResponse starts: while it
+    streams, the response listens for a client disconnect on the same receive
+    channel and would swallow the remaining body messages.
+
+    Returns:
+        SpooledTemporaryFile: The body, rewound.
+    '''
+    spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_MEMORY)
+    try:
+        async for chunk in request.stream():
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+def _spooled_lines(spool):
+    '''Yield the decoded lines of a spooled body, without their newlines.'''
+    for line in spool:
+        yield line.decode('utf-8').rstrip('\n')
+
+
+class _ReleasingResponse(StreamingResponse):
+    '''StreamingResponse that awaits release() once it has been sent, failed or been cancelled.
+
+    Cleanup cannot live in the body generator: a generator closed before its
+    first item (client gone, response cancelled) never runs its body.
+    '''
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.release()
+
+
+@app.post('/predict/batch')
+async def predict_batch(request: Request, chunk_size: int = DEFAULT_CHUNK_SIZE, field: str = 'symptoms', id_field: str = 'id'):
+    '''Score a JSONL (default) or CSV (Content-Type: text/csv) body in chunks, streaming the results.
+
+    The body is spooled in full first (see _spool_body); scoring and the response then stream chunk by chunk.
+
+    Args:
+        request (Request): Request whose body holds one record per line.
+        chunk_size (int): Rows scored per batch.
+        field (str): Field holding the symptom text.
+        id_field (str): Field copied to the output as id.
+
+    Returns:
+        StreamingResponse: JSONL results, one per input row, then a summary line with rows/sec.
+
+    Raises:
+        HTTPException: 503 if the inference executor is saturated.
+    '''
+    fmt = 'csv' if 'csv' in request.headers.get('content-type', '') else 'jsonl'
+    parser = RecordParser(fmt)
+    chunk_size = max(chunk_size, 1)
+    spool = await _spool_body(request)
+    # One inference slot is held for the whole stream, taken before the response starts so saturation is a 503.
+    # The response releases it (and the spool) however it ends, even if the generator never starts
+    slot = AsyncExitStack()
+    slot.callback(spool.close)
+    try:
+        await slot.enter_async_context(inference.admit())
+    except ExecutorSaturated as e:
+        await slot.aclose()
+        raise HTTPException(status_code=503, detail=f'Server busy: {e}', headers={'Retry-After': '1'})
+
+    async def score(chunk, start):
+        results = await inference.run(score_records, chunk, field, id_field, start)
+        return ''.join(json.dumps(result) + '\n' for result in results), sum('error' in result for result in results)
+
+    async def results():
+        start_time = time.perf_counter()
+        rows = errors = 0
+        chunk = []
+        for line in _spooled_lines(spool):
+            chunk.extend(parser.feed(line))
+            if len(chunk) >= chunk_size:
+                lines, chunk_errors = await score(chunk, rows)
+                rows += len(chunk)
+                errors += chunk_errors
+                chunk = []
+                yield lines
+        chunk.extend(parser.close())
+        if chunk:
+            lines, chunk_errors = await score(chunk, rows)
+            rows += len(chunk)
+            errors += chunk_errors
+            yield lines
+        elapsed = time.perf_counter() - start_time
+        yield json.dumps({'summary': {'rows': rows, 'errors': errors, 'seconds': elapsed,
+                                      'rows_per_sec': rows / elapsed if elapsed else 0.0}}) + '\n'
+
+    return _ReleasingResponse(results(), slot.aclose, media_type='application/x-ndjson')
+
+
+@app.get('/healthz')
+async def liveness():
+    '''Liveness probe: 200 as soon as the server answers, independent of model loading.'''
+    return {'status': 'ok'}
+
+
+@app.get('/readyz')
+async def readiness():
+    '''Readiness probe: 200 once every artifact is loaded where inference runs, 503 while loading.
+
+    Returns:
+        JSONResponse: Per-artifact load state and timing, BioBERT status and inference executor state.
+    '''
+    ready = inference.warm if inference.kind == 'process' else startup.is_ready()
+    return JSONResponse(status_code=200 if ready else 503, content={
+        'artifacts': startup.status(),
+        'biobert': model_status(),
+        'executor': inference.stats(),
+    })
+
+
+@app.get('/stats')
+async def stats():
+    '''Report inference executor, scheduler, stage timing and cache statistics.
+
+    Returns:
+        dict: Executor state, runtime settings, statistics per micro-batcher, per-stage timings and cache counters.
+    '''
+    return {
+        'executor': inference.stats(),
+        'runtime': dict(runtime_config._asdict(), cpus=available_cpus()),
+        'stages': stage_timer.stats(),
+        'batching': {batcher.name: batcher.stats() for batcher in (embedding_batcher, tabnet_batcher)},
+        'embedding_cache': embedding_cache.stats(),
+        'result_cache': prediction_cache.stats(),
+    }
+
+
+def _metric_samples():
+    '''Cache, executor, batching and load-time samples for /metrics.'''
+    samples = []
+    embedding_stats = embedding_cache.stats()
+    for result in ('hits', 'disk_hits', 'misses'):
+        samples.append(('embedding_cache_lookups_total', 'counter', 'Embedding cache lookups by result.',
+                        {'result': result}, embedding_stats[result]))
+    samples.append(('embedding_cache_hit_ratio', 'gauge', 'Embedding cache hit ratio.', None, embedding_stats['hit_rate']))
+    for level, level_stats in prediction_cache.stats().items():
+        if not isinstance(level_stats, dict):
+            continue
+        for result in ('hits', 'misses'):
+            samples.append(('result_cache_lookups_total', 'counter', 'Result cache lookups by level and result.',
+                            {'level': level, 'result': result}, level_stats[result]))
+        samples.append(('result_cache_hit_ratio', 'gauge', 'Result cache hit ratio per level.', {'level': level},
+                        level_stats['hit_rate']))
+    executor_stats = inference.stats()
+    samples.append(('inference_pending', 'gauge', 'Requests holding an inference slot.', None, executor_stats['pending']))
+    samples.append(('inference_rejected_total', 'counter', 'Requests rejected with 503.', None, executor_stats['rejected']))
+    for batcher in (embedding_batcher, tabnet_batcher):
+        samples.append(('batch_queue_depth', 'gauge', 'Items waiting in a micro-batcher.', {'batcher': batcher.name},
+                        batcher.stats()['queue_depth']))
+    for name, artifact_status in startup.status().items():
+        samples.append(('artifact_load_seconds', 'gauge', 'Artifact load time.', {'artifact': name},
+                        artifact_status['load_time_s']))
+        samples.append(('artifact_ready', 'gauge', 'Artifact loaded (1) or not (0).', {'artifact': name},
+                        artifact_status['state'] == 'ready'))
+        samples.append(('artifact_version', 'gauge', 'Artifact version, bumped on every load or hot reload.',
+                        {'artifact': name}, artifact_status['version']))
+    return samples
+
+
+class ReloadRequest(BaseModel):
+    '''Artifacts to reload; those whose files changed if omitted.'''
+    artifacts: Optional[List[str]] = None
+
+
+def _check_admin(request):
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail='Admin token required')
+
+
+@app.get('/admin/artifacts')
+async def admin_artifacts():
+    '''Active artifact versions: version number, source file fingerprints, load time and last reload error.
+
+    Returns:
+        dict: Artifact name to status.
+    '''
+    return startup.status()
+
+
+@app.post('/admin/reload')
+async def admin_reload(request: Request, reload_request: Optional[ReloadRequest] = None):
+    '''Load new artifact versions in the background and swap them in if they all validate.
+
+    In-flight requests finish on the versions they started with. In process
+    executor mode this reloads the API process; workers follow file changes themselves.
+
+    Returns:
+        dict: Reloaded artifacts with their new versions, or the error that kept the old ones.
+
+    Raises:
+        HTTPException: 403 without the admin token, 404 for an unknown artifact, 409 if validation fails.
+    '''
+    _check_admin(request)
+    names = reload_request.artifacts if reload_request else None
+    try:
+        result = await asyncio.to_thread(startup.reload, names)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if 'error' in result:
+        raise HTTPException(status_code=409, detail=result)
+    return result
+
+
+@app.get('/metrics')
+async def metrics():
+    '''Prometheus metrics: stage latency histograms, terms per input, cache hit rates and load times.
+
+    Returns:
+        PlainTextResponse: Prometheus text exposition.
+    '''
+    return PlainTextResponse(render_prometheus(_metric_samples()), media_type='text/plain; version=0.0.4')
+
+
 if __name__ == '__main__':
     import uvicorn
     port = int(os.getenv('PORT', 8000))
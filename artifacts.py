@@ -0,0 +1,227 @@
+'''Locations and lightweight readers for the shipped data artifacts.'''
+
+import numpy as np
+import pandas as pd
+import argparse
+import hashlib
+import json
+import struct
+import time
+import os
+import logging
+from collections import namedtuple
+from startup import artifact
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+AUG_DF_PATH = os.path.join(DATA_DIR, 'aug_df.csv')
+METADATA_PATH = os.path.join(DATA_DIR, 'metadata.json')
+SYMPTOM_EMBEDDINGS_PATH = os.path.join(DATA_DIR, 'symptom_embeddings.npy')
+TABNET_MODEL_PATH = os.path.join(DATA_DIR, 'tabnet_model.zip')
+PUBMED_INFO_PATH = os.path.join(DATA_DIR, 'pubmed_medical_info.csv')
+BUNDLE_PATH = os.getenv('SYMPTOM_BUNDLE_PATH', os.path.join(DATA_DIR, 'symptom_bundle.bin'))
+SYMPTOM_VARIANTS_PATH = os.getenv('SYMPTOM_VARIANTS_PATH', os.path.join(DATA_DIR, 'symptom_variants.json'))
+
+# Verify the bundle's embedding checksum when it is opened (one sequential read of the matrix)
+BUNDLE_VERIFY = os.getenv('BUNDLE_VERIFY', '1') == '1'
+
+BUNDLE_MAGIC = b'SHBUNDLE'
+BUNDLE_VERSION = 1
+# Embeddings start on an aligned offset so the memory map can be used as a float array directly
+BUNDLE_ALIGNMENT = 64
+BUNDLE_DTYPES = ('float32', 'float16')
+
+DatasetMetadata = namedtuple('DatasetMetadata', ['symptoms_col', 'disease_classes'])
+SymptomBundle = namedtuple('SymptomBundle', ['symptoms_col', 'disease_classes', 'embeddings', 'header'])
+
+
+def read_dataset_metadata_csv(path=AUG_DF_PATH):
+    '''Read symptom columns and disease classes from aug_df.csv without loading the one-hot rows.
+
+    Args:
+        path (str): Path to aug_df.csv.
+
+    Returns:
+        DatasetMetadata: Symptom column names and disease classes in factorize order.
+    '''
+    columns = pd.read_csv(path, nrows=0).columns
+    prognosis = pd.read_csv(path, usecols=['Prognosis'])['Prognosis']
+    return DatasetMetadata(symptoms_col=columns[1:], disease_classes=pd.factorize(prognosis)[1])
+
+
+def write_dataset_metadata(path=METADATA_PATH, source=AUG_DF_PATH):
+    '''Write the small metadata file read at startup instead of aug_df.csv.
+
+    Args:
+        path (str): Output JSON path.
+        source (str): Path to aug_df.csv.
+
+    Returns:
+        DatasetMetadata: The exported metadata.
+    '''
+    metadata = read_dataset_metadata_csv(source)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'symptoms': list(metadata.symptoms_col), 'diseases': list(metadata.disease_classes)}, f)
+    return metadata
+
+
+def file_sha256(path, block_size=1 << 20):
+    '''Hex SHA-256 of a file, read in blocks.'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_bundle(path, symptoms_col, disease_classes, embeddings, dtype='float32', model_path=TABNET_MODEL_PATH,
+                 embedding_model=None):
+    '''Write the runtime bundle: string tables, class order and unit-normalized embeddings in one file.
+
+    Layout: 8-byte magic, little-endian uint32 format version, uint32 header length,
+    a UTF-8 JSON header (string tables, dtype, shape, checksums), zero padding to a
+    64-byte boundary, then the raw row-major embedding matrix. The file is written
+    to a temporary name and renamed, so readers never see a partial bundle.
+
+    Args:
+        path (str): Output path.
+        symptoms_col (list of str): Symptom names in model input order.
+        disease_classes (list of str): Disease names in model output order.
+        embeddings (np.ndarray): Symptom embeddings, one row per symptom.
+        dtype (str): 'float32' or 'float16'. Defaults to 'float32'.
+        model_path (str, optional): TabNet model whose hash is recorded, so a retrained model invalidates the bundle.
+        embedding_model (str, optional): Name of the model that produced the embeddings.
+
+    Returns:
+        dict: The bundle header.
+
+    Raises:
+        ValueError: If dtype is unsupported or the embedding rows do not match the symptoms.
+    '''
+    from symptom_index import l2_normalize
+    if dtype not in BUNDLE_DTYPES:
+        raise ValueError(f'Unsupported bundle dtype {dtype!r}, expected one of {BUNDLE_DTYPES}')
+    if len(embeddings) != len(symptoms_col):
+        raise ValueError(f'{len(embeddings)} embedding rows for {len(symptoms_col)} symptoms')
+    data = np.ascontiguousarray(l2_normalize(embeddings).astype(dtype))
+    header = {
+        'version': BUNDLE_VERSION,
+        'created_at': time.time(),
+        'symptoms': [str(name) for name in symptoms_col],
+        'diseases': [str(name) for name in disease_classes],
+        'dtype': dtype,
+        'shape': list(data.shape),
+        'normalized': True,
+        'embeddings_sha256': hashlib.sha256(data.tobytes()).hexdigest(),
+        'model_sha256': file_sha256(model_path) if model_path and os.path.exists(model_path) else None,
+        'embedding_model': embedding_model,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    prefix = BUNDLE_MAGIC + struct.pack('<II', BUNDLE_VERSION, len(header_bytes)) + header_bytes
+    padding = -len(prefix) % BUNDLE_ALIGNMENT
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(prefix + b'\0' * padding)
+        f.write(data.tobytes())
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_bundle(path=BUNDLE_PATH, verify=True):
+    '''Open a bundle with its embeddings memory-mapped read-only.
+
+    The mapping is backed by the page cache, so every worker process on the host
+    that opens the same file shares one physical copy of the matrix.
+
+    Args:
+        path (str): Bundle path.
+        verify (bool): Check the embedding checksum. Defaults to True.
+
+    Returns:
+        SymptomBundle: String tables, the embedding memmap and the parsed header.
+
+    Raises:
+        ValueError: If the file is not a bundle, has an unknown version or fails its checksum.
+    '''
+    with open(path, 'rb') as f:
+        prefix = f.read(len(BUNDLE_MAGIC) + 8)
+        if prefix[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError(f'{path} is not a symptom bundle')
+        version, header_len = struct.unpack('<II', prefix[len(BUNDLE_MAGIC):])
+        if version != BUNDLE_VERSION:
+            raise ValueError(f'Unsupported bundle version {version}, expected {BUNDLE_VERSION}')
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    offset = len(prefix) + header_len
+    offset += -offset % BUNDLE_ALIGNMENT
+    embeddings = np.memmap(path, dtype=header['dtype'], mode='r', offset=offset, shape=tuple(header['shape']))
+    if verify and hashlib.sha256(embeddings).hexdigest() != header['embeddings_sha256']:
+        raise ValueError(f'{path} failed its embedding checksum')
+    return SymptomBundle(symptoms_col=pd.Index(header['symptoms']), disease_classes=pd.Index(header['diseases']),
+                         embeddings=embeddings, header=header)
+
+
+@artifact('symptom_bundle', paths=(BUNDLE_PATH, TABNET_MODEL_PATH))
+def get_bundle():
+    '''Memory-mapped runtime bundle, or None if absent or built for a different TabNet model.'''
+    if not os.path.exists(BUNDLE_PATH):
+        return None
+    bundle = read_bundle(BUNDLE_PATH, verify=BUNDLE_VERIFY)
+    model_sha256 = bundle.header.get('model_sha256')
+    if model_sha256 and os.path.exists(TABNET_MODEL_PATH) and file_sha256(TABNET_MODEL_PATH) != model_sha256:
+        logger.warning(f'{BUNDLE_PATH} was built for a different TabNet model, ignoring it')
+        return None
+    return bundle
+
+
+@artifact('dataset_metadata', paths=(METADATA_PATH, AUG_DF_PATH))
+def get_dataset_metadata():
+    '''Symptom column names and disease classes, from the bundle or metadata.json if present, else the aug_df.csv header.'''
+    bundle = get_bundle()
+    if bundle is not None:
+        return DatasetMetadata(symptoms_col=bundle.symptoms_col, disease_classes=bundle.disease_classes)
+    if os.path.exists(METADATA_PATH):
+        with open(METADATA_PATH, encoding='utf-8') as f:
+            metadata = json.load(f)
+        return DatasetMetadata(symptoms_col=pd.Index(metadata['symptoms']), disease_classes=pd.Index(metadata['diseases']))
+    try:
+        return read_dataset_metadata_csv()
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"Ensure aug_df.csv exists in data/: {e}")
+
+
+def export_bundle(path=BUNDLE_PATH, dtype='float32'):
+    '''Build the bundle from aug_df.csv, symptom_embeddings.npy and tabnet_model.zip.
+
+    Args:
+        path (str): Output path.
+        dtype (str): Embedding dtype, 'float32' or 'float16'. Defaults to 'float32'.
+
+    Returns:
+        dict: The bundle header.
+    '''
+    from biobert_utils import MODEL_NAME
+    metadata = read_dataset_metadata_csv()
+    embeddings = np.load(SYMPTOM_EMBEDDINGS_PATH)
+    return write_bundle(path, metadata.symptoms_col, metadata.disease_classes, embeddings, dtype=dtype,
+                        embedding_model=MODEL_NAME)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export runtime artifacts from the training data.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    metadata_parser = subparsers.add_parser('metadata', help='Write metadata.json (symptom and disease names)')
+    metadata_parser.add_argument('--output', default=METADATA_PATH)
+    bundle_parser = subparsers.add_parser('bundle', help='Write the memory-mapped symptom bundle')
+    bundle_parser.add_argument('--output', default=BUNDLE_PATH)
+    bundle_parser.add_argument('--dtype', choices=BUNDLE_DTYPES, default='float32',
+                               help='float16 halves the file, but each worker then keeps a private float32 copy')
+    args = parser.parse_args()
+    if args.command == 'metadata':
+        exported = write_dataset_metadata(args.output)
+        logger.info(f'Wrote {len(exported.symptoms_col)} symptoms and {len(exported.disease_classes)} diseases to {args.output}')
+    else:
+        header = export_bundle(args.output, dtype=args.dtype)
+        logger.info(f"Wrote {header['shape'][0]} x {header['shape'][1]} {header['dtype']} embeddings and "
+                    f"{len(header['diseases'])} diseases to {args.output}")
@@ -0,0 +1,204 @@
+'''Offline batch scoring of symptom strings (JSONL or CSV in, JSONL out).'''
+
+import numpy as np
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+import logging
+from symptom_matching import match_many, indices_to_vector, get_symptoms_col
+from tabnet_model import predict_proba, top_diseases_from_proba
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 256
+
+
+class RecordParser:
+    '''Incrementally parse JSONL or CSV lines into records.
+
+    Lines are fed one at a time so the input never has to be held in memory.
+    CSV records spanning several lines (quoted newlines) are reassembled before
+    parsing; the first CSV record is the header.
+
+    Args:
+        fmt (str): 'jsonl' or 'csv'.
+
+    Raises:
+        ValueError: If the format is unknown.
+    '''
+
+    def __init__(self, fmt):
+        if fmt not in ('jsonl', 'csv'):
+            raise ValueError(f'Unknown input format {fmt!r}, expected jsonl or csv')
+        self.fmt = fmt
+        self._header = None
+        self._pending = ''
+
+    def feed(self, line):
+        '''Parse one input line.
+
+        Args:
+            line (str): Input line, with or without its newline.
+
+        Returns:
+            list: Zero or more records (dicts); unparseable JSON gives an '__error__' record.
+        '''
+        line = line.rstrip('\r\n')
+        if self.fmt == 'jsonl':
+            if not line.strip():
+                return []
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                return [{'__error__': f'Invalid JSON: {e}'}]
+            return [record if isinstance(record, dict) else {'__error__': 'Each JSONL line must be an object'}]
+        self._pending += line + '\n'
+        # An odd number of quotes means a quoted field continues on the next line
+        if self._pending.count('"') % 2:
+            return []
+        return self._flush()
+
+    def close(self):
+        '''Parse whatever is left once the input ends.'''
+        return self._flush() if self.fmt == 'csv' else []
+
+    def _flush(self):
+        pending, self._pending = self._pending, ''
+        if not pending.strip():
+            return []
+        row = next(csv.reader(io.StringIO(pending)))
+        if self._header is None:
+            self._header = row
+            return []
+        return [dict(zip(self._header, row))]
+
+
+def score_records(records, text_field='symptoms', id_field='id', start=0, top_k=3, n_process=None):
+    '''Score a chunk of records in one batched pass.
+
+    Args:
+        records (list of dict): Parsed input records.
+        text_field (str): Field holding the symptom text. Defaults to 'symptoms'.
+        id_field (str): Field copied to the output as 'id'; the row number is used if missing.
+        start (int): Row number of the first record.
+        top_k (int): Diseases per row. Defaults to 3.
+        n_process (int, optional): spaCy worker processes for normalization.
+
+    Returns:
+        list: One result dict per record, with 'error' set for rows that could not be scored.
+    '''
+    results = []
+    valid_rows, valid_texts = [], []
+    for offset, record in enumerate(records):
+        text = record.get(text_field)
+        result = {'id': record.get(id_field, start + offset), 'symptoms': text}
+        if '__error__' in record:
+            result['error'] = record['__error__']
+        elif not isinstance(text, str) or not text.strip():
+            result['error'] = f'Missing or empty {text_field!r} field'
+        else:
+            valid_rows.append(offset)
+            valid_texts.append(text)
+        results.append(result)
+    if not valid_texts:
+        return results
+    try:
+        matched = match_many(valid_texts, n_process=n_process)
+        pred_prob = predict_proba(np.vstack([indices_to_vector(indices) for indices in matched]))
+    except Exception as e:
+        for offset in valid_rows:
+            results[offset]['error'] = str(e)
+        return results
+    symptoms_col = get_symptoms_col()
+    for offset, indices, row_prob in zip(valid_rows, matched, pred_prob):
+        results[offset]['matched_symptoms'] = [symptoms_col[idx] for idx in indices]
+        results[offset]['predictions'] = [
+            {'disease': disease, 'probability': float(proba)}
+            for disease, proba in top_diseases_from_proba(row_prob, top_k=top_k)
+        ]
+    return results
+
+
+def iter_chunks(records, chunk_size):
+    '''Group an iterable of records into lists of at most chunk_size.'''
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_records(lines, fmt):
+    '''Parse an iterable of lines into records.'''
+    parser = RecordParser(fmt)
+    for line in lines:
+        yield from parser.feed(line)
+    yield from parser.close()
+
+
+def run_batch(input_stream, output_stream, fmt='jsonl', chunk_size=DEFAULT_CHUNK_SIZE, text_field='symptoms', id_field='id',
+              n_process=None):
+    '''Stream records from input_stream, score them in chunks and write JSONL results.
+
+    Args:
+        input_stream (TextIO): JSONL or CSV input.
+        output_stream (TextIO): JSONL output.
+        fmt (str): 'jsonl' or 'csv'. Defaults to 'jsonl'.
+        chunk_size (int): Rows scored per batch. Defaults to 256.
+        text_field (str): Field holding the symptom text. Defaults to 'symptoms'.
+        id_field (str): Field copied to the output as 'id'. Defaults to 'id'.
+        n_process (int, optional): spaCy worker processes for normalization.
+
+    Returns:
+        dict: Rows, errors, elapsed seconds and rows per second.
+    '''
+    start_time = time.perf_counter()
+    rows = errors = 0
+    for chunk in iter_chunks(iter_records(input_stream, fmt), chunk_size):
+        for result in score_records(chunk, text_field=text_field, id_field=id_field, start=rows, n_process=n_process):
+            errors += 'error' in result
+            output_stream.write(json.dumps(result) + '\n')
+        rows += len(chunk)
+    elapsed = time.perf_counter() - start_time
+    return {'rows': rows, 'errors': errors, 'seconds': elapsed, 'rows_per_sec': rows / elapsed if elapsed else 0.0}
+
+
+def main(argv=None):
+    '''Command-line entry point.'''
+    parser = argparse.ArgumentParser(description='Score a JSONL or CSV file of symptom strings offline.')
+    parser.add_argument('input', help="Input file, or '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="Output JSONL file, or '-' for stdout (default)")
+    parser.add_argument('--format', choices=('auto', 'jsonl', 'csv'), default='auto', help='Input format (auto uses the file extension)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows scored per batch')
+    parser.add_argument('--field', default='symptoms', help='Field holding the symptom text')
+    parser.add_argument('--id-field', default='id', help='Field copied to the output as id')
+    parser.add_argument('--n-process', type=int, default=None, help='spaCy worker processes for normalization')
+    args = parser.parse_args(argv)
+
+    fmt = args.format
+    if fmt == 'auto':
+        fmt = 'csv' if args.input.lower().endswith('.csv') else 'jsonl'
+    input_stream = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8', newline='')
+    output_stream = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        stats = run_batch(input_stream, output_stream, fmt=fmt, chunk_size=args.chunk_size,
+                          text_field=args.field, id_field=args.id_field, n_process=args.n_process)
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+    logger.info(f"Scored {stats['rows']} rows ({stats['errors']} errors) in {stats['seconds']:.1f}s: "
+                f"{stats['rows_per_sec']:.1f} rows/sec")
+    return stats
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+'''Cross-request micro-batching for model inference.'''
+
+import asyncio
+import bisect
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch-size histogram buckets (last bucket is +Inf)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class _Request:
+    '''A group of items submitted by one caller, resolved together.'''
+
+    __slots__ = ('items', 'future', 'enqueued', 'key')
+
+    def __init__(self, items, future, key=None):
+        self.items = items
+        self.future = future
+        self.key = key
+        self.enqueued = time.perf_counter()
+
+
+class MicroBatcher:
+    '''Collect items from concurrent callers and run them through one batch call.
+
+    Callers ``await submit(items)`` with a list of inputs. A background task takes
+    the first waiting request, then keeps collecting requests until the batch holds
+    ``max_batch_size`` items or ``max_wait_ms`` has passed, runs ``batch_fn`` once
+    on the concatenated items in an executor and hands each caller its own slice.
+    A single request larger than ``max_batch_size`` is run as its own batch.
+
+    With ``group_by``, each request is tagged with ``group_by()`` evaluated in
+    the caller's context when it is submitted (e.g. the artifact versions the
+    request is pinned to). A batch is then split into runs of requests with the
+    same tag, each executed as ``run_group(tag, batch_fn, items)``, so requests
+    pinned to different versions never share a batch call.
+
+    Args:
+        name (str): Name used in stats and logs.
+        batch_fn (callable): Maps a list of items to a sequence of results, one per item.
+        max_batch_size (int): Soft cap on items per batch. Defaults to 32.
+        max_wait_ms (float): Longest time to wait for a batch to fill. Defaults to 5.
+        executor (concurrent.futures.Executor, optional): Where batch_fn runs, default loop executor if None.
+        group_by (callable, optional): Returns the tag of the submitting caller; tags are compared by identity.
+        run_group (callable, optional): Runs batch_fn for one tag as run_group(tag, batch_fn, items).
+    '''
+
+    def __init__(self, name, batch_fn, max_batch_size=32, max_wait_ms=5.0, executor=None, group_by=None,
+                 run_group=None):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1')
+        if max_wait_ms < 0:
+            raise ValueError('max_wait_ms must be non-negative')
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = executor
+        self.group_by = group_by
+        self.run_group = run_group
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._queued_items = 0
+        self._batches = 0
+        self._items = 0
+        self._requests = 0
+        self._errors = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self._histogram = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._queued_items = 0
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, items):
+        '''Queue items for the next batch and wait for their results.
+
+        Args:
+            items (list): Inputs for batch_fn.
+
+        Returns:
+            list: Results for ``items``, in order.
+        '''
+        items = list(items)
+        if not items:
+            return []
+        self._ensure_started()
+        key = self.group_by() if self.group_by is not None else None
+        request = _Request(items, self._loop.create_future(), key)
+        self._queued_items += len(items)
+        self._queue.put_nowait(request)
+        return await request.future
+
+    async def _next_batch(self):
+        first = await self._queue.get()
+        batch = [first]
+        size = len(first.items)
+        deadline = self._loop.time() + self.max_wait
+        while size < self.max_batch_size:
+            if self._queue.empty():
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                request = self._queue.get_nowait()
+            batch.append(request)
+            size += len(request.items)
+        self._queued_items -= size
+        return batch
+
+    def _groups(self, batch):
+        groups = []
+        for request in batch:
+            for key, requests in groups:
+                if key is request.key:
+                    requests.append(request)
+                    break
+            else:
+                groups.append((request.key, [request]))
+        return groups
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            batch = [request for request in batch if not request.future.cancelled()]
+            if not batch:
+                continue
+            for key, requests in self._groups(batch):
+                await self._run_group(key, requests)
+
+    async def _run_group(self, key, batch):
+        items = [item for request in batch for item in request.items]
+        started = time.perf_counter()
+        try:
+            if self.run_group is None:
+                results = await self._loop.run_in_executor(self.executor, self.batch_fn, items)
+            else:
+                results = await self._loop.run_in_executor(self.executor, self.run_group, key, self.batch_fn, items)
+        except Exception as e:
+            self._errors += 1
+            logger.error(f'{self.name} batch of {len(items)} failed: {e}')
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        self._record(len(items), len(batch), sum(started - request.enqueued for request in batch), finished - started)
+        offset = 0
+        for request in batch:
+            count = len(request.items)
+            if not request.future.done():
+                request.future.set_result(list(results[offset:offset + count]))
+            offset += count
+
+    def _record(self, size, requests, wait, run):
+        self._batches += 1
+        self._items += size
+        self._requests += requests
+        self._wait_total += wait
+        self._run_total += run
+        self._histogram[bisect.bisect_left(BATCH_SIZE_BUCKETS, size)] += 1
+
+    def stats(self):
+        '''Return queue depth, batch-size histogram and timing totals.
+
+        Returns:
+            dict: Scheduler statistics.
+        '''
+        labels = [str(bound) for bound in BATCH_SIZE_BUCKETS] + ['+Inf']
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queued_items,
+            'batches': self._batches,
+            'items': self._items,
+            'requests': self._requests,
+            'errors': self._errors,
+            'mean_batch_size': self._items / self._batches if self._batches else 0.0,
+            'mean_queue_wait_ms': self._wait_total / self._requests * 1000 if self._requests else 0.0,
+            'mean_batch_run_ms': self._run_total / self._batches * 1000 if self._batches else 0.0,
+            'batch_size_histogram': dict(zip(labels, self._histogram)),
+        }
@@ -0,0 +1,441 @@
+'''Reproducible end-to-end benchmark of the prediction pipeline with small stand-in models.
+
+Builds a synthetic symptom vocabulary, a tiny randomly initialised BERT, a blank
+spaCy English tokenizer and a quickly trained TabNet in a temporary data
+directory, so it runs on a CPU-only box without network access. Measures
+per-function and /predict latency percentiles, throughput at several
+concurrency levels against the in-process FastAPI app, per-stage breakdowns and
+peak RSS, and writes them to JSON for comparison between commits.
+
+    python benchmark.py -o results.json
+    python benchmark.py -o new.json --compare results.json
+    python benchmark.py --batch-check
+'''
+
+import numpy as np
+import pandas as pd
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import os
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WORDS = [
+    'abdominal', 'ache', 'acute', 'back', 'bleeding', 'blurred', 'breathing', 'burning', 'chest', 'chills', 'chronic',
+    'cough', 'cramps', 'difficulty', 'discharge', 'dizziness', 'dry', 'ear', 'eye', 'fatigue', 'fever', 'headache',
+    'hearing', 'heart', 'itching', 'joint', 'knee', 'leg', 'loss', 'muscle', 'nasal', 'nausea', 'neck', 'numbness',
+    'pain', 'palpitations', 'rash', 'redness', 'runny', 'shortness', 'skin', 'sleep', 'sore', 'spasms', 'stiffness',
+    'stomach', 'swelling', 'sweating', 'throat', 'tingling', 'urination', 'vision', 'vomiting', 'weakness', 'weight',
+    'wheezing',
+]
+FILLERS = ['i', 'have', 'and', 'with', 'a', 'bad', 'since', 'yesterday', 'some', 'my', 'is', 'feel', 'really']
+SPECIAL_TOKENS = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]']
+PERCENTILES = (50, 95, 99)
+# Stand-in BERT (hidden size, layers, intermediate size); base has BioBERT-base's shape and compute cost
+BERT_SIZES = {'tiny': (64, 2, 128), 'base': (768, 12, 3072)}
+
+
+def make_vocabulary(n_symptoms, n_diseases, seed=0):
+    '''Synthetic symptom names, disease names and one symptom set per disease.'''
+    rng = np.random.default_rng(seed)
+    pairs = [f'{a} {b}' for i, a in enumerate(WORDS) for b in WORDS[i + 1:]]
+    symptoms = [pairs[i].capitalize() for i in rng.choice(len(pairs), n_symptoms, replace=False)]
+    diseases = [f'condition {i}' for i in range(n_diseases)]
+    X = np.zeros((n_diseases, n_symptoms), dtype=np.int8)
+    for row in range(n_diseases):
+        X[row, rng.choice(n_symptoms, rng.integers(3, 9), replace=False)] = 1
+    return symptoms, diseases, X
+
+
+def make_queries(symptoms, X, n, seed=1):
+    '''Free-text queries mentioning 1-4 symptoms of a random disease.'''
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(n):
+        present = np.flatnonzero(X[rng.integers(len(X))])
+        chosen = [symptoms[i].lower() for i in rng.choice(present, min(len(present), rng.integers(1, 5)), replace=False)]
+        queries.append(f"{' '.join(rng.choice(FILLERS, 2))} {' and '.join(chosen)}")
+    return queries
+
+
+def build_stand_in_bert(data_dir, size='tiny'):
+    '''Randomly initialised BERT of one of BERT_SIZES with a word-level vocabulary covering the benchmark text.'''
+    import torch
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    torch.manual_seed(0)
+    vocab_path = os.path.join(data_dir, 'vocab.txt')
+    with open(vocab_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(SPECIAL_TOKENS + WORDS + FILLERS) + '\n')
+    tokenizer = BertTokenizerFast(vocab_file=vocab_path)
+    hidden_size, layers, intermediate_size = BERT_SIZES[size]
+    config = BertConfig(vocab_size=tokenizer.vocab_size, hidden_size=hidden_size, num_hidden_layers=layers,
+                        num_attention_heads=max(2, hidden_size // 64), intermediate_size=intermediate_size)
+    model = BertModel(config).eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    return tokenizer, model
+
+
+def build_stand_in_tabnet(X, data_dir, epochs=5):
+    '''TabNet trained for a few epochs on augmented copies of the disease rows.'''
+    from pytorch_tabnet.tab_model import TabNetClassifier
+    from preprocess import augment_matrix
+    rows = np.vstack([X != 0, augment_matrix(X, multiplier=20)]).astype(np.float32)
+    labels = np.concatenate([np.arange(len(X)), np.repeat(np.arange(len(X)), 20)])
+    model = TabNetClassifier(n_d=8, n_a=8, n_steps=3, seed=0, verbose=0)
+    model.fit(rows, labels, max_epochs=epochs, batch_size=256, virtual_batch_size=128)
+    return model.save_model(os.path.join(data_dir, 'tabnet_model'))
+
+
+def setup(data_dir, n_symptoms, n_diseases, use_caches, bert_size='tiny', prepared=False):
+    '''Write the stand-in artifacts, point the service at them and return the loaded api module.
+
+    Args:
+        data_dir (str): Directory for the stand-in artifacts.
+        n_symptoms (int): Symptom vocabulary size.
+        n_diseases (int): Disease count.
+        use_caches (bool): Keep the embedding and result caches enabled.
+        bert_size (str): Stand-in BERT size, a key of BERT_SIZES.
+        prepared (bool): data_dir already holds artifacts written by an earlier setup with the same sizes.
+
+    Returns:
+        tuple: (api module, symptom names, disease-symptom matrix).
+    '''
+    os.environ['DATA_DIR'] = data_dir
+    os.environ['PRELOAD_MODELS'] = '0'
+    os.environ.setdefault('INFERENCE_EXECUTOR', 'thread')
+    if not use_caches:
+        os.environ['RESULT_CACHE_SIZE'] = '0'
+        os.environ['EMBEDDING_CACHE_SIZE'] = '0'
+    os.environ.pop('EMBEDDING_CACHE_DIR', None)
+    symptoms, diseases, X = make_vocabulary(n_symptoms, n_diseases)
+
+    import biobert_utils
+    # Seeded, so every process rebuilds the same stand-in BERT
+    biobert_utils.registry.install(*build_stand_in_bert(data_dir, bert_size))
+    if not prepared:
+        np.save(os.path.join(data_dir, 'symptom_embeddings.npy'), biobert_utils.get_embeddings(symptoms, use_cache=False))
+        with open(os.path.join(data_dir, 'metadata.json'), 'w', encoding='utf-8') as f:
+            json.dump({'symptoms': symptoms, 'diseases': diseases}, f)
+        build_stand_in_tabnet(X, data_dir)
+        pd.DataFrame({'disease': diseases, 'description': [f'A condition numbered {i}. It is synthetic.' for i in range(n_diseases)],
+                      'fetched_at': time.time()}).to_csv(os.path.join(data_dir, 'pubmed_medical_info.csv'), index=False)
+
+    import spacy
+    import startup
+    import symptom_matching
+    symptom_matching.get_nlp.artifact.set(spacy.blank('en'))
+    import api
+    if not startup.load_all():
+        raise RuntimeError(f'Stand-in artifacts failed to load: {startup.status()}')
+    return api, symptoms, X
+
+
+def summarize(latencies):
+    '''Count, mean and percentile latencies in milliseconds.'''
+    latencies = np.asarray(latencies) * 1000
+    summary = {'count': int(len(latencies)), 'mean_ms': float(latencies.mean())}
+    summary.update({f'p{p}_ms': float(np.percentile(latencies, p)) for p in PERCENTILES})
+    return summary
+
+
+def bench_functions(queries, repeat):
+    '''Latency of the pipeline functions called directly.'''
+    from symptom_matching import match_symptoms, normalize_user_input
+    from biobert_utils import get_embedding
+    from tabnet_model import retrieve_top_diseases
+    terms = [normalize_user_input(query)[0] for query in queries]
+    matched = [match_symptoms(query, as_indices=True) for query in queries]
+    cases = {
+        'match_symptoms': lambda i: match_symptoms(queries[i], as_indices=True),
+        'get_embedding': lambda i: get_embedding(terms[i]),
+        'retrieve_top_diseases': lambda i: retrieve_top_diseases(matched[i]),
+    }
+    results = {}
+    for name, call in cases.items():
+        latencies = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            call(i % len(queries))
+            latencies.append(time.perf_counter() - start)
+        results[name] = summarize(latencies)
+    return results
+
+
+async def _post(client, query):
+    start = time.perf_counter()
+    response = await client.post('/predict', json={'symptoms': query})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def drive_http(app, queries, concurrency, n_requests, before_start=None):
+    '''Send n_requests /predict calls from concurrent in-process clients.
+
+    Args:
+        app: ASGI app.
+        queries (list of str): Symptom strings, cycled through.
+        concurrency (int): Concurrent clients.
+        n_requests (int): Timed requests.
+        before_start (callable, optional): Called after the warm-up request, right before timing starts.
+
+    Returns:
+        tuple: (per-request latencies in seconds, elapsed seconds).
+    '''
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://benchmark', timeout=60) as client:
+        await _post(client, queries[0])
+        if before_start is not None:
+            before_start()
+        latencies = []
+        next_request = iter(range(n_requests))
+
+        async def worker():
+            for i in next_request:
+                latencies.append(await _post(client, queries[i % len(queries)]))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, elapsed
+
+
+async def bench_http(app, queries, concurrency, n_requests):
+    '''Drive /predict with concurrent in-process clients and report latency and throughput.'''
+    latencies, elapsed = await drive_http(app, queries, concurrency, n_requests)
+    summary = summarize(latencies)
+    summary.update({'concurrency': concurrency, 'seconds': elapsed, 'requests_per_sec': n_requests / elapsed})
+    return summary
+
+
+async def _dropped_batch_request(app, body):
+    '''Call /predict/batch directly with a client that is gone by the time the response starts.'''
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        raise OSError('client disconnected')
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0', 'spec_version': '2.3'}, 'http_version': '1.1',
+             'method': 'POST', 'scheme': 'http', 'path': '/predict/batch', 'raw_path': b'/predict/batch',
+             'query_string': b'', 'root_path': '', 'headers': [(b'content-length', str(len(body)).encode('ascii'))],
+             'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80)}
+    try:
+        await app(scope, receive, send)
+    except OSError:
+        pass
+
+
+def check_batch_endpoint(app, queries, n_chunks=20, chunk_bytes=64 * 1024, timeout=60, pending=None):
+    '''Post a multi-chunk JSONL body to /predict/batch on a real uvicorn server and check every row is scored.
+
+    The in-process transport used by the benchmarks hands the body over in one
+    piece, so only a real server shows whether body chunks get lost while the
+    response streams.
+
+    Args:
+        app: ASGI app.
+        queries (list of str): Symptom strings, cycled through.
+        n_chunks (int): Body chunks sent. Defaults to 20.
+        chunk_bytes (int): Approximate size of each chunk. Defaults to 64 KiB.
+        timeout (float): Client timeout in seconds.
+        pending (callable, optional): Returns the admitted inference requests, which must drop back to 0 after
+            the request and after a request whose client is gone before the response starts.
+
+    Returns:
+        list: Problems found, empty if every row came back once and in order.
+    '''
+    import socket
+    import threading
+    import httpx
+    import uvicorn
+
+    chunks, rows = [], 0
+    for _ in range(n_chunks):
+        chunk = b''
+        while len(chunk) < chunk_bytes:
+            chunk += (json.dumps({'id': rows, 'symptoms': queries[rows % len(queries)]}) + '\n').encode('utf-8')
+            rows += 1
+        chunks.append(chunk)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(app, lifespan='off', log_level='warning'))
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    problems = []
+    try:
+        while not server.started:
+            if not thread.is_alive():
+                return ['uvicorn did not start']
+            time.sleep(0.05)
+        url = f'http://127.0.0.1:{sock.getsockname()[1]}/predict/batch'
+        # A generator body is sent with chunked transfer encoding, one chunk at a time
+        response = httpx.post(url, content=iter(chunks), timeout=timeout)
+        if response.status_code != 200:
+            return [f'/predict/batch answered {response.status_code}: {response.text[:200]}']
+        lines = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+        results, summary = lines[:-1], lines[-1].get('summary', {})
+        ids = [result.get('id') for result in results]
+        if ids != list(range(rows)):
+            problems.append(f'{len(ids)} results for {rows} rows, first mismatch at '
+                            f'{next((i for i, (a, b) in enumerate(zip(ids, range(rows))) if a != b), min(len(ids), rows))}')
+        if summary.get('rows') != rows:
+            problems.append(f"summary counts {summary.get('rows')} rows, {rows} were sent")
+        errors = [result for result in results if 'error' in result]
+        if errors:
+            problems.append(f'{len(errors)} rows failed, e.g. {errors[0]}')
+        if pending is not None:
+            # Straight to the router: without middleware in between, the body generator never starts
+            asyncio.run(_dropped_batch_request(app.router, chunks[0]))
+            if pending():
+                problems.append(f'{pending()} inference slots still held after the requests ended')
+    except httpx.HTTPError as e:
+        problems.append(f'/predict/batch request failed: {e!r}')
+    finally:
+        server.should_exit = True
+        thread.join(10)
+    return problems
+
+
+def run_batch_check(n_symptoms=300, n_diseases=40):
+    '''Set up the stand-in models and run check_batch_endpoint against them.'''
+    with tempfile.TemporaryDirectory(prefix='seekhealer-bench-') as data_dir:
+        api, symptoms, X = setup(data_dir, n_symptoms, n_diseases, use_caches=False)
+        try:
+            return check_batch_endpoint(api.app, make_queries(symptoms, X, 200), pending=lambda: api.inference.pending)
+        finally:
+            api.inference.shutdown()
+
+
+def run_benchmark(n_symptoms=300, n_diseases=40, n_requests=200, concurrency=(1, 4, 16), repeat=200, use_caches=False,
+                  bert_size='tiny'):
+    '''Run every benchmark and return the results as a JSON-serializable dict.'''
+    from metrics import stage_timer
+    from preprocess import peak_rss_mb
+    with tempfile.TemporaryDirectory(prefix='seekhealer-bench-') as data_dir:
+        start = time.perf_counter()
+        api, symptoms, X = setup(data_dir, n_symptoms, n_diseases, use_caches, bert_size=bert_size)
+        setup_seconds = time.perf_counter() - start
+        embedding_backend = api.model_status()['backend']
+        queries = make_queries(symptoms, X, max(n_requests, repeat))
+
+        stage_timer.clear()
+        results = {'functions': bench_functions(queries, repeat), 'function_stages': stage_timer.stats(), 'http': {}}
+        for clients in concurrency:
+            stage_timer.clear()
+            http = asyncio.run(bench_http(api.app, queries, clients, n_requests))
+            http['stages'] = stage_timer.stats()
+            results['http'][str(clients)] = http
+            logger.info(f"{clients:>3} clients: p50={http['p50_ms']:.1f}ms p95={http['p95_ms']:.1f}ms "
+                        f"p99={http['p99_ms']:.1f}ms {http['requests_per_sec']:.1f} req/s")
+        api.inference.shutdown()
+    results['peak_rss_mb'] = peak_rss_mb()
+    results['meta'] = {
+        'commit': _git_commit(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'setup_seconds': setup_seconds,
+        'config': {'n_symptoms': n_symptoms, 'n_diseases': n_diseases, 'n_requests': n_requests,
+                   'concurrency': list(concurrency), 'repeat': repeat, 'use_caches': use_caches,
+                   'bert_size': bert_size, 'embedding_backend': embedding_backend},
+    }
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline, tolerance=0.10):
+    '''Compare two result files; latencies may grow and throughput drop by at most ``tolerance``.
+
+    Args:
+        current (dict): New results.
+        baseline (dict): Reference results.
+        tolerance (float): Allowed relative regression. Defaults to 0.10.
+
+    Returns:
+        list: (metric, baseline, current, ratio, regressed) rows.
+    '''
+    rows = []
+
+    def add(metric, old, new, higher_is_better=False):
+        if old is None or new is None or not old:
+            return
+        ratio = new / old
+        regressed = ratio < 1 - tolerance if higher_is_better else ratio > 1 + tolerance
+        rows.append((metric, old, new, ratio, regressed))
+
+    for name, summary in current.get('functions', {}).items():
+        for key in ('p50_ms', 'p95_ms'):
+            add(f'{name}.{key}', baseline.get('functions', {}).get(name, {}).get(key), summary[key])
+    for clients, summary in current.get('http', {}).items():
+        old = baseline.get('http', {}).get(clients, {})
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            add(f'http[{clients}].{key}', old.get(key), summary[key])
+        add(f'http[{clients}].requests_per_sec', old.get('requests_per_sec'), summary['requests_per_sec'],
+            higher_is_better=True)
+    add('peak_rss_mb', baseline.get('peak_rss_mb'), current.get('peak_rss_mb'))
+    return rows
+
+
+def main(argv=None):
+    '''Command-line entry point.'''
+    parser = argparse.ArgumentParser(description='Benchmark the prediction pipeline with stand-in models.')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='Result JSON path')
+    parser.add_argument('--symptoms', type=int, default=300, help='Stand-in symptom vocabulary size')
+    parser.add_argument('--diseases', type=int, default=40, help='Stand-in disease count')
+    parser.add_argument('--requests', type=int, default=200, help='/predict requests per concurrency level')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='Concurrent clients to test')
+    parser.add_argument('--repeat', type=int, default=200, help='Calls per function benchmark')
+    parser.add_argument('--bert-size', choices=sorted(BERT_SIZES), default='tiny', help='Stand-in BERT size')
+    parser.add_argument('--with-caches', action='store_true', help='Keep the embedding and result caches enabled')
+    parser.add_argument('--compare', help='Baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative regression for --compare')
+    parser.add_argument('--batch-check', action='store_true',
+                        help='Only check /predict/batch with a multi-chunk body on a real uvicorn server, exit 1 on failure')
+    args = parser.parse_args(argv)
+
+    if args.batch_check:
+        problems = run_batch_check(n_symptoms=args.symptoms, n_diseases=args.diseases)
+        for problem in problems:
+            logger.error(problem)
+        logger.info('Batch check failed' if problems else 'Batch check passed')
+        sys.exit(1 if problems else 0)
+
+    results = run_benchmark(n_symptoms=args.symptoms, n_diseases=args.diseases, n_requests=args.requests,
+                            concurrency=args.concurrency, repeat=args.repeat, use_caches=args.with_caches,
+                            bert_size=args.bert_size)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Wrote {args.output} (peak RSS {results['peak_rss_mb']:.0f} MB)")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, tolerance=args.tolerance)
+        for metric, old, new, ratio, regressed in rows:
+            logger.info(f"{metric:<40} {old:>10.2f} -> {new:>10.2f}  x{ratio:.2f}{'  REGRESSED' if regressed else ''}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,34 +2,210 @@
 
 import numpy as np
 from transformers import AutoTokenizer, AutoModel
-import torch
 import os
+import time
+import threading
 import logging
 from huggingface_hub import login
+from embedding_cache import EmbeddingCache, make_key
+from embedding_backends import TorchBackend, make_backend, check_backend, passes
+from artifacts import DATA_DIR, SYMPTOM_EMBEDDINGS_PATH, get_bundle
+from startup import artifact
+from metrics import stage_timer
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Authenticate with Hugging Face token
+MODEL_NAME = 'dmis-lab/biobert-base-cased-v1.1'
+
 HF_TOKEN = os.getenv("HF_TOKEN")
-if HF_TOKEN:
-    login(HF_TOKEN)
-else:
-    logger.warning("HF_TOKEN not set. Model loading may fail.")
+
+# torch (default), torch-int8, onnx or onnx-int8; a backend failing its accuracy check falls back to torch
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')
+ONNX_DIR = os.getenv('EMBEDDING_ONNX_DIR', os.path.join(DATA_DIR, 'onnx'))
+
+
+def _hf_login():
+    '''Authenticate with Hugging Face token before the first download.'''
+    if HF_TOKEN:
+        login(HF_TOKEN)
+    else:
+        logger.warning("HF_TOKEN not set. Model loading may fail.")
+
+
+@artifact('symptom_embeddings', paths=(SYMPTOM_EMBEDDINGS_PATH,))
+def get_symptom_embeddings():
+    """Precomputed BioBERT embeddings of the dataset symptom names, memory-mapped from the bundle when present."""
+    bundle = get_bundle()
+    if bundle is not None:
+        if bundle.header.get('embedding_model') not in (None, MODEL_NAME):
+            raise RuntimeError(f"Bundle embeddings come from {bundle.header['embedding_model']}, not {MODEL_NAME}")
+        return bundle.embeddings
+    try:
+        return np.load(SYMPTOM_EMBEDDINGS_PATH)
+    except Exception as e:
+        raise RuntimeError(f"Error loading symptom_embeddings.npy: {e}")
+
+
+def _check_symptoms():
+    '''Symptom embeddings for the backend check, None if they cannot be loaded.'''
+    try:
+        return get_symptom_embeddings()
+    except Exception as e:
+        logger.warning(f'Backend check without symptom matching: {e}')
+        return None
+
+
+class ModelRegistry:
+    """Process-wide holder for the BioBERT tokenizer and model.
+
+    The model is loaded once (on first use or explicitly at startup), switched
+    to eval mode and shared by every request. Loading is guarded by a lock so
+    concurrent first requests do not load it twice; tokenization is also
+    serialized because the fast tokenizer mutates its padding/truncation state.
+
+    Forward passes go through an embedding backend (see embedding_backends). A
+    backend other than torch is checked against the FP32 model on a fixed term
+    set when it is built and replaced by torch if it drifts too far.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, backend=EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.backend_name = backend
+        self.tokenizer = None
+        self.model = None
+        self.backend = None
+        self.backend_check = None
+        self.load_time = None
+        self.loaded_at = None
+        self.error = None
+        self._load_lock = threading.Lock()
+        self._tokenizer_lock = threading.Lock()
+
+    @property
+    def is_warm(self):
+        return self.backend is not None
+
+    @property
+    def cache_namespace(self):
+        '''Model identity used in embedding cache keys; non-default backends get their own entries.'''
+        name = self.backend.name if self.backend is not None else self.backend_name
+        return self.model_name if name == 'torch' else f'{self.model_name}@{name}'
+
+    def load(self):
+        """Load tokenizer and model if not loaded yet.
+
+        Returns:
+            ModelRegistry: The warm registry.
+
+        Raises:
+            RuntimeError: If loading fails.
+        """
+        if self.backend is not None:
+            return self
+        with self._load_lock:
+            if self.backend is not None:
+                return self
+            start = time.perf_counter()
+            try:
+                _hf_login()
+                tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                model = AutoModel.from_pretrained(self.model_name)
+                model.eval()
+                for param in model.parameters():
+                    param.requires_grad_(False)
+            except Exception as e:
+                self.error = str(e)
+                raise RuntimeError(f'BioBERT loading failed: {e}')
+            self.install(tokenizer, model)
+            self.load_time = time.perf_counter() - start
+            logger.info(f"Loaded {self.model_name} ({self.backend.name}) in {self.load_time:.2f}s")
+        return self
+
+    def install(self, tokenizer, model):
+        """Build the configured backend for a loaded tokenizer and FP32 model and publish it.
+
+        Args:
+            tokenizer: Tokenizer matching the model.
+            model (torch.nn.Module): FP32 model in eval mode.
+        """
+        reference = TorchBackend(model)
+        backend = reference
+        if self.backend_name != 'torch':
+            try:
+                candidate = make_backend(self.backend_name, model, tokenizer, ONNX_DIR)
+                self.backend_check = check_backend(reference, candidate, tokenizer, symptom_embeddings=_check_symptoms())
+                if passes(self.backend_check):
+                    backend = candidate
+                else:
+                    logger.warning(f'{self.backend_name} embeddings drift from FP32 ({self.backend_check}), using torch')
+            except Exception as e:
+                logger.warning(f'{self.backend_name} embedding backend unavailable, using torch: {e}')
+        self.tokenizer = tokenizer
+        # The FP32 weights are only kept while they are what runs
+        self.model = model if backend is reference else None
+        self.error = None
+        self.loaded_at = time.time()
+        # Publish the backend last, it is what is_warm checks
+        self.backend = backend
+
+    def encode(self, texts, max_length=128):
+        """Return [CLS] embeddings for a string or a list of strings."""
+        self.load()
+        with self._tokenizer_lock, stage_timer.time('biobert_tokenize'):
+            inputs = self.tokenizer(texts, return_tensors="pt", truncation=True, padding=True, max_length=max_length)
+        with stage_timer.time('biobert_forward'):
+            return self.backend(inputs)
+
+    def status(self):
+        """Report load state for readiness probes.
+
+        Returns:
+            dict: Model name, state (cold, warm or failed), load time in seconds and load timestamp.
+        """
+        if self.is_warm:
+            state = 'warm'
+        elif self.error:
+            state = 'failed'
+        else:
+            state = 'cold'
+        return {
+            'model': self.model_name,
+            'backend': self.backend.name if self.backend is not None else self.backend_name,
+            'backend_check': self.backend_check,
+            'state': state,
+            'load_time_s': self.load_time,
+            'loaded_at': self.loaded_at,
+            'error': self.error,
+        }
 
 
-try:
-    symptom_embeddings = np.load(os.path.join('data', 'symptom_embeddings.npy'))
-except Exception as e:
-    logger.error(f"Error loading symptom_embeddings.npy: {e}")
-    symptom_embeddings = None
-    logger.warning("symptom_embeddings not loaded. Some functionality may be limited.")
-    
+registry = ModelRegistry()
+
+# Term embeddings are cached by (term, model, max_length); EMBEDDING_CACHE_DIR adds a
+# memory-mapped disk store that survives restarts and can be shared by workers
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv('EMBEDDING_CACHE_SIZE', 4096)),
+    disk_dir=os.getenv('EMBEDDING_CACHE_DIR') or None,
+    readonly=os.getenv('EMBEDDING_CACHE_READONLY', '0') == '1',
+)
+
+
+@artifact('biobert')
+def load_model():
+    """Load BioBERT into the shared registry (safe to call repeatedly)."""
+    return registry.load()
+
+
+def model_status():
+    """Return the BioBERT registry status."""
+    return registry.status()
+
 
 def get_embedding(text, max_length=128):
     """Getting BioBert embedding for text (user input).
-    
+
     Args:
         text (str): Input text for embedding.
         max_length (int): Maximum token length. Defaults to 128.
@@ -43,12 +219,67 @@ def get_embedding(text, max_length=128):
     if not text or not isinstance(text, str):
         raise ValueError(f'Text must be a non-empty string')
     try:
-        tokenizer = AutoTokenizer.from_pretrained('dmis-lab/biobert-base-cased-v1.1')
-        model_emb = AutoModel.from_pretrained('dmis-lab/biobert-base-cased-v1.1')
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=max_length)
-        with torch.no_grad():
-            outputs = model_emb(**inputs)
-        # Use [CLS] token embedding
-        return outputs.last_hidden_state[:, 0, :].squeeze().numpy()
+        return get_embeddings([text], max_length=max_length)[0]
     except Exception as e:
-        raise RuntimeError(f'Embedding generation failed: {e}')
\ No newline at end of file
+        raise RuntimeError(f'Embedding generation failed: {e}')
+
+
+def get_embeddings(texts, max_length=128, batch_size=64, use_cache=True):
+    """Getting BioBert embeddings for several texts in batched forward passes.
+
+    Cached terms are served from the embedding cache; only the misses are encoded.
+
+    Args:
+        texts (list of str): Input texts for embedding.
+        max_length (int): Maximum token length. Defaults to 128.
+        batch_size (int): Texts per forward pass. Defaults to 64.
+        use_cache (bool): Read and fill the embedding cache. Defaults to True.
+
+    Returns:
+        np.ndarray: Embedding matrix with one row per text.
+
+    Raises:
+        ValueError: If texts is empty or contains invalid entries.
+    """
+    if not texts or not all(text and isinstance(text, str) for text in texts):
+        raise ValueError('Texts must be a non-empty list of non-empty strings')
+    try:
+        texts = list(texts)
+        vectors = {}
+        if use_cache:
+            # The namespace names the backend actually installed, which is only known once it has loaded
+            # (a backend that falls back to torch must not serve or store vectors under its own name)
+            load_model()
+            keys = {text: make_key(text, registry.cache_namespace, max_length) for text in texts}
+            for text, key in keys.items():
+                vector = embedding_cache.get(key)
+                if vector is not None:
+                    vectors[text] = vector
+        missing = [text for text in dict.fromkeys(texts) if text not in vectors]
+        if missing and not use_cache:
+            load_model()
+        # Use [CLS] token embedding, padded per batch
+        for i in range(0, len(missing), batch_size):
+            chunk = missing[i:i + batch_size]
+            for text, vector in zip(chunk, registry.encode(chunk, max_length=max_length)):
+                vectors[text] = vector
+                if use_cache:
+                    embedding_cache.put(keys[text], vector)
+        return np.stack([vectors[text] for text in texts])
+    except Exception as e:
+        raise RuntimeError(f'Embedding generation failed: {e}')
+
+
+def get_embedding_rows(terms):
+    """Embed terms gathered from several requests in one pass, one row per term.
+
+    Args:
+        terms (list of str): Terms, possibly repeated.
+
+    Returns:
+        list: Embedding vector for each term, in order.
+    """
+    # Terms repeated across requests share one row of the forward pass
+    unique_terms = list(dict.fromkeys(terms))
+    rows = dict(zip(unique_terms, get_embeddings(unique_terms, batch_size=max(len(unique_terms), 1))))
+    return [rows[term] for term in terms]
@@ -0,0 +1,140 @@
+'''Build symptom_embeddings.npy from the dataset symptom names, re-embedding only what changed.'''
+
+import numpy as np
+import argparse
+import json
+import sys
+import os
+import logging
+from artifacts import AUG_DF_PATH, SYMPTOM_EMBEDDINGS_PATH, read_dataset_metadata_csv
+from biobert_utils import MODEL_NAME, ModelRegistry, registry
+from embedding_cache import make_key
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MANIFEST_PATH = os.path.splitext(SYMPTOM_EMBEDDINGS_PATH)[0] + '.manifest.json'
+
+
+def read_manifest(path=MANIFEST_PATH):
+    '''Return the manifest of an existing embedding matrix, or None if there is none.'''
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_alignment(symptoms_col, embeddings, manifest, model_name=MODEL_NAME, max_length=128):
+    '''List the reasons an embedding matrix does not line up with the symptom columns.
+
+    Args:
+        symptoms_col (list of str): Symptom names in model input order.
+        embeddings (np.ndarray): Embedding matrix.
+        manifest (dict, optional): Manifest written alongside the matrix.
+        model_name (str): Expected embedding model.
+        max_length (int): Expected tokenizer max length.
+
+    Returns:
+        list: Problems found, empty if the matrix is aligned.
+    '''
+    problems = []
+    if len(embeddings) != len(symptoms_col):
+        problems.append(f'{len(embeddings)} embedding rows for {len(symptoms_col)} symptoms')
+    if manifest is None:
+        problems.append('no manifest')
+        return problems
+    keys = [make_key(name, model_name, max_length) for name in symptoms_col]
+    if manifest['keys'] != keys:
+        changed = sum(a != b for a, b in zip(manifest['keys'], keys)) + abs(len(manifest['keys']) - len(keys))
+        problems.append(f'{changed} rows differ from the manifest (renamed, added, removed or other model)')
+    if len(manifest['keys']) != len(embeddings):
+        problems.append(f"manifest lists {len(manifest['keys'])} rows, matrix has {len(embeddings)}")
+    return problems
+
+
+def build_embeddings(symptoms_col, output=SYMPTOM_EMBEDDINGS_PATH, manifest_path=MANIFEST_PATH, max_length=128,
+                     batch_size=64, full=False):
+    '''Write the embedding matrix aligned to symptoms_col, reusing rows whose names did not change.
+
+    Every row is keyed by a hash of (symptom name, model, max_length) and the keys
+    are stored in a manifest next to the matrix. On rebuild, rows whose key is
+    already in the previous manifest are copied over and only new or renamed
+    symptoms go through BioBERT, in batches, with the same [CLS] embedding as
+    get_embedding. Rows are always embedded with the FP32 torch backend, whatever
+    EMBEDDING_BACKEND is set to, since the matrix is keyed by the model alone.
+    Both files are written to temporary names and renamed.
+
+    Args:
+        symptoms_col (list of str): Symptom names in model input order.
+        output (str): Path of the .npy matrix.
+        manifest_path (str): Path of the manifest.
+        max_length (int): Tokenizer max length. Defaults to 128.
+        batch_size (int): Names per forward pass. Defaults to 64.
+        full (bool): Ignore the previous matrix and re-embed everything.
+
+    Returns:
+        dict: Rows written, reused and embedded.
+
+    Raises:
+        RuntimeError: If the built matrix does not line up with symptoms_col.
+    '''
+    symptoms_col = [str(name) for name in symptoms_col]
+    keys = [make_key(name, MODEL_NAME, max_length) for name in symptoms_col]
+    old, previous = None, {}
+    manifest = None if full else read_manifest(manifest_path)
+    if manifest is not None and os.path.exists(output):
+        old = np.load(output, mmap_mode='r')
+        if len(old) == len(manifest['keys']):
+            previous = {key: row for row, key in enumerate(manifest['keys'])}
+        else:
+            logger.warning(f"{output} has {len(old)} rows but its manifest {len(manifest['keys'])}, rebuilding everything")
+    elif not full and os.path.exists(output):
+        logger.warning(f'No manifest for {output}, rebuilding everything')
+
+    missing = list(dict.fromkeys(name for name, key in zip(symptoms_col, keys) if key not in previous))
+    new_rows = {}
+    if missing:
+        logger.info(f'Embedding {len(missing)} of {len(symptoms_col)} symptoms')
+        encoder = registry if registry.backend_name == 'torch' else ModelRegistry(backend='torch')
+        vectors = np.vstack([encoder.encode(missing[i:i + batch_size], max_length=max_length)
+                             for i in range(0, len(missing), batch_size)])
+        new_rows = dict(zip(missing, vectors))
+    rows = [np.asarray(old[previous[key]]) if key in previous else new_rows[name] for name, key in zip(symptoms_col, keys)]
+    embeddings = np.vstack(rows).astype(np.float32)
+
+    problems = check_alignment(symptoms_col, embeddings, {'keys': keys}, max_length=max_length)
+    if problems or not np.isfinite(embeddings).all():
+        raise RuntimeError(f"Built embeddings failed validation: {problems or ['non-finite values']}")
+
+    tmp_output = f'{output}.tmp'
+    with open(tmp_output, 'wb') as f:
+        np.save(f, embeddings)
+    tmp_manifest = f'{manifest_path}.tmp'
+    with open(tmp_manifest, 'w', encoding='utf-8') as f:
+        json.dump({'model': MODEL_NAME, 'backend': 'torch', 'max_length': max_length, 'dim': int(embeddings.shape[1]),
+                   'symptoms': symptoms_col, 'keys': keys}, f)
+    os.replace(tmp_output, output)
+    os.replace(tmp_manifest, manifest_path)
+    return {'rows': len(embeddings), 'reused': len(symptoms_col) - len(missing), 'embedded': len(missing)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build symptom_embeddings.npy from the aug_df.csv symptom columns.')
+    parser.add_argument('--source', default=AUG_DF_PATH, help='Dataset whose columns are the symptoms')
+    parser.add_argument('--output', default=SYMPTOM_EMBEDDINGS_PATH)
+    parser.add_argument('--manifest', default=None, help='Manifest path (defaults to <output>.manifest.json)')
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--full', action='store_true', help='Re-embed every symptom')
+    parser.add_argument('--check', action='store_true', help='Only check the existing matrix, exit 1 if it is stale')
+    args = parser.parse_args()
+    manifest_path = args.manifest or os.path.splitext(args.output)[0] + '.manifest.json'
+
+    symptoms_col = list(read_dataset_metadata_csv(args.source).symptoms_col)
+    if args.check:
+        problems = check_alignment(symptoms_col, np.load(args.output, mmap_mode='r'), read_manifest(manifest_path))
+        for problem in problems:
+            logger.error(problem)
+        sys.exit(1 if problems else 0)
+    result = build_embeddings(symptoms_col, output=args.output, manifest_path=manifest_path, batch_size=args.batch_size,
+                              full=args.full)
+    logger.info(f"Wrote {result['rows']} rows to {args.output} ({result['reused']} reused, {result['embedded']} embedded)")
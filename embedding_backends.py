@@ -0,0 +1,194 @@
+'''Interchangeable BioBERT [CLS] embedding backends for CPU inference.
+
+- ``torch``: the FP32 PyTorch model (default).
+- ``torch-int8``: PyTorch dynamic quantization of the Linear layers to int8.
+- ``onnx``: the model exported once to ONNX and run with ONNX Runtime.
+- ``onnx-int8``: the ONNX export with ONNX Runtime dynamic int8 quantization.
+
+Every backend takes the tokenizer's PyTorch tensors and returns the [CLS] rows
+as a float32 array. A non-default backend is only used after it passes
+check_backend against the FP32 model.
+'''
+
+import numpy as np
+import torch
+import argparse
+import json
+import os
+import logging
+from symptom_index import l2_normalize
+
+try:
+    import onnxruntime
+except ImportError:  # Optional, only needed for the onnx backends (pip install onnx onnxruntime)
+    onnxruntime = None
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'torch-int8', 'onnx', 'onnx-int8')
+ONNX_INPUTS = ('input_ids', 'attention_mask', 'token_type_ids')
+
+# Fixed term set for the accuracy check: symptom phrases as users type them
+CHECK_TERMS = [
+    'fever', 'high fever', 'cough', 'dry cough', 'headache', 'severe headache', 'fatigue', 'nausea', 'vomiting',
+    'diarrhea', 'chest pain', 'shortness of breath', 'sore throat', 'runny nose', 'muscle pain', 'joint pain',
+    'back pain', 'abdominal pain', 'skin rash', 'itching', 'dizziness', 'blurred vision', 'chills', 'sweating',
+    'weight loss', 'loss of appetite', 'palpitations', 'swelling', 'burning urination', 'insomnia', 'anxiety',
+    'numbness', 'stiff neck', 'wheezing', 'constipation', 'bloody stool',
+]
+MIN_COSINE = 0.98
+MIN_MATCH_AGREEMENT = 0.95
+
+
+class TorchBackend:
+    '''[CLS] embeddings from a PyTorch model.'''
+
+    name = 'torch'
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, inputs):
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
+        return outputs.last_hidden_state[:, 0, :].numpy()
+
+
+class QuantizedTorchBackend(TorchBackend):
+    '''[CLS] embeddings from a copy of the model with int8 dynamically quantized Linear layers.'''
+
+    name = 'torch-int8'
+
+    def __init__(self, model):
+        super().__init__(torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8))
+
+
+class OnnxBackend:
+    '''[CLS] embeddings from an ONNX export of the model run with ONNX Runtime.
+
+    The export is written once to ``onnx_dir`` and reused on later starts.
+
+    Args:
+        model (torch.nn.Module): FP32 model to export if the file does not exist yet.
+        tokenizer: Tokenizer used to build the export's example inputs.
+        onnx_dir (str): Directory of the exported files.
+        quantize (bool): Use an int8 dynamically quantized copy of the export.
+
+    Raises:
+        RuntimeError: If onnxruntime is not installed.
+    '''
+
+    def __init__(self, model, tokenizer, onnx_dir, quantize=False):
+        if onnxruntime is None:
+            raise RuntimeError('The onnx backends need onnxruntime and onnx (pip install onnx onnxruntime)')
+        self.name = 'onnx-int8' if quantize else 'onnx'
+        path = export_onnx(model, tokenizer, os.path.join(onnx_dir, 'model.onnx'))
+        if quantize:
+            path = quantize_onnx(path, os.path.join(onnx_dir, 'model-int8.onnx'))
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [node.name for node in self.session.get_inputs()]
+
+    def __call__(self, inputs):
+        feed = {name: inputs[name].numpy() for name in self.input_names}
+        last_hidden_state = self.session.run(['last_hidden_state'], feed)[0]
+        return last_hidden_state[:, 0, :]
+
+
+def export_onnx(model, tokenizer, path):
+    '''Export the model to ONNX with dynamic batch and sequence axes, unless path already exists.'''
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    example = tokenizer(['fever', 'shortness of breath'], return_tensors='pt', padding=True)
+    names = [name for name in ONNX_INPUTS if name in example]
+    tmp_path = f'{path}.tmp'
+    with torch.inference_mode():
+        torch.onnx.export(
+            model, tuple(example[name] for name in names), tmp_path,
+            input_names=names, output_names=['last_hidden_state', 'pooler_output'],
+            dynamic_axes={name: {0: 'batch', 1: 'sequence'} for name in names + ['last_hidden_state']},
+            opset_version=17,
+        )
+    os.replace(tmp_path, path)
+    logger.info(f'Exported {path}')
+    return path
+
+
+def quantize_onnx(path, output):
+    '''Write an int8 dynamically quantized copy of an ONNX model, unless output already exists.'''
+    if not os.path.exists(output):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(path, output, weight_type=QuantType.QInt8)
+        logger.info(f'Quantized {output}')
+    return output
+
+
+def make_backend(name, model, tokenizer, onnx_dir):
+    '''Build an embedding backend by name.
+
+    Args:
+        name (str): One of BACKENDS.
+        model (torch.nn.Module): FP32 model in eval mode.
+        tokenizer: Matching tokenizer.
+        onnx_dir (str): Where ONNX exports are kept.
+
+    Returns:
+        Backend callable mapping tokenizer tensors to [CLS] embeddings.
+
+    Raises:
+        ValueError: If the name is unknown.
+    '''
+    if name == 'torch':
+        return TorchBackend(model)
+    if name == 'torch-int8':
+        return QuantizedTorchBackend(model)
+    if name in ('onnx', 'onnx-int8'):
+        return OnnxBackend(model, tokenizer, onnx_dir, quantize=name == 'onnx-int8')
+    raise ValueError(f'Unknown embedding backend {name!r}, expected one of {BACKENDS}')
+
+
+def check_backend(reference, candidate, tokenizer, symptom_embeddings=None, terms=CHECK_TERMS, max_length=128):
+    '''Compare a backend's [CLS] vectors and matched symptoms with the FP32 reference.
+
+    Args:
+        reference (callable): FP32 backend.
+        candidate (callable): Backend under test.
+        tokenizer: Tokenizer shared by both.
+        symptom_embeddings (np.ndarray, optional): Symptom matrix used to compare the best-matching symptom per term.
+        terms (list of str): Fixed check terms. Defaults to CHECK_TERMS.
+        max_length (int): Tokenizer max length. Defaults to 128.
+
+    Returns:
+        dict: Minimum and mean cosine similarity, and the share of terms matched to the same symptom (None without symptoms).
+    '''
+    inputs = tokenizer(list(terms), return_tensors='pt', truncation=True, padding=True, max_length=max_length)
+    expected = l2_normalize(reference(inputs))
+    actual = l2_normalize(candidate(inputs))
+    cosine = (expected * actual).sum(axis=1)
+    agreement = None
+    if symptom_embeddings is not None:
+        symptoms = l2_normalize(symptom_embeddings)
+        agreement = float(np.mean(np.argmax(expected @ symptoms.T, axis=1) == np.argmax(actual @ symptoms.T, axis=1)))
+    return {'terms': len(terms), 'min_cosine': float(cosine.min()), 'mean_cosine': float(cosine.mean()),
+            'match_agreement': agreement}
+
+
+def passes(report, min_cosine=MIN_COSINE, min_agreement=MIN_MATCH_AGREEMENT):
+    '''True if a check_backend report is within the accuracy thresholds.'''
+    return report['min_cosine'] >= min_cosine and (report['match_agreement'] is None
+                                                   or report['match_agreement'] >= min_agreement)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an embedding backend and check it against FP32 BioBERT.')
+    parser.add_argument('backend', choices=BACKENDS[1:])
+    args = parser.parse_args()
+
+    from biobert_utils import ModelRegistry, get_symptom_embeddings, ONNX_DIR
+    fp32 = ModelRegistry(backend='torch').load()
+    candidate = make_backend(args.backend, fp32.model, fp32.tokenizer, ONNX_DIR)
+    report = check_backend(fp32.backend, candidate, fp32.tokenizer, symptom_embeddings=get_symptom_embeddings())
+    report['passes'] = passes(report)
+    print(json.dumps(report, indent=2))
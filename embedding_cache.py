@@ -0,0 +1,224 @@
+'''Content-addressed cache for BioBERT term embeddings.'''
+
+import numpy as np
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+import os
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the disk store is then single-writer only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def make_key(term, model_name, max_length):
+    '''Build the cache key for a term embedded by a given model configuration.
+
+    Args:
+        term (str): Normalized symptom term.
+        model_name (str): Embedding model name.
+        max_length (int): Tokenizer max length.
+
+    Returns:
+        str: Hex digest identifying the embedding.
+    '''
+    return hashlib.sha1(f'{model_name}\x00{max_length}\x00{term}'.encode('utf-8')).hexdigest()
+
+
+class DiskEmbeddingStore:
+    '''Append-only on-disk embedding store read through a memory map.
+
+    Vectors are appended as raw float32 rows to ``vectors.f32`` and their keys to
+    ``keys.tsv``; ``meta.json`` records the dimension. Several processes (e.g.
+    uvicorn workers) can open the same directory: readers memory-map the vectors
+    so the pages are shared, and writers serialize appends with a file lock.
+    Entries written by other processes are picked up on the next lookup miss.
+
+    Args:
+        path (str): Store directory.
+        readonly (bool): Never append to the store. Defaults to False.
+    '''
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        self._keys_path = os.path.join(path, 'keys.tsv')
+        self._vectors_path = os.path.join(path, 'vectors.f32')
+        self._meta_path = os.path.join(path, 'meta.json')
+        self._lock_path = os.path.join(path, '.lock')
+        self._index = {}
+        self._keys_offset = 0
+        self._vectors = None
+        self.dim = None
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        self._refresh()
+
+    def __len__(self):
+        return len(self._index)
+
+    def _read_meta(self):
+        if self.dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self.dim = int(json.load(f)['dim'])
+
+    def _refresh(self):
+        '''Load keys appended since the last refresh and remap the vectors.'''
+        self._read_meta()
+        if self.dim is None or not os.path.exists(self._keys_path):
+            return
+        with open(self._keys_path, 'rb') as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        # Ignore a trailing partial line from a concurrent writer
+        complete = data[:data.rfind(b'\n') + 1]
+        if not complete:
+            return
+        self._keys_offset += len(complete)
+        for line in complete.decode('utf-8').splitlines():
+            key, row = line.split('\t')
+            self._index[key] = int(row)
+        rows = max(self._index.values()) + 1
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+    def get(self, key):
+        '''Return a copy of the stored vector, or None.'''
+        row = self._index.get(key)
+        if row is None:
+            self._refresh()
+            row = self._index.get(key)
+            if row is None:
+                return None
+        return np.array(self._vectors[row])
+
+    def put(self, key, vector):
+        '''Append a vector unless the store is read-only or already has the key.'''
+        if self.readonly or key in self._index:
+            return
+        vector = np.ascontiguousarray(vector, dtype=np.float32).ravel()
+        with open(self._lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if key in self._index:
+                    return
+                if self.dim is None:
+                    self.dim = vector.shape[0]
+                    with open(self._meta_path, 'w') as f:
+                        json.dump({'dim': self.dim, 'dtype': 'float32'}, f)
+                if vector.shape[0] != self.dim:
+                    raise ValueError(f'Vector size {vector.shape[0]} does not match store dimension {self.dim}')
+                with open(self._vectors_path, 'ab') as f:
+                    row = f.tell() // (self.dim * 4)
+                    f.write(vector.tobytes())
+                # The key is written after its vector so readers never see a key without data
+                with open(self._keys_path, 'a', encoding='utf-8') as f:
+                    f.write(f'{key}\t{row}\n')
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        self._refresh()
+
+
+class EmbeddingCache:
+    '''Bounded in-memory LRU of embeddings with an optional disk store behind it.
+
+    Args:
+        max_entries (int): Maximum vectors kept in memory. Defaults to 4096.
+        disk_dir (str, optional): Directory of a DiskEmbeddingStore, memory only if None.
+        readonly (bool): Open the disk store read-only. Defaults to False.
+    '''
+
+    def __init__(self, max_entries=4096, disk_dir=None, readonly=False):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk = None
+        if disk_dir:
+            try:
+                self.disk = DiskEmbeddingStore(disk_dir, readonly=readonly)
+            except Exception as e:
+                logger.error(f'Error opening embedding cache at {disk_dir}: {e}')
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        '''Look up a vector in memory, then on disk.
+
+        Args:
+            key (str): Key from make_key.
+
+        Returns:
+            np.ndarray or None: Cached vector.
+        '''
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+            if self.disk is not None:
+                vector = self.disk.get(key)
+                if vector is not None:
+                    self.disk_hits += 1
+                    self._insert(key, vector)
+                    return vector
+            self.misses += 1
+            return None
+
+    def put(self, key, vector):
+        '''Store a vector in memory and, if configured, on disk.
+
+        Args:
+            key (str): Key from make_key.
+            vector (np.ndarray): Embedding vector.
+        '''
+        # Copy so a row of a larger batch array does not keep the whole batch alive
+        vector = np.array(vector, dtype=np.float32)
+        with self._lock:
+            self._insert(key, vector)
+            if self.disk is not None:
+                try:
+                    self.disk.put(key, vector)
+                except Exception as e:
+                    logger.error(f'Error writing embedding cache: {e}')
+
+    def _insert(self, key, vector):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        '''Drop the in-memory entries (the disk store is kept).'''
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        '''Return hit/miss/eviction counters.
+
+        Returns:
+            dict: Cache statistics.
+        '''
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._memory),
+            'max_entries': self.max_entries,
+            'disk_entries': len(self.disk) if self.disk is not None else None,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
@@ -2,9 +2,62 @@
 
 import streamlit as st
 import requests
+import json
 import os
 
 
+def render_card(prediction, description=None):
+    """Render one predicted disease as an HTML card.
+
+    Args:
+        prediction (dict): Ranked prediction with 'rank', 'disease' and 'probability'.
+        description (str, optional): Medical description, a loading note while it is pending.
+
+    Returns:
+        str: HTML card.
+    """
+    return (
+        f"<div class='result-card'>"
+        f"<div class='disease-name'>{prediction['rank']}. {prediction['disease'].title()} "
+        f"({prediction['probability'] * 100:.1f}% chance)</div>"
+        f"<div class='disease-desc'>What it is: {description or 'Looking up a description...'}</div>"
+        f"</div>"
+    )
+
+
+def stream_predictions(backend_url, symptoms):
+    """Show the top diseases as soon as they are predicted and fill in descriptions as they arrive.
+
+    Args:
+        backend_url (str): API base URL.
+        symptoms (str): User symptoms.
+    """
+    with requests.post(f"{backend_url}/predict/stream", json={'symptoms': symptoms}, stream=True) as response:
+        response.raise_for_status()
+        cards = {}
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            message = json.loads(line)
+            if message['type'] == 'predictions':
+                st.markdown(
+                    f"<div class='results-header'>For your symptoms  —  {message['symptoms']}  —  here are the top "
+                    f"{len(message['predictions'])} possible conditions:</div>",
+                    unsafe_allow_html=True,
+                )
+                for prediction in message['predictions']:
+                    cards[prediction['rank']] = (prediction, st.empty())
+                    cards[prediction['rank']][1].markdown(render_card(prediction), unsafe_allow_html=True)
+            elif message['type'] == 'description':
+                prediction, placeholder = cards[message['rank']]
+                description = message['description'] or f"A condition that may cause {symptoms}."
+                placeholder.markdown(render_card(prediction, description), unsafe_allow_html=True)
+        st.markdown(
+            "<div class='results-footer'>⚠️ Heads Up: This is an AI guess. Check with a doctor for certainty.</div>",
+            unsafe_allow_html=True,
+        )
+
+
 def main():
     st.set_page_config(page_title="Seek Healer", page_icon="🩺", layout="wide")
 
@@ -133,12 +186,8 @@ def main():
         if symptoms:
             try:
                 BACKEND_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:8000")
-                response = requests.post(f"{BACKEND_URL}/predict", json={'symptoms': symptoms})
-                response.raise_for_status()
-                results = response.json()['response']
-            
                 st.markdown('<div class="results-header">Top Predicted Conditions</div>', unsafe_allow_html=True)
-                st.markdown(results, unsafe_allow_html=True)
+                stream_predictions(BACKEND_URL, symptoms)
 
             except requests.exceptions.RequestException as e:
                 st.error(f"Error connecting to the server: {str(e)}")
@@ -0,0 +1,135 @@
+'''Executor that keeps CPU-bound inference off the asyncio event loop.'''
+
+import torch
+import asyncio
+import contextvars
+import functools
+import logging
+from runtime_config import available_cpus
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_KINDS = ('thread', 'process')
+
+
+class ExecutorSaturated(Exception):
+    '''Raised when the executor already holds its maximum number of pending requests.'''
+
+
+def _init_process_worker(torch_threads):
+    '''Process-pool initializer: size torch threads and preload models in the worker.'''
+    torch.set_num_threads(torch_threads)
+    # Importing the inference modules registers their artifacts
+    import symptom_matching, tabnet_model, pubmed_fetch  # noqa: F401
+    import startup
+    startup.load_all()
+    # Each worker follows artifact file changes itself
+    if startup.RELOAD_INTERVAL:
+        startup.watch(startup.RELOAD_INTERVAL)
+
+
+def _worker_status():
+    import startup
+    return 'warm' if startup.is_ready() else 'cold'
+
+
+class InferenceExecutor:
+    '''Thread or process pool for inference with bounded admission.
+
+    In thread mode the pool defaults to as many workers as fit the CPUs at the
+    current torch intra-op thread count, so concurrent forward passes do not
+    oversubscribe cores. In process mode every worker preloads its own models
+    and gets an equal share of the CPUs for torch.
+
+    Requests are admitted with ``admit()``; once ``max_pending`` requests are in
+    flight further ones raise ExecutorSaturated so the API can answer 503.
+
+    Args:
+        kind (str): 'thread' or 'process'. Defaults to 'thread'.
+        workers (int, optional): Pool size, derived from the CPU count if None.
+        max_pending (int): Requests admitted at once. Defaults to 64.
+        process_threads (int, optional): Torch threads per worker process, an equal share of the CPUs if None.
+
+    Raises:
+        ValueError: If kind is unknown.
+    '''
+
+    def __init__(self, kind='thread', workers=None, max_pending=64, process_threads=None):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f'Unknown executor kind {kind!r}, expected one of {EXECUTOR_KINDS}')
+        cpus = available_cpus()
+        self.kind = kind
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self.warm = False
+        if kind == 'thread':
+            self.workers = workers or max(1, cpus // max(torch.get_num_threads(), 1))
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+        else:
+            self.workers = workers or max(1, min(cpus, 4))
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_process_worker,
+                initargs=(process_threads or max(1, cpus // self.workers),),
+            )
+
+    @asynccontextmanager
+    async def admit(self):
+        '''Reserve a pending slot for one request.
+
+        Raises:
+            ExecutorSaturated: If max_pending requests are already in flight.
+        '''
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ExecutorSaturated(f'{self.pending} inference requests pending')
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        '''Run fn(*args, **kwargs) in the pool and await its result.'''
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        if self.kind == 'thread':
+            # Carry the caller's context so stage timings land on the request that asked for them
+            call = functools.partial(contextvars.copy_context().run, call)
+        return await loop.run_in_executor(self.executor, call)
+
+    async def warm_up(self, load_fn):
+        '''Preload models where inference runs.
+
+        Args:
+            load_fn (callable): Loader run in the pool in thread mode (process workers preload in their initializer).
+        '''
+        if self.kind == 'thread':
+            await self.run(load_fn)
+        else:
+            states = await asyncio.gather(*(self.run(_worker_status) for _ in range(self.workers)))
+            if not all(state == 'warm' for state in states):
+                raise RuntimeError(f'Inference workers not warm: {states}')
+        self.warm = True
+
+    def shutdown(self):
+        '''Stop the pool without waiting for queued work.'''
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        '''Return pool size, pending requests and rejections.
+
+        Returns:
+            dict: Executor statistics.
+        '''
+        return {
+            'kind': self.kind,
+            'workers': self.workers,
+            'max_pending': self.max_pending,
+            'pending': self.pending,
+            'rejected': self.rejected,
+            'warm': self.warm,
+        }
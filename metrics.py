@@ -0,0 +1,193 @@
+'''Lightweight per-stage latency tracking and Prometheus text exposition.
+
+Stages timed by ``api`` cover a request end to end (queueing in the executor
+and micro-batchers included); stages timed inside ``symptom_matching``,
+``biobert_utils``, ``tabnet_model`` and ``pubmed_fetch`` measure the compute
+alone. Recording is a ``perf_counter`` pair, a bisect and a short lock, so it
+stays on in production.
+'''
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TERM_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+# Per-request stage durations (stage -> seconds), set by the API when Server-Timing is enabled
+request_timings = ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    '''Thread-safe fixed-bucket histogram with sum, count and max.
+
+    Args:
+        buckets (tuple of float): Ascending upper bounds; an implicit +Inf bucket follows.
+    '''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        '''Record one value.'''
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[slot] += 1
+            self._sum += value
+            self._count += 1
+            if value > self._max:
+                self._max = value
+
+    def snapshot(self):
+        '''Return (cumulative bucket counts including +Inf, sum, count, max).'''
+        with self._lock:
+            counts, total, count, largest = list(self._counts), self._sum, self._count, self._max
+        cumulative, running = [], 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, total, count, largest
+
+
+class StageTimer:
+    '''Latency histogram per named stage, also added to the current request's timings.'''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def histogram(self, stage):
+        '''Return the histogram of a stage, creating it on first use.'''
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(stage, Histogram(self.buckets))
+        return histogram
+
+    def record(self, stage, seconds):
+        '''Record one duration for a stage.
+
+        Args:
+            stage (str): Stage name.
+            seconds (float): Duration in seconds.
+        '''
+        self.histogram(stage).observe(seconds)
+        timings = request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def time(self, stage):
+        '''Context manager recording the wall time of its block under a stage name.'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        '''Decorator timing every call of a function under a stage name.'''
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def clear(self):
+        '''Drop every stage's histogram.'''
+        with self._lock:
+            self._stages.clear()
+
+    def snapshots(self):
+        '''Return histogram snapshots per stage.'''
+        with self._lock:
+            stages = dict(self._stages)
+        return {stage: histogram.snapshot() for stage, histogram in stages.items()}
+
+    def stats(self):
+        '''Return count, mean and max milliseconds per stage.
+
+        Returns:
+            dict: Stage name to timing summary.
+        '''
+        return {
+            stage: {'count': count, 'mean_ms': total / count * 1000 if count else 0.0, 'max_ms': largest * 1000}
+            for stage, (_, total, count, largest) in self.snapshots().items()
+        }
+
+
+stage_timer = StageTimer()
+# Normalized terms per free-text input
+term_counts = Histogram(TERM_BUCKETS)
+
+
+def server_timing_header(timings):
+    '''Format stage durations as a Server-Timing header value.
+
+    Args:
+        timings (dict): Stage name to seconds.
+
+    Returns:
+        str: e.g. 'normalize;dur=1.20, embed;dur=8.31'.
+    '''
+    return ', '.join(f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in timings.items())
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value is not None else 'NaN'
+
+
+def _render_histogram(lines, name, snapshot, buckets, labels=None):
+    cumulative, total, count, _ = snapshot
+    for bound, bucket_count in zip(list(buckets) + ['+Inf'], cumulative):
+        lines.append(f'{name}_bucket{_labels(dict(labels or {}, le=bound))} {bucket_count}')
+    lines.append(f'{name}_sum{_labels(labels)} {_format_value(total)}')
+    lines.append(f'{name}_count{_labels(labels)} {count}')
+
+
+def render_prometheus(samples=(), prefix='seekhealer'):
+    '''Render the stage and term histograms plus extra samples in the Prometheus text format.
+
+    Args:
+        samples (iterable): (name, type, help, labels, value) tuples, e.g. cache counters and load times.
+        prefix (str): Metric name prefix. Defaults to 'seekhealer'.
+
+    Returns:
+        str: Exposition text.
+    '''
+    lines = [
+        f'# HELP {prefix}_stage_seconds Latency per pipeline stage.',
+        f'# TYPE {prefix}_stage_seconds histogram',
+    ]
+    for stage, snapshot in sorted(stage_timer.snapshots().items()):
+        _render_histogram(lines, f'{prefix}_stage_seconds', snapshot, stage_timer.buckets, {'stage': stage})
+    lines += [
+        f'# HELP {prefix}_terms_per_request Normalized symptom terms per free-text input.',
+        f'# TYPE {prefix}_terms_per_request histogram',
+    ]
+    _render_histogram(lines, f'{prefix}_terms_per_request', term_counts.snapshot(), term_counts.buckets)
+    # Samples of one metric must be contiguous, whatever order they were collected in
+    families = {}
+    for name, kind, description, labels, value in samples:
+        families.setdefault((name, kind, description), []).append((labels, value))
+    for (name, kind, description), family in families.items():
+        lines += [f'# HELP {prefix}_{name} {description}', f'# TYPE {prefix}_{name} {kind}']
+        lines += [f'{prefix}_{name}{_labels(labels)} {_format_value(value)}' for labels, value in family]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,167 @@
+'''Stub NCBI E-utilities server for running pubmed_fetch without network access.
+
+Serves esearch.fcgi (JSON) and efetch.fcgi (XML) with deterministic answers:
+every disease gets a PMID derived from its name and an abstract naming it,
+except diseases containing "unknown", which have no PMID. With --flaky the
+first request to each endpoint answers 503 so the client's retries are exercised.
+
+    python mock_eutils.py --port 8765
+    python pubmed_fetch.py --base-url http://127.0.0.1:8765/
+    python mock_eutils.py --selftest
+'''
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import zlib
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def pmid_for(disease):
+    '''Deterministic PMID of a disease name, None for names containing "unknown".'''
+    if 'unknown' in disease.lower():
+        return None
+    return str(zlib.crc32(disease.lower().encode('utf-8')))
+
+
+def abstract_for(disease):
+    '''Abstract the stub returns for a disease, over the 500 characters kept for names containing "chronic".'''
+    abstract = f'{disease} is a condition described by the stub E-utilities server.'
+    if 'chronic' in disease.lower():
+        abstract += ' It lasts a long time and its description keeps going.' * 12
+    return abstract
+
+
+class EutilsHandler(BaseHTTPRequestHandler):
+    '''Answer esearch and efetch requests; the server holds pmids (PMID -> disease) and flaky state.'''
+
+    def _send(self, status, body, content_type):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.rsplit('/', 1)[-1]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        with self.server.lock:
+            self.server.requests[endpoint] = self.server.requests.get(endpoint, 0) + 1
+            fail = self.server.flaky and self.server.requests[endpoint] == 1
+        if fail:
+            self._send(503, 'Service unavailable', 'text/plain')
+        elif endpoint == 'esearch.fcgi':
+            # pubmed_fetch searches '<name>[MeSH Terms] OR <name>[Title/Abstract] OR <name>'
+            disease = params.get('term', '').split('[', 1)[0].strip()
+            pmid = pmid_for(disease)
+            if pmid is not None:
+                with self.server.lock:
+                    self.server.pmids[pmid] = disease
+            self._send(200, json.dumps({'esearchresult': {'idlist': [pmid] if pmid else []}}), 'application/json')
+        elif endpoint == 'efetch.fcgi':
+            articles = []
+            for pmid in filter(None, params.get('id', '').split(',')):
+                disease = self.server.pmids.get(pmid)
+                if disease is None:
+                    continue
+                articles.append(f'<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>'
+                                f'<ArticleTitle>{escape(disease)}</ArticleTitle>'
+                                f'<Abstract><AbstractText>{escape(abstract_for(disease))}</AbstractText></Abstract>'
+                                f'</Article></MedlineCitation></PubmedArticle>')
+            self._send(200, f'<?xml version="1.0"?><PubmedArticleSet>{"".join(articles)}</PubmedArticleSet>',
+                       'text/xml')
+        else:
+            self._send(404, f'Unknown endpoint {endpoint}', 'text/plain')
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def start_server(port=0, flaky=False):
+    '''Serve the stub in a daemon thread.
+
+    Args:
+        port (int): Port to bind on 127.0.0.1, any free port if 0.
+        flaky (bool): Answer the first request to each endpoint with 503.
+
+    Returns:
+        tuple: (server, E-utilities base URL).
+    '''
+    server = ThreadingHTTPServer(('127.0.0.1', port), EutilsHandler)
+    server.lock = threading.Lock()
+    server.pmids = {}
+    server.requests = {}
+    server.flaky = flaky
+    threading.Thread(target=server.serve_forever, name='mock-eutils', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+
+def selftest():
+    '''Refresh a temporary PubMed CSV against the stub and check what was stored.
+
+    Returns:
+        list: Problems found, empty if the refresh behaved as expected.
+    '''
+    import pandas as pd
+    from pubmed_fetch import refresh_pubmed_info, build_description_index
+
+    diseases = ['Influenza', 'Common cold (viral)', 'Chronic cough', 'Unknown syndrome']
+    server, base_url = start_server(flaky=True)
+    problems = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'pubmed_medical_info.csv')
+            result = refresh_pubmed_info(diseases, path=path, base_url=base_url)
+            if result != {'diseases': 4, 'fetched': 4, 'failed': 0}:
+                problems.append(f'first refresh returned {result}')
+            index = build_description_index(pd.read_csv(path))
+            if index.get('influenza') != abstract_for('Influenza').rstrip('.'):
+                problems.append(f'unexpected Influenza description: {index.get("influenza")!r}')
+            if index.get('common cold (viral)') != abstract_for('Common cold').rstrip('.'):
+                problems.append(f'unexpected Common cold description: {index.get("common cold (viral)")!r}')
+            # Truncated abstracts keep their complete sentences only
+            chronic = index.get('chronic cough') or ''
+            if not chronic.startswith(abstract_for('Chronic cough').split('.')[0]) or len(chronic) > 500:
+                problems.append(f'unexpected Chronic cough description: {chronic!r}')
+            if not index.get('unknown syndrome', '').startswith('Consult a healthcare provider'):
+                problems.append(f'unexpected Unknown syndrome description: {index.get("unknown syndrome")!r}')
+            searches = server.requests.get('esearch.fcgi', 0)
+            result = refresh_pubmed_info(diseases, path=path, base_url=base_url)
+            if result['fetched'] or server.requests.get('esearch.fcgi', 0) != searches:
+                problems.append(f'second refresh refetched fresh descriptions: {result}')
+            if len(pd.read_csv(path)) != len(diseases):
+                problems.append('CSV was not compacted to one row per disease')
+    finally:
+        server.shutdown()
+    return problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub NCBI E-utilities server.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--flaky', action='store_true', help='Answer the first request to each endpoint with 503')
+    parser.add_argument('--selftest', action='store_true', help='Run pubmed_fetch against the stub and exit')
+    args = parser.parse_args()
+    if args.selftest:
+        problems = selftest()
+        for problem in problems:
+            logger.error(problem)
+        logger.info('Self-test failed' if problems else 'Self-test passed')
+        sys.exit(1 if problems else 0)
+    server, base_url = start_server(args.port, flaky=args.flaky)
+    logger.info(f'Stub E-utilities at {base_url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,195 @@
+'''Token-trie matcher resolving known symptom phrases in free text without a model.
+
+Symptom column names (and lay variants of them) are compiled into a trie over
+normalized tokens. Matching walks the input once, taking the longest known
+phrase at each position, so "sharp chest pain and a runny nose" resolves its
+phrases with dictionary lookups and only the spans between them are left for
+BioBERT.
+
+Normalization makes matching case, punctuation, article and plural
+insensitive: "Chest-Pains" and "the chest pain" both match "Chest pain".
+'''
+
+import re
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Matched on the original text so spans index it even where lowercasing changes the length (e.g. "İ")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['\u2019][a-z]+)*", re.IGNORECASE)
+# Dropped from phrases and input alike
+IGNORED_TOKENS = frozenset(['a', 'an', 'the', 'my', 'your', 'his', 'her', 'their', 'our'])
+# Lay phrasings of common symptoms; a variant is only added when its symptom is a dataset column
+COMMON_VARIANTS = {
+    'throwing up': 'vomiting',
+    'throw up': 'vomiting',
+    'being sick': 'vomiting',
+    'feeling sick': 'nausea',
+    'nauseous': 'nausea',
+    'high temperature': 'fever',
+    'feverish': 'fever',
+    'short of breath': 'shortness of breath',
+    'breathless': 'shortness of breath',
+    'out of breath': 'shortness of breath',
+    'tired': 'fatigue',
+    'tiredness': 'fatigue',
+    'exhaustion': 'fatigue',
+    'head ache': 'headache',
+    'head pain': 'headache',
+    'tummy ache': 'stomach pain',
+    'stomach ache': 'stomach pain',
+    'stomachache': 'stomach pain',
+    'belly pain': 'abdominal pain',
+    'stuffy nose': 'nasal congestion',
+    'blocked nose': 'nasal congestion',
+    'itchy skin': 'itching of skin',
+    'itchy': 'itching',
+    'dizzy': 'dizziness',
+    'lightheaded': 'dizziness',
+    'light headed': 'dizziness',
+    'tight chest': 'chest tightness',
+    'heart racing': 'palpitations',
+    'racing heart': 'palpitations',
+    'pounding heart': 'palpitations',
+    'sore muscles': 'muscle pain',
+    'aching muscles': 'muscle pain',
+    'achy joints': 'joint pain',
+    'cant sleep': 'insomnia',
+    'trouble sleeping': 'insomnia',
+    'loose stools': 'diarrhea',
+    'pins and needles': 'paresthesia',
+    'blurry vision': 'diminished vision',
+    'blurred vision': 'diminished vision',
+    'swollen ankles': 'ankle swelling',
+    'peeing a lot': 'frequent urination',
+    'burning when peeing': 'painful urination',
+}
+
+
+def normalize_token(token):
+    '''Lowercase token without apostrophes and with a plural "s" removed (pains -> pain, can't -> cant).'''
+    token = token.lower().replace("'", '').replace('\u2019', '')
+    if len(token) > 3 and token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    '''Normalized tokens of a text with their character spans, ignored tokens left out.
+
+    Args:
+        text (str): Free text.
+
+    Returns:
+        list: (token, start, end) tuples.
+    '''
+    return [(normalize_token(m.group()), m.start(), m.end()) for m in TOKEN_PATTERN.finditer(text)
+            if m.group().lower() not in IGNORED_TOKENS]
+
+
+def phrase_key(phrase):
+    '''Normalized token tuple a phrase is stored under.'''
+    return tuple(token for token, _, _ in tokenize(phrase))
+
+
+class PhraseMatcher:
+    '''Longest-match phrase lookup over a token trie.
+
+    Args:
+        phrases (iterable, optional): (phrase, column index) pairs to add.
+    '''
+
+    # Trie nodes are dicts of token -> child node; this key holds the index of a phrase ending there
+    _END = ''
+
+    def __init__(self, phrases=()):
+        self._root = {}
+        self._size = 0
+        for phrase, index in phrases:
+            self.add(phrase, index)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, phrase, index):
+        '''Add a phrase; the first index registered for a normalized phrase is kept.
+
+        Returns:
+            bool: False if the phrase is empty after normalization or already present.
+        '''
+        key = phrase_key(phrase)
+        if not key:
+            return False
+        node = self._root
+        for token in key:
+            node = node.setdefault(token, {})
+        if self._END in node:
+            return False
+        node[self._END] = index
+        self._size += 1
+        return True
+
+    def match(self, text):
+        '''Find known phrases in a text.
+
+        Args:
+            text (str): Free text.
+
+        Returns:
+            tuple: (column indices of matched phrases in text order, unmatched spans of the original text).
+        '''
+        tokens = tokenize(text)
+        indices, leftovers = [], []
+        position, unmatched_from = 0, 0
+        while position < len(tokens):
+            node, end, index = self._root, None, None
+            for ahead in range(position, len(tokens)):
+                node = node.get(tokens[ahead][0])
+                if node is None:
+                    break
+                if self._END in node:
+                    end, index = ahead, node[self._END]
+            if end is None:
+                position += 1
+                continue
+            start_char = tokens[position][1]
+            if start_char > unmatched_from:
+                leftovers.append(text[unmatched_from:start_char])
+            indices.append(index)
+            unmatched_from = tokens[end][2]
+            position = end + 1
+        if unmatched_from < len(text):
+            leftovers.append(text[unmatched_from:])
+        return indices, [span for span in leftovers if span.strip()]
+
+
+def load_variants(path):
+    '''Read a {variant phrase: symptom name} JSON file, empty if it does not exist.'''
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build_phrase_matcher(symptoms_col, variants=None):
+    '''Compile the symptom column names and their variants into a PhraseMatcher.
+
+    Args:
+        symptoms_col (list of str): Symptom names in model input order.
+        variants (dict, optional): Extra variant phrase -> symptom name, on top of COMMON_VARIANTS.
+
+    Returns:
+        PhraseMatcher: The compiled matcher.
+    '''
+    matcher = PhraseMatcher((name, idx) for idx, name in enumerate(symptoms_col))
+    by_key = {phrase_key(name): idx for idx, name in reversed(list(enumerate(symptoms_col)))}
+    skipped = 0
+    for variant, name in dict(COMMON_VARIANTS, **(variants or {})).items():
+        idx = by_key.get(phrase_key(name))
+        if idx is None or not matcher.add(variant, idx):
+            skipped += 1
+    logger.info(f'Phrase matcher compiled {len(matcher)} phrases for {len(symptoms_col)} symptoms '
+                f'({skipped} variants without a matching symptom)')
+    return matcher
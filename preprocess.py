@@ -2,22 +2,145 @@
 
 import pandas as pd
 import numpy as np
+import argparse
 import re
+import time
+import logging
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
-def preprocess_data():
-    """Preprocess and augment datasets to create aug_df.csv (for reference only).
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Each source row gets this many augmented copies, each dropping 0-2 of its symptoms
+AUGMENT_MULTIPLIER = 9
+DROP_RANGE = (0, 2)
+
+DATASET1_PATHS = ('trainings.csv', 'testing.csv')
+DATASET2_PATH = 'Final_Augmented_dataset_Diseases_and_Symptoms.csv'
+DEFAULT_CHUNKSIZE = 20000
+
+# Symptom pairs with similar meaning, variants are merged into the preferred name
+SYMPTOM_PAIRS_TO_UNIFY = {
+    'Abnormal breathing sounds (stridor)': ['Abnormal breathing sounds'],
+    'Bed wetting': ['Bedwetting'],
+    'Blood in stool': ['Blood in the stool'],
+    'Blood in urine': ['Blood in the urine'],
+    'Chest tightness or congestion': ['Chest tightness'],
+    'Crossed eyes': ['Cross-eyed'],
+    'Getting lost on familiar routes': ['Getting lost on familiar routes.1'],
+    'Joint stiffness or tightness': ['Joint stiffness'],
+    'Leg cramps or spasms': ['Leg cramps'],
+    'Muscle stiffness or tightness': ['Muscle stiffness'],
+    'Nosebleed': ['Nosebleeds'],
+    'Regurgitation': ['Regurgitation.1'],
+    'Swelling of abdomen': ['Swollen abdomen'],
+    'Swelling of eye': ['Swollen eye'],
+    'Tooth pain': ['Toothache'],
+}
+
+
+def augment_matrix(X, multiplier=AUGMENT_MULTIPLIER, drop_range=DROP_RANGE, seed=0):
+    """Generate augmented copies of binary symptom rows by randomly dropping symptoms.
+
+    Every row is repeated ``multiplier`` times and each copy keeps a uniformly
+    random subset of its symptoms whose size is drawn from
+    ``[max(1, n - drop_range[1]), n - drop_range[0]]``, n being the row's symptom
+    count. All copies are drawn at once from the nonzero coordinates (random
+    keys ranked within each row), so memory scales with the number of set
+    symptoms rather than rows x columns.
+
+    Args:
+        X (np.ndarray): Binary symptom matrix, one row per disease.
+        multiplier (int): Augmented copies per row. Defaults to 9.
+        drop_range (tuple of int): Minimum and maximum symptoms dropped per copy. Defaults to (0, 2).
+        seed (int or np.random.Generator): Seed or generator, for reproducible output. Defaults to 0.
 
     Returns:
-        pd.DataFrame: Augmented dataset.
-    
+        np.ndarray: Boolean matrix of shape (len(X) * multiplier, X.shape[1]); copies of a row are adjacent.
+
     Raises:
-        FileNotFoundError: If raw data files are missing.
+        ValueError: If the drop range is invalid.
+    """
+    min_drop, max_drop = drop_range
+    if not 0 <= min_drop <= max_drop:
+        raise ValueError(f'Invalid drop range {drop_range}')
+    rng = np.random.default_rng(seed)
+    X = np.asarray(X) != 0
+    n_rows = len(X) * multiplier
+    cols = np.nonzero(X)[1]
+    counts = X.sum(axis=1)
+    # Coordinates of every copy, still grouped by row: copy c of source row r is output row r * multiplier + c
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    copy_rows = np.repeat(np.arange(n_rows), np.repeat(counts, multiplier))
+    source = np.repeat(starts, multiplier)[:, None] + np.arange(counts.max(initial=0))
+    valid = np.arange(counts.max(initial=0)) < np.repeat(counts, multiplier)[:, None]
+    copy_cols = cols[source[valid]]
+
+    n = np.repeat(counts, multiplier)
+    low = np.maximum(1, n - max_drop)
+    high = np.maximum(low, n - min_drop)
+    n_keep = np.where(n > 0, rng.integers(low, high + 1), 0)
+
+    # Rank the symptoms of each copy by a random key and keep the n_keep lowest
+    order = np.lexsort((rng.random(len(copy_rows)), copy_rows))
+    rank = np.arange(len(order)) - np.repeat(np.concatenate(([0], np.cumsum(n)[:-1])), n)
+    kept = order[rank < n_keep[copy_rows[order]]]
+    out = np.zeros((n_rows, X.shape[1]), dtype=bool)
+    out[copy_rows[kept], copy_cols[kept]] = True
+    return out
+
+
+def save_augmented(path, prognosis, symptoms, X):
+    """Write the augmented dataset as a CSV like aug_df.csv (or a compressed bit-packed .npz for a .npz path).
+
+    Args:
+        path (str): Output path.
+        prognosis (array-like of str): Disease per row.
+        symptoms (list of str): Symptom column names.
+        X (np.ndarray): Binary symptom matrix.
+    """
+    X = np.asarray(X) != 0
+    if path.endswith('.npz'):
+        np.savez_compressed(path, prognosis=np.asarray(prognosis, dtype=str), symptoms=np.asarray(symptoms, dtype=str),
+                            n_symptoms=len(symptoms), bits=np.packbits(X, axis=1))
+        return
+    df = pd.DataFrame(X.astype(np.int8), columns=symptoms)
+    df.insert(0, 'Prognosis', prognosis)
+    df.to_csv(path, index=False)
+
+
+def load_augmented(path):
+    """Read a dataset written by save_augmented.
+
+    Args:
+        path (str): Path to the .csv (or .npz) file.
+
+    Returns:
+        pd.DataFrame: Prognosis column followed by int8 symptom columns, as in aug_df.csv.
+    """
+    if not path.endswith('.npz'):
+        return pd.read_csv(path)
+    with np.load(path) as data:
+        X = np.unpackbits(data['bits'], axis=1, count=int(data['n_symptoms'])).astype(np.int8)
+        df = pd.DataFrame(X, columns=data['symptoms'])
+        df.insert(0, 'Prognosis', data['prognosis'])
+    return df
+
+
+def combine_sources():
+    """Load the raw datasets fully in memory and merge them into one OR-aggregated row per disease.
+
+    Returns:
+        pd.DataFrame: Prognosis column followed by binary symptom columns.
     """
     try:
         # Dataset 1
-        x = pd.read_csv('trainings.csv', encoding="ISO-8859-1")
-        y = pd.read_csv('testing.csv', encoding="ISO-8859-1")
+        x = pd.read_csv(DATASET1_PATHS[0], encoding="ISO-8859-1")
+        y = pd.read_csv(DATASET1_PATHS[1], encoding="ISO-8859-1")
         dup = y[y['Prognosis'].duplicated(keep=False)].sort_values(ascending=True, by='Prognosis')
         unique = dup.groupby('Prognosis').sum()
         uni_gp = unique.reset_index()
@@ -35,7 +158,7 @@ def preprocess_data():
         u_df['Prognosis'] = u_df['Prognosis'].str.replace(r'[\x96\xa0]', ' ', regex=True)
 
         # Dataset 2
-        df2 = pd.read_csv('Final_Augmented_dataset_Diseases_and_Symptoms.csv')
+        df2 = pd.read_csv(DATASET2_PATH)
         df2 = df2.rename(columns={'diseases': 'Prognosis'})
         unique_df2 = df2.groupby('Prognosis').sum()
         uniq_df2 = unique_df2.reset_index()
@@ -78,31 +201,13 @@ def preprocess_data():
         combined_df.columns = [col.capitalize() for col in combined_df.columns]
         combined_df[all_symptoms] = combined_df[all_symptoms].astype(int)
 
-        # Unify symptom pairs with similar meaning
-        symptom_pairs_to_unify = {
-            'Abnormal breathing sounds (stridor)': ['Abnormal breathing sounds'],
-            'Bed wetting': ['Bedwetting'],
-            'Blood in stool': ['Blood in the stool'],
-            'Blood in urine': ['Blood in the urine'],
-            'Chest tightness or congestion': ['Chest tightness'],
-            'Crossed eyes': ['Cross-eyed'],
-            'Getting lost on familiar routes': ['Getting lost on familiar routes.1'],
-            'Joint stiffness or tightness': ['Joint stiffness'],
-            'Leg cramps or spasms': ['Leg cramps'],
-            'Muscle stiffness or tightness': ['Muscle stiffness'],
-            'Nosebleed': ['Nosebleeds'],
-            'Regurgitation': ['Regurgitation.1'],
-            'Swelling of abdomen': ['Swollen abdomen'],
-            'Swelling of eye': ['Swollen eye'],
-            'Tooth pain': ['Toothache'],
-        }
 
         # Create mapping and track columns to drop
         sym_to_unify = {}
         columns_to_drop = []
         combined_df_columns = combined_df.columns.tolist()  
 
-        for preferred, variants in symptom_pairs_to_unify.items():
+        for preferred, variants in SYMPTOM_PAIRS_TO_UNIFY.items():
             if preferred in combined_df_columns:
                 for variant in variants:
                     if variant in combined_df_columns:
@@ -120,24 +225,151 @@ def preprocess_data():
         zero_symptom_columns = combined_df.iloc[:, 1:].columns[(combined_df.iloc[:, 1:] == 0).all(axis=0)]
         combined_df = combined_df.drop(columns=zero_symptom_columns)
 
-        # Augment data (due to data scarcity)
-        def augment_row(row):
-            original_symptoms = np.where(row[1:] == 1)[0]
-            n_keep = np.random.randint(max(1, len(original_symptoms) - 2), len(original_symptoms) + 1)
-            kept_symptoms = np.random.choice(original_symptoms, n_keep, replace=False)
-            new_row = np.zeros(1601, dtype=int)
-            new_row[kept_symptoms] = 1
-            return np.append(row[0], new_row)
-
-        augmented_data = [row for row in combined_df.values] + [augment_row(row) for row in combined_df.values for _ in range(9)]
-        aug_df = pd.DataFrame(augmented_data, columns=combined_df.columns)
-        aug_df.iloc[:, 1:] = aug_df.iloc[:, 1:].astype(int)
-        aug_df.to_csv("aug_df.csv", index=False)
-        return aug_df
+        return combined_df
 
     except Exception as e:
         raise RuntimeError(f'Preprocessing failed: {e}')
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (0 where unavailable)."""
+    if resource is None:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _source_columns(path, prognosis_col, encoding):
+    # Header only; pandas mangles duplicate names ('x.1') the same way when reading chunks
+    return [col for col in pd.read_csv(path, nrows=0, encoding=encoding).columns if col != prognosis_col]
+
+
+def _target_columns(symptoms_df1, symptoms_df2):
+    """Map every source symptom column to its final column name, as combine_sources does.
+
+    Columns are unified case-insensitively (preferring the dataset 1 spelling,
+    capitalized), variants in SYMPTOM_PAIRS_TO_UNIFY are folded into their
+    preferred name, and stray \\x82/\\xa0 characters are cleaned from the names.
+    """
+    sym_to_canonical = {}
+    for sym_lower in sorted({col.lower() for col in symptoms_df1 + symptoms_df2}):
+        candidates = [col for col in symptoms_df1 + symptoms_df2 if col.lower() == sym_lower]
+        canonical = next((c for c in candidates if c in symptoms_df1), candidates[0]).capitalize()
+        for orig_sym in candidates:
+            sym_to_canonical[orig_sym] = canonical
+    canonical_names = set(sym_to_canonical.values())
+    sym_to_unify = {}
+    for preferred, variants in SYMPTOM_PAIRS_TO_UNIFY.items():
+        if preferred in canonical_names:
+            sym_to_unify.update({variant: preferred for variant in variants if variant in canonical_names})
+    return {col: re.sub(r"[\x82\xa0]", " ", sym_to_unify.get(name, name)).rstrip() for col, name in sym_to_canonical.items()}
+
+
+def combine_sources_streaming(chunksize=DEFAULT_CHUNKSIZE):
+    """Merge the raw datasets like combine_sources, reading them in chunks.
+
+    Only the CSV headers are read up front to build the column mapping. Each
+    chunk is parsed with int8 symptom columns, collapsed to one row per disease
+    with a logical OR and folded into a boolean accumulator of diseases x
+    final symptoms, so memory is bounded by the chunk size and the output
+    rather than the size of the sources.
+
+    Args:
+        chunksize (int): Rows read per chunk. Defaults to 20000.
+
+    Returns:
+        pd.DataFrame: Prognosis column followed by binary symptom columns.
+    """
+    sources = [(path, 'Prognosis', 'ISO-8859-1', True) for path in DATASET1_PATHS]
+    sources.append((DATASET2_PATH, 'diseases', None, False))
+    columns = {path: _source_columns(path, prognosis_col, encoding) for path, prognosis_col, encoding, _ in sources}
+    symptoms_df1 = list(dict.fromkeys(col for path in DATASET1_PATHS for col in columns[path]))
+    mapping = _target_columns(symptoms_df1, columns[DATASET2_PATH])
+    all_symptoms = sorted(set(mapping.values()))
+    symptom_index = {name: idx for idx, name in enumerate(all_symptoms)}
+
+    disease_index = {}
+    acc = np.zeros((0, len(all_symptoms)), dtype=bool)
+    for path, prognosis_col, encoding, clean in sources:
+        target = np.array([symptom_index[mapping[col]] for col in columns[path]])
+        dtype = {col: np.int8 for col in columns[path]}
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtype, encoding=encoding):
+            prognosis = chunk[prognosis_col].astype(str)
+            if clean:
+                prognosis = prognosis.str.replace(r'[\x96\xa0]', ' ', regex=True)
+            codes, names = pd.factorize(prognosis.str.lower())
+            # One OR-reduced row per disease in the chunk
+            order = np.argsort(codes, kind='stable')
+            bounds = np.flatnonzero(np.diff(codes[order], prepend=-1))
+            values = chunk[columns[path]].to_numpy() != 0
+            reduced = np.logical_or.reduceat(values[order], bounds, axis=0)
+            rows = np.array([disease_index.setdefault(name, len(disease_index)) for name in names[codes[order][bounds]]])
+            if len(disease_index) > len(acc):
+                acc = np.vstack([acc, np.zeros((len(disease_index) - len(acc), acc.shape[1]), dtype=bool)])
+            # ufunc.at so source columns unified into the same target column are all OR-ed in
+            np.logical_or.at(acc, (rows[:, None], target[None, :]), reduced)
+        logger.info(f'Ingested {path}: {len(disease_index)} diseases so far, peak RSS {peak_rss_mb():.0f} MB')
+
+    keep = acc.any(axis=0)
+    diseases = sorted(disease_index)
+    combined = acc[[disease_index[name] for name in diseases]][:, keep].astype(np.int8)
+    combined_df = pd.DataFrame(combined, columns=[name for name, kept in zip(all_symptoms, keep) if kept])
+    combined_df.insert(0, 'Prognosis', diseases)
+    return combined_df
+
+
+def preprocess_data(output='aug_df.csv', multiplier=AUGMENT_MULTIPLIER, drop_range=DROP_RANGE, seed=0, streaming=False,
+                    chunksize=DEFAULT_CHUNKSIZE):
+    """Preprocess and augment datasets to create the training set (for reference only).
+
+    Args:
+        output (str): Output path. Defaults to aug_df.csv, which training and the API read; a '.npz' path
+            writes the compact bit-packed format instead.
+        multiplier (int): Augmented copies per disease. Defaults to 9.
+        drop_range (tuple of int): Minimum and maximum symptoms dropped per copy. Defaults to (0, 2).
+        seed (int): Augmentation seed. Defaults to 0.
+        streaming (bool): Read the sources in chunks with combine_sources_streaming. Defaults to False.
+        chunksize (int): Rows per chunk in streaming mode.
+
+    Returns:
+        pd.DataFrame: Augmented dataset.
     
+    Raises:
+        FileNotFoundError: If raw data files are missing.
+    """
+    try:
+        start = time.perf_counter()
+        combined_df = combine_sources_streaming(chunksize) if streaming else combine_sources()
+        logger.info(f'Combined {len(combined_df)} diseases x {combined_df.shape[1] - 1} symptoms in '
+                    f'{time.perf_counter() - start:.1f}s, peak RSS {peak_rss_mb():.0f} MB')
+
+        # Augment data (due to data scarcity): the original rows followed by their augmented copies
+        symptoms = combined_df.columns[1:]
+        X = combined_df[symptoms].to_numpy(dtype=np.int8)
+        prognosis = combined_df['Prognosis'].to_numpy()
+        augmented = augment_matrix(X, multiplier=multiplier, drop_range=drop_range, seed=seed)
+        all_prognosis = np.concatenate([prognosis, np.repeat(prognosis, multiplier)])
+        all_rows = np.vstack([X != 0, augmented])
+        save_augmented(output, all_prognosis, list(symptoms), all_rows)
+        aug_df = pd.DataFrame(all_rows.astype(np.int8), columns=symptoms)
+        aug_df.insert(0, 'Prognosis', all_prognosis)
+        return aug_df
+
+    except Exception as e:
+        raise RuntimeError(f'Preprocessing failed: {e}')
+
 
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Build the augmented training set from the raw datasets.')
+    parser.add_argument('--output', default='aug_df.csv', help="CSV path, or a '.npz' path for the compact format")
+    parser.add_argument('--multiplier', type=int, default=AUGMENT_MULTIPLIER, help='Augmented copies per disease')
+    parser.add_argument('--min-drop', type=int, default=DROP_RANGE[0], help='Fewest symptoms dropped per copy')
+    parser.add_argument('--max-drop', type=int, default=DROP_RANGE[1], help='Most symptoms dropped per copy')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--streaming', action='store_true', help='Read the sources in chunks to bound memory')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNKSIZE, help='Rows per chunk in streaming mode')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    aug_df = preprocess_data(args.output, multiplier=args.multiplier, drop_range=(args.min_drop, args.max_drop), seed=args.seed,
+                             streaming=args.streaming, chunksize=args.chunk_size)
+    logger.info(f'Wrote {len(aug_df)} rows x {aug_df.shape[1] - 1} symptoms to {args.output} in '
+                f'{time.perf_counter() - start:.1f}s, peak RSS {peak_rss_mb():.0f} MB')
\ No newline at end of file
@@ -4,24 +4,95 @@ import pandas as pd
 import asyncio
 import aiohttp
 import nest_asyncio
-from urllib.parse import quote
 from aiohttp import ClientSession, TCPConnector
 from bs4 import BeautifulSoup
+import argparse
+import json
 import re
+import time
 import unicodedata 
 import os
 import logging
+from artifacts import PUBMED_INFO_PATH, get_dataset_metadata
+from startup import artifact
+from metrics import stage_timer
 
 nest_asyncio.apply()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-try:
-    medical_db = pd.read_csv(os.path.join('data', 'pubmed_medical_info.csv'))
-except Exception as e:
-    logger.error(f"Error loading pubmed_medical_info.csv: {e}")
-    
+EUTILS_URL = os.getenv('PUBMED_EUTILS_URL', 'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/')
+PUBMED_MAX_AGE_DAYS = float(os.getenv('PUBMED_MAX_AGE_DAYS', 180))
+PUBMED_COLUMNS = ['disease', 'description', 'fetched_at']
+FETCH_FAILED = "Connection issue; info unavailable."
+# Placeholders left by failed fetches (including older scrapes), always refetched
+RETRY_DESCRIPTIONS = {FETCH_FAILED, "Failed after retries.", "Error retrieving info.",
+                      "API key required for live PubMed fetch."}
+
+
+@artifact('pubmed_db', paths=(PUBMED_INFO_PATH,))
+def get_medical_db():
+    '''Preloaded PubMed data (pubmed_medical_info.csv).'''
+    try:
+        return pd.read_csv(PUBMED_INFO_PATH)
+    except Exception as e:
+        raise RuntimeError(f"Error loading pubmed_medical_info.csv: {e}")
+
+
+def clean_description(desc):
+    '''Clean a stored PubMed description into complete sentences.
+
+    Args:
+        desc (str): Raw description from pubmed_medical_info.csv.
+
+    Returns:
+        str or None: Sentences joined without their final punctuation, None if the description is unusable.
+    '''
+    # Validate description
+    if not isinstance(desc, str) or not desc or len(desc.strip()) < 10 or any(x in desc for x in ['title:', 'abstract:']):
+        return None
+    desc = unicodedata.normalize('NFKD', desc).replace('\xa0', ' ').replace('\u2009', ' ')
+    # Fetches end every description with '...'; only what precedes an ellipsis inside the text is kept
+    if desc.endswith('...'):
+        desc = desc[:-3]
+    desc = desc.split('...')[0]
+    sentences = re.split(r'(?<=[.!?])\s+', desc.strip())
+    valid_sentences = []
+    for s in sentences:
+        s = s.strip()
+        if s and s.endswith(('.', '!', '?')):
+            valid_sentences.append(s.rstrip('.!?'))
+    if not valid_sentences:
+        return None
+    return '. '.join(valid_sentences)
+
+
+def build_description_index(db):
+    '''Map lowercase disease names to cleaned descriptions.
+
+    Args:
+        db (pd.DataFrame): PubMed data with 'disease' and 'description' columns.
+
+    Returns:
+        dict: Lowercase disease name to cleaned description (or None).
+    '''
+    index = {}
+    for disease, desc in zip(db['disease'], db['description']):
+        if not isinstance(disease, str):
+            continue
+        # The last row for a disease wins: refreshes append newer descriptions after older ones
+        index[disease.lower()] = clean_description(desc)
+    return index
+
+
+@artifact('description_index')
+def get_description_index():
+    '''Lowercase disease name -> cleaned description (None when the stored one is unusable).'''
+    return build_description_index(get_medical_db())
+
+
+@stage_timer.timed('medical_info')
 def fetch_medical_info(disease, symptoms):
     '''Fetch medical info from preloaded PubMed data (pubmed_medical_info.csv).
 
@@ -38,109 +109,288 @@ def fetch_medical_info(disease, symptoms):
     if not disease or not symptoms or not isinstance(disease, str) or not isinstance(symptoms, str):
         raise ValueError('Disease symptom must be non-empty and string formatted')
     try:
-        result = medical_db[medical_db['disease'].str.lower() == disease.lower()]
-        if not result.empty:
-            desc = result['description'].iloc[0]
-            # Validate description
-            if not desc or len(desc.strip()) < 10 or any(x in desc for x in ['title:', 'abstract:']):
-                return f"A condition that may cause {symptoms}."
-            
-            desc = unicodedata.normalize('NFKD', desc).replace('\xa0', ' ').replace('\u2009', ' ')
-            desc = desc.split('...')[0]
-            sentences = re.split(r'(?<=[.!?])\s+', desc.strip())
-            valid_sentences = []
-            for s in sentences:
-                s = s.strip()
-                if s and s.endswith(('.', '!', '?')):
-                    valid_sentences.append(s.rstrip('.!?'))
-            if not valid_sentences:
-                return f'A condition that may cause {symptoms}.'
-            cleaned_desc = '. '.join(valid_sentences)
-            return f"A condition {cleaned_desc}. "
-        return f"No info available for {disease} yet."
+        index = get_description_index()
+        key = disease.lower()
+        if key not in index:
+            return f"No info available for {disease} yet."
+        cleaned_desc = index[key]
+        if cleaned_desc is None:
+            return f"A condition that may cause {symptoms}."
+        return f"A condition {cleaned_desc}. "
     except Exception as e:
         raise RuntimeError(f'Fetch medical info failed: {e}')
      
 
-async def fetch_pubmed_info(session, disease, semaphore, api_key=None):
-    '''Fetch PubMed info for a disease (only for reference).
+class TokenBucket:
+    '''Async token bucket: at most ``rate`` acquisitions per second, bursting up to ``capacity``.
 
     Args:
-        session (ClientSession): aiohttp session.
-        disease (str): Disease name.
-        semaphore (asyncio.Semaphore): Concurrency limiter.
-        api_key (str, optional): PubMed API key.
+        rate (float): Tokens added per second.
+        capacity (float, optional): Bucket size, defaults to rate.
+    '''
 
-    Returns:
-        dict: Disease info dictionary (disease: description).
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        '''Wait until a token is available and take it.'''
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def _truncate(text, limit=500):
+    '''Cut text to limit characters, marking a cut with a trailing ellipsis.'''
+    return text[:limit] + '...' if len(text) > limit else text
+
+
+class EutilsClient:
+    '''Minimal NCBI E-utilities client sharing one pooled session and a rate limit.
+
+    Args:
+        session (ClientSession): aiohttp session (keep-alive connections are reused across calls).
+        base_url (str): E-utilities root, overridable to point at a mock server.
+        api_key (str, optional): NCBI API key.
+        bucket (TokenBucket, optional): Rate limiter, defaults to NCBI's limit (10/s with a key, 3/s without).
+        retries (int): Attempts per request on 429, 5xx and connection errors. Defaults to 5.
     '''
-    if not api_key:
-        return {'disease': disease, 'description': "API key required for live PubMed fetch."}
-    
-    base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
-    disease_clean = disease.split(" (")[0]
-    search_url = f"{base_url}esearch.fcgi?db=pubmed&term={quote(disease_clean)}[MeSH Terms]+OR+{quote(disease_clean)}[Title/Abstract]+OR+{quote(disease_clean)}&retmode=json&retmax=1&sort=relevance&api_key={api_key}"
-    async with semaphore:
-        for attempt in range(5):
+
+    def __init__(self, session, base_url=EUTILS_URL, api_key=None, bucket=None, retries=5):
+        self.session = session
+        self.base_url = base_url.rstrip('/') + '/'
+        self.api_key = api_key
+        self.bucket = bucket or TokenBucket(10 if api_key else 3)
+        self.retries = retries
+
+    async def _get(self, endpoint, params):
+        params = dict(params, api_key=self.api_key) if self.api_key else params
+        for attempt in range(self.retries):
+            await self.bucket.acquire()
             try:
-                async with session.get(search_url, timeout=aiohttp.ClientTimeout(total=15)) as response:
+                async with self.session.get(self.base_url + endpoint, params=params,
+                                            timeout=aiohttp.ClientTimeout(total=30)) as response:
                     if response.status == 200:
-                        data = await response.json()
-                        pmids = data.get("esearchresult", {}).get("idlist", [])
-                        if pmids:
-                            summary_url = f"{base_url}efetch.fcgi?db=pubmed&id={pmids[0]}&retmode=xml&api_key={api_key}"
-                            async with session.get(summary_url, timeout=aiohttp.ClientTimeout(total=15)) as summary_resp:
-                                if summary_resp.status == 200:
-                                    xml = await summary_resp.text()
-                                    soup = BeautifulSoup(xml, 'xml')
-                                    abstract = soup.find("AbstractText")
-                                    if abstract:
-                                        return {'disease': disease, 'description': abstract.text[:500] + "..."}
-                                    title = soup.find("ArticleTitle")
-                                    return {'disease': disease, 'description': f"Title: {title.text[:500]}..." if title else "No abstract or title found."}
-                        return {'disease': disease, 'description': "Consult a healthcare provider for more information."}
-                    elif response.status == 429:
-                        await asyncio.sleep(5 * (2 ** attempt))
-                        continue
-                    return {'disease': disease, 'description': f"Search HTTP error: {response.status}"}
-            except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientOSError) as e:
-                if attempt < 4:
-                    await asyncio.sleep(2 ** attempt + 1)
-                    continue
-                return {'disease': disease, 'description': "Connection issue; info unavailable."}
+                        return await response.text()
+                    if response.status != 429 and response.status < 500:
+                        raise RuntimeError(f'{endpoint} HTTP error: {response.status}')
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientOSError):
+                pass
+            if attempt < self.retries - 1:
+                await asyncio.sleep(2 ** attempt)
+        raise RuntimeError(f'{endpoint} failed after {self.retries} attempts')
+
+    async def search(self, disease):
+        '''Return the most relevant PMID for a disease, or None.'''
+        disease_clean = disease.split(" (")[0]
+        term = f'{disease_clean}[MeSH Terms] OR {disease_clean}[Title/Abstract] OR {disease_clean}'
+        data = json.loads(await self._get('esearch.fcgi', {'db': 'pubmed', 'term': term, 'retmode': 'json',
+                                                           'retmax': 1, 'sort': 'relevance'}))
+        pmids = data.get("esearchresult", {}).get("idlist", [])
+        return pmids[0] if pmids else None
+
+    async def fetch(self, pmids):
+        '''Fetch many articles in one efetch call.
+
+        Args:
+            pmids (list of str): PubMed IDs.
+
+        Returns:
+            dict: PMID to description (abstract, else title, truncated to 500 characters).
+        '''
+        if not pmids:
+            return {}
+        xml = await self._get('efetch.fcgi', {'db': 'pubmed', 'id': ','.join(pmids), 'retmode': 'xml'})
+        descriptions = {}
+        for article in BeautifulSoup(xml, 'xml').find_all('PubmedArticle'):
+            pmid = article.find('PMID')
+            if pmid is None:
+                continue
+            abstract = article.find("AbstractText")
+            title = article.find("ArticleTitle")
+            if abstract:
+                descriptions[pmid.text] = _truncate(abstract.text)
+            else:
+                descriptions[pmid.text] = f"Title: {_truncate(title.text)}" if title else "No abstract or title found."
+        return descriptions
+
+
+async def fetch_descriptions(client, diseases, concurrency=10):
+    '''Describe a batch of diseases: one esearch each, then a single efetch for all their PMIDs.
+
+    Args:
+        client (EutilsClient): E-utilities client.
+        diseases (list of str): Disease names.
+        concurrency (int): Concurrent esearch requests. Defaults to 10.
+
+    Returns:
+        list: {'disease', 'description'} dicts, in input order.
+    '''
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def search(disease):
+        async with semaphore:
+            try:
+                return await client.search(disease)
             except Exception as e:
-                return {'disease': disease, 'description': "Error retrieving info."}
-        return {'disease': disease, 'description': "Failed after retries."}
+                logger.warning(f'PubMed search for {disease} failed: {e}')
+                return e
+
+    pmids = await asyncio.gather(*(search(disease) for disease in diseases))
+    try:
+        articles = await client.fetch(list(dict.fromkeys(pmid for pmid in pmids if isinstance(pmid, str))))
+    except Exception as e:
+        logger.warning(f'PubMed fetch failed: {e}')
+        articles = None
+    results = []
+    for disease, pmid in zip(diseases, pmids):
+        if isinstance(pmid, Exception) or (pmid is not None and articles is None):
+            description = FETCH_FAILED
+        elif pmid is None:
+            description = "Consult a healthcare provider for more information."
+        else:
+            description = articles.get(pmid, "No abstract or title found.")
+        results.append({'disease': disease, 'description': description})
+    return results
 
-async def scrape_pubmed_diseases(diseases, api_key=None):
-    '''Scrape PubMed for diseases (reference only).
+
+async def scrape_pubmed_diseases(diseases, api_key=None, base_url=EUTILS_URL, batch_size=100, concurrency=10,
+                                 on_batch=None):
+    '''Describe diseases from PubMed over one pooled keep-alive session.
 
     Args:
         diseases (list): List of disease names.
         api_key (str, optional): PubMed API key.
+        base_url (str): E-utilities root URL.
+        batch_size (int): Diseases per efetch call. Defaults to 100.
+        concurrency (int): Connections and concurrent esearch requests. Defaults to 10.
+        on_batch (callable, optional): Called with each batch's results as soon as it completes.
 
     Returns:
         list: List of disease info dictionaries.
     '''
-    semaphore = asyncio.Semaphore(10)
-    async with ClientSession(connector=TCPConnector(limit=10, force_close=True)) as session:
-        tasks = {disease: fetch_pubmed_info(session, disease, semaphore, api_key) for disease in diseases}
-        results = await asyncio.gather(*tasks.values(), return_exceptions=False)
-        for disease, result in zip(tasks.keys(), results):
-            return [{"disease": disease, "description": result["description"]}]
+    results = []
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as session:
+        client = EutilsClient(session, base_url=base_url, api_key=api_key)
+        for start in range(0, len(diseases), batch_size):
+            batch = await fetch_descriptions(client, list(diseases[start:start + batch_size]), concurrency=concurrency)
+            if on_batch is not None:
+                on_batch(batch)
+            results.extend(batch)
+    return results
+
+
+def _is_failed(description):
+    return description in RETRY_DESCRIPTIONS or str(description).startswith('Search HTTP error')
+
+
+def _read_medical_info(path):
+    '''Existing PubMed rows, one per disease (the latest wins), with a fetched_at column.'''
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=PUBMED_COLUMNS)
+    db = pd.read_csv(path)
+    if 'fetched_at' not in db.columns:
+        db['fetched_at'] = float('nan')
+    db = db.dropna(subset=['disease'])
+    return db.drop_duplicates('disease', keep='last')[PUBMED_COLUMNS].reset_index(drop=True)
+
+
+def _write_medical_info(db, path):
+    tmp_path = f'{path}.tmp'
+    db.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def stale_diseases(db, diseases, max_age_days=PUBMED_MAX_AGE_DAYS, now=None):
+    '''Diseases with no row, a failed fetch or a fetch older than max_age_days.
+
+    Args:
+        db (pd.DataFrame): Existing rows with disease, description and fetched_at.
+        diseases (list of str): Diseases the model predicts.
+        max_age_days (float): Maximum age of a description. Defaults to PUBMED_MAX_AGE_DAYS.
+        now (float, optional): Current Unix time.
+
+    Returns:
+        list: Diseases to (re)fetch, in input order.
+    '''
+    now = time.time() if now is None else now
+    fetched = {
+        disease: (description, fetched_at)
+        for disease, description, fetched_at in zip(db['disease'], db['description'], db['fetched_at'])
+    }
+    stale = []
+    for disease in diseases:
+        description, fetched_at = fetched.get(disease, (None, float('nan')))
+        if disease not in fetched or _is_failed(description) or pd.isna(fetched_at) \
+                or now - fetched_at > max_age_days * 86400:
+            stale.append(disease)
+    return stale
+
+
+def refresh_pubmed_info(diseases, path=PUBMED_INFO_PATH, api_key=None, base_url=EUTILS_URL,
+                        max_age_days=PUBMED_MAX_AGE_DAYS, batch_size=100, concurrency=10):
+    '''Refetch missing or stale diseases into pubmed_medical_info.csv.
 
+    Each completed batch is appended to the CSV right away, so an interrupted
+    refresh keeps its progress and the next run only fetches what is left. The
+    file is compacted (one row per disease, the latest wins) at the start and end.
 
-def run_pubmed_scrape():
-    '''Run PubMed scraping and save results (reference only).'''
+    Args:
+        diseases (list of str): Diseases to cover.
+        path (str): CSV path. Defaults to data/pubmed_medical_info.csv.
+        api_key (str, optional): NCBI API key.
+        base_url (str): E-utilities root, e.g. a local mock server.
+        max_age_days (float): Refetch descriptions older than this.
+        batch_size (int): Diseases per efetch call. Defaults to 100.
+        concurrency (int): Connections and concurrent esearch requests. Defaults to 10.
+
+    Returns:
+        dict: Diseases requested, fetched and failed.
+    '''
+    db = _read_medical_info(path)
+    _write_medical_info(db, path)
+    todo = stale_diseases(db, list(diseases), max_age_days=max_age_days)
+    logger.info(f'{len(todo)} of {len(diseases)} diseases missing or stale')
+    failed = 0
+
+    def append(batch):
+        nonlocal failed
+        rows = pd.DataFrame(batch)
+        rows['fetched_at'] = time.time()
+        rows.to_csv(path, mode='a', header=False, index=False)
+        failed += sum(_is_failed(row['description']) for row in batch)
+        logger.info(f'Saved {len(batch)} PubMed descriptions')
+
+    if todo:
+        asyncio.run(scrape_pubmed_diseases(todo, api_key=api_key, base_url=base_url, batch_size=batch_size,
+                                           concurrency=concurrency, on_batch=append))
+        _write_medical_info(_read_medical_info(path), path)
+    return {'diseases': len(diseases), 'fetched': len(todo) - failed, 'failed': failed}
+
+
+def run_pubmed_scrape(api_key=None, base_url=EUTILS_URL, max_age_days=PUBMED_MAX_AGE_DAYS):
+    '''Refresh PubMed descriptions for every disease the model predicts.'''
     try:
-        aug_df = pd.read_csv('data/aug_df.csv')
-        diseases = aug_df['Prognosis'].unique()
-        medical_info = asyncio.run(scrape_pubmed_diseases(diseases))
-        df = pd.DataFrame(medical_info)
-        df.to_csv('data/pubmed_medical_info.csv', index=False)
+        diseases = [str(disease) for disease in get_dataset_metadata().disease_classes]
+        return refresh_pubmed_info(diseases, api_key=api_key, base_url=base_url, max_age_days=max_age_days)
     except Exception as e:
         raise RuntimeError(f'PubMed scraping failed: {e}')
-    
+
 
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Refresh missing or stale PubMed descriptions.')
+    parser.add_argument('--api-key', default=os.getenv('NCBI_API_KEY'), help='NCBI API key (default $NCBI_API_KEY)')
+    parser.add_argument('--base-url', default=EUTILS_URL, help='E-utilities root, e.g. a local mock server')
+    parser.add_argument('--max-age-days', type=float, default=PUBMED_MAX_AGE_DAYS)
+    args = parser.parse_args()
+    result = run_pubmed_scrape(api_key=args.api_key, base_url=args.base_url, max_age_days=args.max_age_days)
+    logger.info(f"Fetched {result['fetched']} descriptions ({result['failed']} failed) for {result['diseases']} diseases")
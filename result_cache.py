@@ -0,0 +1,187 @@
+'''Two-level cache of /predict results.'''
+
+import threading
+import time
+from collections import OrderedDict
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    '''Size-bounded LRU whose entries also expire after ttl seconds.
+
+    Args:
+        maxsize (int): Maximum entries. Defaults to 1024.
+        ttl (float): Entry lifetime in seconds, no expiry if None or 0. Defaults to 3600.
+    '''
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        '''Return the cached value or None.'''
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        '''Store a value, evicting the least recently used entries beyond maxsize.'''
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        '''Drop every entry.'''
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        '''Return size, hit/miss counters and hit rate.
+
+        Returns:
+            dict: Cache statistics.
+        '''
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl_s': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def text_key(text):
+    '''Canonical form of raw input text: lowercase with collapsed whitespace.'''
+    return ' '.join(text.lower().split())
+
+
+class PredictionCache:
+    '''Cache /predict work at two levels.
+
+    - ``matches``: normalized input text -> matched symptom column indices, which
+      skips spaCy and BioBERT for repeated inputs.
+    - ``predictions``: canonical matched-symptom set -> top diseases, shared by
+      every phrasing that maps to the same symptom vector.
+
+    Keys at both levels include the version of the artifacts the result was
+    computed with, so a request still running on replaced artifacts cannot
+    store results that requests on the new ones would be served.
+
+    Both levels are cleared when any watched artifact file changes (checked at
+    most every ``check_interval`` seconds from its mtime and size). When the
+    files are reloaded elsewhere (worker processes), nothing is cached for
+    ``reload_grace`` seconds after a change so results still computed with the
+    old versions are not kept.
+
+    Args:
+        maxsize (int): Entries per level. Defaults to 1024.
+        ttl (float): Entry lifetime in seconds. Defaults to 3600.
+        watch_paths (list of str, optional): Artifact files whose change invalidates the cache.
+        check_interval (float): Seconds between artifact checks. Defaults to 5.
+        reload_grace (float): Seconds after a change during which results are not cached. Defaults to 0.
+    '''
+
+    def __init__(self, maxsize=1024, ttl=3600, watch_paths=(), check_interval=5.0, reload_grace=0.0):
+        self.matches = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.predictions = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.watch_paths = list(watch_paths)
+        self.check_interval = check_interval
+        self.reload_grace = reload_grace
+        self.invalidations = 0
+        self._bypass_until = 0.0
+        self._fingerprint = self._current_fingerprint()
+        self._next_check = time.monotonic() + check_interval
+
+    def _current_fingerprint(self):
+        fingerprint = []
+        for path in self.watch_paths:
+            try:
+                stat = os.stat(path)
+                fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                fingerprint.append((path, None, None))
+        return tuple(fingerprint)
+
+    def _check_artifacts(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        fingerprint = self._current_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self.clear()
+            self._bypass_until = now + self.reload_grace
+            self.invalidations += 1
+            logger.info('Model artifacts changed, prediction cache cleared')
+
+    def clear(self):
+        '''Drop both levels.'''
+        self.matches.clear()
+        self.predictions.clear()
+
+    def get_indices(self, text, version=None):
+        '''Return cached matched indices for raw input text under an artifact version, or None.'''
+        self._check_artifacts()
+        indices = self.matches.get((version, text_key(text)))
+        return list(indices) if indices is not None else None
+
+    def put_indices(self, text, indices, version=None):
+        '''Cache matched indices for raw input text computed with an artifact version.'''
+        if time.monotonic() < self._bypass_until:
+            return
+        self.matches.put((version, text_key(text)), tuple(indices))
+
+    def get_predictions(self, indices, version=None):
+        '''Return cached top diseases for a matched symptom set under an artifact version, or None.'''
+        self._check_artifacts()
+        top_diseases = self.predictions.get((version, tuple(sorted(indices))))
+        return list(top_diseases) if top_diseases is not None else None
+
+    def put_predictions(self, indices, top_diseases, version=None):
+        '''Cache top diseases for a matched symptom set computed with an artifact version.'''
+        if time.monotonic() < self._bypass_until:
+            return
+        self.predictions.put((version, tuple(sorted(indices))), tuple(top_diseases))
+
+    def stats(self):
+        '''Return per-level statistics and the invalidation count.
+
+        Returns:
+            dict: Cache statistics.
+        '''
+        return {
+            'matches': self.matches.stats(),
+            'predictions': self.predictions.stats(),
+            'invalidations': self.invalidations,
+        }
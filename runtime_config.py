@@ -0,0 +1,395 @@
+'''CPU-aware torch threading, uvicorn worker and inference pool settings, with an autotuner.
+
+Settings are resolved per field, first match wins:
+
+1. ``TORCH_THREADS``, ``TORCH_INTEROP_THREADS``, ``UVICORN_WORKERS``, ``INFERENCE_WORKERS``;
+2. the ``RUNTIME_PROFILE`` entry ('latency' or 'throughput') of ``runtime_config.json``,
+   written by ``python runtime_config.py autotune``;
+3. defaults derived from the CPUs this process may use (affinity mask and cgroup
+   quota), splitting them between uvicorn workers so threads never oversubscribe.
+
+``start.sh`` reads the worker count with ``python runtime_config.py workers``;
+``python runtime_config.py check`` verifies that the derived settings never
+oversubscribe the CPUs.
+'''
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+RUNTIME_CONFIG_PATH = os.getenv('RUNTIME_CONFIG_PATH', os.path.join(os.getenv('DATA_DIR', 'data'), 'runtime_config.json'))
+RUNTIME_PROFILE = os.getenv('RUNTIME_PROFILE', 'latency')
+RUNTIME_PROFILES = ('latency', 'throughput')
+
+# interop_threads None leaves torch's default; inference_workers 0 lets InferenceExecutor size the pool
+RuntimeConfig = namedtuple('RuntimeConfig', ['uvicorn_workers', 'torch_threads', 'interop_threads', 'inference_workers'])
+ENV_VARS = {
+    'uvicorn_workers': 'UVICORN_WORKERS',
+    'torch_threads': 'TORCH_THREADS',
+    'interop_threads': 'TORCH_INTEROP_THREADS',
+    'inference_workers': 'INFERENCE_WORKERS',
+}
+
+
+def _cgroup_cpu_limit():
+    '''CPU quota of the container as a fraction of CPUs, None if unlimited or unknown.'''
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        return quota / period if quota > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def available_cpus():
+    '''CPUs this process can actually use: its affinity mask, capped by the cgroup CPU quota.'''
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, math.floor(limit)))
+    return cpus
+
+
+def default_config(cpus=None, uvicorn_workers=1):
+    '''Settings that give every uvicorn worker an equal share of the CPUs for torch.'''
+    cpus = cpus or available_cpus()
+    return RuntimeConfig(uvicorn_workers=uvicorn_workers, torch_threads=max(1, cpus // uvicorn_workers),
+                         interop_threads=None, inference_workers=0)
+
+
+def inference_pool(config, kind='thread', cpus=None):
+    '''Inference pool size and torch threads per pool worker within one uvicorn worker's share of the CPUs.
+
+    Every uvicorn worker runs its own pool, so a pool is sized from
+    cpus // uvicorn_workers rather than from all the CPUs: in thread mode as
+    many threads as fit at config.torch_threads each, in process mode up to 4
+    processes splitting the share between them.
+
+    Args:
+        config (RuntimeConfig): Resolved settings; a non-zero inference_workers is used as is.
+        kind (str): 'thread' or 'process'. Defaults to 'thread'.
+        cpus (int, optional): CPUs of the whole server, available_cpus() if None.
+
+    Returns:
+        tuple: (pool workers, torch threads per pool worker).
+    '''
+    cpus = cpus or available_cpus()
+    share = max(1, cpus // config.uvicorn_workers)
+    if kind == 'thread':
+        return config.inference_workers or max(1, share // config.torch_threads), config.torch_threads
+    workers = config.inference_workers or min(share, 4)
+    return workers, max(1, share // workers)
+
+
+def check_cpu_budget(max_cpus=64, max_uvicorn_workers=8):
+    '''Check that default and autotune-candidate settings keep uvicorn workers x pool x torch threads within the CPUs.
+
+    Args:
+        max_cpus (int): Largest CPU count checked. Defaults to 64.
+        max_uvicorn_workers (int): Largest uvicorn worker count checked. Defaults to 8.
+
+    Returns:
+        list: Settings that oversubscribe, empty if none do.
+    '''
+    problems = []
+    for cpus in range(1, max_cpus + 1):
+        configs = [default_config(cpus, workers) for workers in range(1, min(cpus, max_uvicorn_workers) + 1)]
+        candidates = candidate_configs(cpus, max_uvicorn_workers)
+        configs += candidates + [config._replace(inference_workers=0) for config in candidates]
+        for config in configs:
+            for kind in ('thread', 'process'):
+                pool, threads = inference_pool(config, kind, cpus)
+                if config.uvicorn_workers * pool * threads > cpus:
+                    problems.append(f'{cpus} CPUs, {kind} pool: {config.uvicorn_workers} uvicorn workers x {pool} '
+                                    f'pool workers x {threads} torch threads')
+    return problems
+
+
+def read_profile(path=RUNTIME_CONFIG_PATH, profile=RUNTIME_PROFILE):
+    '''Return one profile of an autotune result file, empty if there is none.'''
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        tuned = json.load(f)
+    if tuned.get('cpus') not in (None, available_cpus()):
+        logger.warning(f"{path} was tuned for {tuned['cpus']} CPUs but {available_cpus()} are available")
+    return {field: tuned.get(profile, {}).get(field) for field in RuntimeConfig._fields
+            if tuned.get(profile, {}).get(field) is not None}
+
+
+def load_runtime_config(path=RUNTIME_CONFIG_PATH, profile=RUNTIME_PROFILE):
+    '''Resolve the runtime settings from the environment, the tuned profile and the CPU count.
+
+    Args:
+        path (str): Autotune result file. Defaults to RUNTIME_CONFIG_PATH.
+        profile (str): 'latency' or 'throughput'. Defaults to RUNTIME_PROFILE.
+
+    Returns:
+        RuntimeConfig: The resolved settings.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    '''
+    if profile not in RUNTIME_PROFILES:
+        raise ValueError(f'Unknown runtime profile {profile!r}, expected one of {RUNTIME_PROFILES}')
+    values = read_profile(path, profile)
+    values.update({field: int(os.environ[var]) for field, var in ENV_VARS.items() if os.getenv(var)})
+    defaults = default_config(uvicorn_workers=values.get('uvicorn_workers', 1))
+    return defaults._replace(**values)
+
+
+def apply_runtime_config(config):
+    '''Set torch's intra-op and inter-op thread counts in this process.
+
+    The inter-op count can only be set before torch runs parallel work; a later
+    attempt is logged and skipped.
+    '''
+    import torch
+    torch.set_num_threads(config.torch_threads)
+    if config.interop_threads and torch.get_num_interop_threads() != config.interop_threads:
+        try:
+            torch.set_num_interop_threads(config.interop_threads)
+        except RuntimeError as e:
+            logger.warning(f'Could not set torch interop threads to {config.interop_threads}: {e}')
+
+
+def _powers_of_two(limit):
+    return [2 ** i for i in range(int(math.log2(limit)) + 1)] if limit >= 1 else [1]
+
+
+def candidate_configs(cpus, max_uvicorn_workers=4):
+    '''Settings swept by autotune: workers x torch threads within the CPUs, with 1 or 2 interop threads and
+    either a single inference thread or one per spare CPU share.'''
+    candidates = []
+    for workers in _powers_of_two(min(cpus, max_uvicorn_workers)):
+        for threads in _powers_of_two(cpus // workers):
+            for interop in ((1, 2) if threads > 1 else (1,)):
+                for pool in sorted({1, max(1, cpus // (workers * threads))}):
+                    candidates.append(RuntimeConfig(workers, threads, interop, pool))
+    return candidates
+
+
+def _trial_env(config):
+    # The swept values alone, never a previously tuned file
+    env = dict(os.environ, RUNTIME_CONFIG_PATH='', INFERENCE_EXECUTOR='thread')
+    env.update({var: str(getattr(config, field)) for field, var in ENV_VARS.items() if getattr(config, field) is not None})
+    return env
+
+
+def _wait_ready(process, deadline):
+    '''Wait until a trial process prints its "ready" line or time.monotonic() passes deadline.
+
+    Returns:
+        bool: True if the process got ready in time.
+    '''
+    ready = threading.Event()
+
+    def read():
+        # Libraries may print to stdout while loading, skip to the handshake line
+        for line in process.stdout:
+            if line.strip() == 'ready':
+                ready.set()
+                return
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    reader.join(max(0, deadline - time.monotonic()))
+    return ready.is_set()
+
+
+def run_trial(config, data_dir, n_symptoms, n_diseases, bert_size, concurrency, n_requests, timeout=900):
+    '''Benchmark one setting with one process per uvicorn worker, all driven at the same time.
+
+    Every process serves the stand-in models in-process with its share of the
+    clients and requests; they start measuring together once all are warm.
+
+    Returns:
+        dict: The settings with p50/p95 latency in milliseconds and requests per second.
+
+    Raises:
+        RuntimeError: If a trial process fails.
+    '''
+    workers = config.uvicorn_workers
+    args = [sys.executable, os.path.abspath(__file__), 'trial', '--data-dir', data_dir, '--symptoms', str(n_symptoms),
+            '--diseases', str(n_diseases), '--bert-size', bert_size,
+            '--concurrency', str(max(1, concurrency // workers)), '--requests', str(max(1, n_requests // workers))]
+    logs = [tempfile.TemporaryFile() for _ in range(workers)]
+    processes = [subprocess.Popen(args + ['--seed', str(i)], env=_trial_env(config), stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE, stderr=log, text=True) for i, log in enumerate(logs)]
+    try:
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            if not _wait_ready(process, deadline):
+                raise RuntimeError(f'trial process did not get ready within {timeout}s')
+        for process in processes:
+            process.stdin.write('go\n')
+            process.stdin.flush()
+        results = []
+        for process in processes:
+            out, _ = process.communicate(timeout=max(1, deadline - time.monotonic()))
+            if process.returncode:
+                raise RuntimeError(f'trial process exited with {process.returncode}')
+            results.append(json.loads(out.strip().splitlines()[-1]))
+    except Exception as e:
+        for process, log in zip(processes, logs):
+            process.kill()
+            log.seek(0)
+            tail = log.read().decode(errors='replace')[-2000:]
+            if tail:
+                logger.error(f'Trial {config} output:\n{tail}')
+        raise RuntimeError(f'Autotune trial failed for {config}: {e}')
+    finally:
+        for log in logs:
+            log.close()
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    elapsed = max(result['seconds'] for result in results)
+    return dict(config._asdict(),
+                p50_ms=latencies[len(latencies) // 2] * 1000,
+                p95_ms=latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+                requests_per_sec=len(latencies) / elapsed)
+
+
+def autotune(output=RUNTIME_CONFIG_PATH, n_symptoms=300, n_diseases=40, bert_size='base', concurrency=16,
+             n_requests=200, max_uvicorn_workers=4, candidates=None):
+    '''Sweep runtime settings on a synthetic symptom workload and write the best ones.
+
+    The stand-in artifacts from benchmark.py are built once in a temporary
+    directory; every candidate then serves the same /predict workload (see run_trial).
+
+    Args:
+        output (str): Result file. Defaults to RUNTIME_CONFIG_PATH.
+        n_symptoms (int): Stand-in symptom vocabulary size.
+        n_diseases (int): Stand-in disease count.
+        bert_size (str): Stand-in BERT size, 'base' matches BioBERT's compute cost.
+        concurrency (int): Concurrent clients in total, split across uvicorn workers.
+        n_requests (int): Timed requests per candidate in total.
+        max_uvicorn_workers (int): Largest worker count tried.
+        candidates (list of RuntimeConfig, optional): Settings to try instead of candidate_configs.
+
+    Returns:
+        dict: The written results: best setting per profile and every trial.
+    '''
+    cpus = available_cpus()
+    candidates = candidates or candidate_configs(cpus, max_uvicorn_workers)
+    trials = []
+    with tempfile.TemporaryDirectory(prefix='seekhealer-autotune-') as data_dir:
+        logger.info(f'Building stand-in artifacts in {data_dir}')
+        subprocess.run([sys.executable, os.path.abspath(__file__), 'trial', '--data-dir', data_dir, '--prepare',
+                        '--symptoms', str(n_symptoms), '--diseases', str(n_diseases), '--bert-size', bert_size],
+                       env=_trial_env(default_config(cpus)), check=True, stdout=subprocess.DEVNULL)
+        for i, config in enumerate(candidates, 1):
+            trial = run_trial(config, data_dir, n_symptoms, n_diseases, bert_size, concurrency, n_requests)
+            trials.append(trial)
+            logger.info(f"[{i}/{len(candidates)}] workers={config.uvicorn_workers} threads={config.torch_threads} "
+                        f"interop={config.interop_threads} pool={config.inference_workers}: "
+                        f"p95={trial['p95_ms']:.1f}ms {trial['requests_per_sec']:.1f} req/s")
+    best = {
+        'latency': min(trials, key=lambda trial: trial['p95_ms']),
+        'throughput': max(trials, key=lambda trial: trial['requests_per_sec']),
+    }
+    results = dict(best, cpus=cpus, tuned_at=time.time(), workload={
+        'n_symptoms': n_symptoms, 'n_diseases': n_diseases, 'bert_size': bert_size, 'concurrency': concurrency,
+        'n_requests': n_requests}, trials=trials)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    tmp_output = f'{output}.tmp'
+    with open(tmp_output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_output, output)
+    return results
+
+
+def _trial_main(args):
+    '''One autotune trial process: serve the stand-ins in-process and drive /predict on "go".'''
+    import asyncio
+    import benchmark
+    api, symptoms, X = benchmark.setup(args.data_dir, args.symptoms, args.diseases, use_caches=False,
+                                       bert_size=args.bert_size, prepared=not args.prepare)
+    if args.prepare:
+        return
+    queries = benchmark.make_queries(symptoms, X, max(args.requests, 200), seed=args.seed)
+
+    def wait_for_go():
+        print('ready', flush=True)
+        sys.stdin.readline()
+
+    latencies, elapsed = asyncio.run(benchmark.drive_http(api.app, queries, args.concurrency, args.requests,
+                                                          before_start=wait_for_go))
+    api.inference.shutdown()
+    print(json.dumps({'latencies': latencies, 'seconds': elapsed}), flush=True)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Show or autotune the runtime thread and worker settings.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('show', help='Print the resolved settings as JSON')
+    subparsers.add_parser('workers', help='Print the uvicorn worker count (used by start.sh)')
+    subparsers.add_parser('check', help='Check that derived settings never oversubscribe the CPUs, exit 1 if they do')
+    tune_parser = subparsers.add_parser('autotune', help='Sweep settings on a synthetic workload')
+    tune_parser.add_argument('-o', '--output', default=RUNTIME_CONFIG_PATH)
+    tune_parser.add_argument('--bert-size', choices=('tiny', 'base'), default='base', help='Stand-in BERT size')
+    tune_parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients in total')
+    tune_parser.add_argument('--requests', type=int, default=200, help='Timed requests per candidate')
+    tune_parser.add_argument('--max-workers', type=int, default=4, help='Largest uvicorn worker count tried')
+    tune_parser.add_argument('--workers', type=int, nargs='+', help='Only try these uvicorn worker counts')
+    tune_parser.add_argument('--threads', type=int, nargs='+', help='Only try these torch thread counts')
+    trial_parser = subparsers.add_parser('trial', help=argparse.SUPPRESS)
+    trial_parser.add_argument('--data-dir', required=True)
+    trial_parser.add_argument('--prepare', action='store_true')
+    trial_parser.add_argument('--symptoms', type=int, default=300)
+    trial_parser.add_argument('--diseases', type=int, default=40)
+    trial_parser.add_argument('--bert-size', default='base')
+    trial_parser.add_argument('--concurrency', type=int, default=4)
+    trial_parser.add_argument('--requests', type=int, default=100)
+    trial_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        print(json.dumps(dict(load_runtime_config()._asdict(), cpus=available_cpus()), indent=2))
+    elif args.command == 'workers':
+        print(load_runtime_config().uvicorn_workers)
+    elif args.command == 'check':
+        problems = check_cpu_budget()
+        for problem in problems[:20]:
+            logger.error(f'Oversubscribed: {problem}')
+        logger.info(f'{len(problems)} oversubscribed settings' if problems else 'No setting oversubscribes the CPUs')
+        sys.exit(1 if problems else 0)
+    elif args.command == 'trial':
+        _trial_main(args)
+    else:
+        candidates = candidate_configs(available_cpus(), args.max_workers)
+        candidates = [config for config in candidates
+                      if (not args.workers or config.uvicorn_workers in args.workers)
+                      and (not args.threads or config.torch_threads in args.threads)]
+        if not candidates:
+            parser.error(f'No candidate settings within {available_cpus()} CPUs match --workers/--threads')
+        results = autotune(args.output, bert_size=args.bert_size, concurrency=args.concurrency,
+                           n_requests=args.requests, max_uvicorn_workers=args.max_workers, candidates=candidates)
+        for profile in RUNTIME_PROFILES:
+            best = results[profile]
+            logger.info(f"best {profile}: workers={best['uvicorn_workers']} threads={best['torch_threads']} "
+                        f"interop={best['interop_threads']} pool={best['inference_workers']} "
+                        f"(p95={best['p95_ms']:.1f}ms, {best['requests_per_sec']:.1f} req/s)")
+        logger.info(f'Wrote {args.output}')
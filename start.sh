@@ -5,14 +5,18 @@ export PATH="/home/appuser/.local/bin:$PATH"
 # Set trap for clean exit
 trap 'kill $(jobs -p)' EXIT
 
+# Worker count from UVICORN_WORKERS, data/runtime_config.json (python runtime_config.py autotune) or 1;
+# each worker then sizes its torch threads and inference pool from the same settings
+WORKERS=$(python runtime_config.py workers || echo 1)
+
 # Start FastAPI on 8000 in background
-echo "[INFO] Starting FastAPI..."
-uvicorn api:app --host 0.0.0.0 --port 8000 --log-level warning &
+echo "[INFO] Starting FastAPI with ${WORKERS} worker(s)..."
+uvicorn api:app --host 0.0.0.0 --port 8000 --workers "${WORKERS}" --log-level warning &
 FASTAPI_PID=$!
 
-# Wait for FastAPI to be ready (poll until it responds)
+# Wait for FastAPI to be ready (poll until the models are warm)
 echo "[INFO] Waiting for FastAPI..."
-until curl -s http://127.0.0.1:8000/docs > /dev/null; do
+until curl -sf http://127.0.0.1:8000/readyz > /dev/null; do
   sleep 1
 done
 echo "[INFO] FastAPI is up."
@@ -0,0 +1,373 @@
+'''Lazy, concurrently loadable runtime artifacts with load-state tracking and hot reload.
+
+Artifacts built from files on disk list those files; ``reload()`` loads new
+versions of changed artifacts and of everything built from them in the
+background, and swaps them in together only if all of them load. Requests
+``pin()`` the published set of values when they start, so a request in flight
+during a swap finishes on the versions it started with.
+'''
+
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextvars import Context, ContextVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the artifact files for hot reload (0 disables watching)
+RELOAD_INTERVAL = float(os.getenv('ARTIFACT_RELOAD_INTERVAL', 30))
+
+# Artifact name -> Artifact, in registration order
+artifacts = {}
+
+# Key of the publish count in every view; artifact names are strings, so it never collides with one
+_GENERATION = object()
+# Name -> value of every ready artifact; replaced as a whole, never mutated, so a pinned view stays consistent
+_published = {_GENERATION: 0}
+_publish_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_swap_callbacks = []
+_UNLOADED = object()
+# Values pinned by the current request, if any
+_pinned = ContextVar('pinned_artifacts', default=None)
+# Name -> new value (or _UNLOADED) of the artifacts being reloaded in this context
+_staged = ContextVar('staged_artifacts', default=None)
+# Artifact whose loader is running in this context, to record which artifacts are built from which
+_loading = ContextVar('loading_artifact', default=None)
+
+
+class Artifact:
+    '''A value produced once by a loader function, on first use or at startup.
+
+    ``get()`` returns the loaded value, loading it under a lock on first call, so
+    concurrent callers share one load. A loader may call other artifacts' getters
+    to express dependencies. A failed load is recorded and retried on next use.
+
+    Args:
+        name (str): Artifact name used in status reports.
+        loader (callable): Zero-argument function producing the value.
+        paths (tuple of str): Files the value is read from, watched for hot reload.
+    '''
+
+    def __init__(self, name, loader, paths=()):
+        self.name = name
+        self.loader = loader
+        self.paths = tuple(paths)
+        self.value = None
+        self.state = 'pending'
+        self.error = None
+        self.load_time = None
+        self.loaded_at = None
+        # Bumped on every load or swap; files holds the fingerprint of paths the value was read from
+        self.version = 0
+        self.files = {}
+        self.reload_error = None
+        self.failed_files = None
+        # Artifacts whose loaders called this one, reloaded along with it
+        self.dependents = set()
+        self._lock = threading.Lock()
+
+    def get(self):
+        '''Return the value, loading it if needed.'''
+        parent = _loading.get()
+        if parent is not None:
+            self.dependents.add(parent)
+        staged = _staged.get()
+        if staged is not None and self.name in staged:
+            if staged[self.name] is _UNLOADED:
+                staged[self.name] = self._load()
+            return staged[self.name]
+        pinned = _pinned.get()
+        if pinned is not None and self.name in pinned:
+            return pinned[self.name]
+        if self.state == 'ready':
+            return self.value
+        with self._lock:
+            if self.state == 'ready':
+                return self.value
+            self.state = 'loading'
+            start = time.perf_counter()
+            # Fingerprint before reading, so a file replaced during the load is picked up by the next check
+            files = fingerprint(self.paths)
+            try:
+                value = self._load()
+            except Exception as e:
+                self.state = 'failed'
+                self.error = str(e)
+                self.load_time = time.perf_counter() - start
+                logger.error(f'Loading {self.name} failed: {e}')
+                raise
+            self.load_time = time.perf_counter() - start
+            self._install(value, files)
+            _publish({self.name: value})
+            logger.info(f'Loaded {self.name} in {self.load_time:.2f}s')
+            return value
+
+    def _load(self):
+        token = _loading.set(self.name)
+        try:
+            return self.loader()
+        finally:
+            _loading.reset(token)
+
+    def _install(self, value, files):
+        self.value = value
+        self.files = files
+        self.version += 1
+        self.error = None
+        self.reload_error = None
+        self.failed_files = None
+        self.loaded_at = time.time()
+        self.state = 'ready'
+
+    def set(self, value):
+        '''Install a value directly, as if the loader had produced it (e.g. a stand-in model).'''
+        with self._lock:
+            self.load_time = 0.0
+            self._install(value, fingerprint(self.paths))
+            _publish({self.name: value})
+
+    def changed(self, settle=0.0):
+        '''True if a watched file differs from the loaded version and was last written over settle seconds ago.'''
+        if self.state != 'ready' or not self.paths:
+            return False
+        current = fingerprint(self.paths)
+        if current == self.files:
+            return False
+        newest = max((mtime for mtime, _ in filter(None, current.values())), default=0)
+        return newest / 1e9 <= time.time() - settle
+
+    def status(self):
+        '''Return state, version, load time in seconds, load timestamp, source files and last errors.'''
+        return {
+            'state': self.state,
+            'version': self.version,
+            'load_time_s': self.load_time,
+            'loaded_at': self.loaded_at,
+            'files': {path: dict(zip(('mtime_ns', 'size'), stat)) if stat else None for path, stat in self.files.items()},
+            'error': self.error,
+            'reload_error': self.reload_error,
+        }
+
+
+def fingerprint(paths):
+    '''(mtime_ns, size) of each path, None for missing files.'''
+    result = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            result[path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            result[path] = None
+    return result
+
+
+def _publish(values):
+    global _published
+    with _publish_lock:
+        published = dict(_published)
+        published.update(values)
+        published[_GENERATION] += 1
+        _published = published
+
+
+def artifact(name, paths=()):
+    '''Decorator registering a loader as a named artifact.
+
+    The decorated function becomes the artifact's getter: the first call loads,
+    later calls return the cached value.
+
+    Args:
+        name (str): Artifact name.
+        paths (tuple of str): Files the loader reads, watched for hot reload.
+
+    Returns:
+        callable: Decorator.
+    '''
+    def decorator(loader):
+        entry = Artifact(name, loader, paths)
+        artifacts[name] = entry
+
+        @functools.wraps(loader)
+        def getter():
+            return entry.get()
+        getter.artifact = entry
+        return getter
+    return decorator
+
+
+def load_all(names=None):
+    '''Load artifacts concurrently, one thread each.
+
+    Args:
+        names (list of str, optional): Artifacts to load, all registered ones if None.
+
+    Returns:
+        bool: True if every requested artifact loaded.
+    '''
+    selected = [artifacts[name] for name in (names or list(artifacts))]
+    if not selected:
+        return True
+    start = time.perf_counter()
+    # One thread per artifact so one waiting on a dependency never starves the others
+    with ThreadPoolExecutor(max_workers=len(selected), thread_name_prefix='startup') as pool:
+        futures = [pool.submit(entry.get) for entry in selected]
+        wait(futures)
+    ok = all(entry.state == 'ready' for entry in selected)
+    logger.info(f'Startup loading finished in {time.perf_counter() - start:.2f}s ({"ready" if ok else "with failures"})')
+    return ok
+
+
+def is_ready():
+    '''True once every registered artifact is loaded.'''
+    return all(entry.state == 'ready' for entry in artifacts.values())
+
+
+def status():
+    '''Return the status of every registered artifact.
+
+    Returns:
+        dict: Artifact name to status.
+    '''
+    return {name: entry.status() for name, entry in artifacts.items()}
+
+
+def watched_paths():
+    '''Every file watched by a registered artifact, sorted.'''
+    return sorted({path for entry in artifacts.values() for path in entry.paths})
+
+
+def pin():
+    '''Pin the currently published artifact values in this context (one request), returning a reset token.'''
+    return _pinned.set(_published)
+
+
+def unpin(token):
+    '''Undo pin().'''
+    _pinned.reset(token)
+
+
+def generation():
+    '''Publish count of the artifact values this context sees: its pinned view, else the current one.
+
+    Changes whenever any artifact is loaded or swapped, so results keyed by it
+    (e.g. in the prediction cache) never outlive the values they came from.
+    '''
+    values = _pinned.get()
+    return (_published if values is None else values)[_GENERATION]
+
+
+def pinned():
+    '''Artifact values pinned in this context, None when unpinned.'''
+    return _pinned.get()
+
+
+def run_pinned(values, fn, *args):
+    '''Run fn(*args) in a fresh context with the given pinned values (as returned by pinned()).
+
+    Lets work batched across requests run against the artifact versions its
+    requests were pinned to rather than whatever the worker thread last saw.
+    '''
+    def call():
+        if values is not None:
+            _pinned.set(values)
+        return fn(*args)
+
+    return Context().run(call)
+
+
+def on_swap(callback):
+    '''Register callback(names) to run after reloaded artifacts are swapped in, e.g. to clear caches.'''
+    _swap_callbacks.append(callback)
+
+
+def _with_dependents(names):
+    selected, queue = [], list(names)
+    while queue:
+        name = queue.pop(0)
+        if name not in selected:
+            selected.append(name)
+            queue.extend(sorted(artifacts[name].dependents))
+    return selected
+
+
+def reload(names=None, settle=0.0):
+    '''Load new versions of artifacts and everything built from them, then swap them in together.
+
+    New values are loaded in the calling thread while requests keep using the
+    current ones. Loaders double as validation (e.g. the symptom index checks
+    its embedding rows against the symptom columns): if any of them fails,
+    nothing is swapped and the failure is recorded in reload_error.
+
+    Args:
+        names (list of str, optional): Artifacts to reload; those whose watched files changed if None.
+        settle (float): Ignore files written less than this many seconds ago (still being written).
+
+    Returns:
+        dict: Reloaded artifact names with their new versions, or the error that kept the old ones.
+
+    Raises:
+        KeyError: If a name is not a registered artifact.
+    '''
+    with _reload_lock:
+        if names is None:
+            names = [name for name, entry in artifacts.items() if entry.changed(settle)]
+            # Files that already failed are retried together with the next change (e.g. the matching embeddings)
+            if all(fingerprint(artifacts[name].paths) == artifacts[name].failed_files for name in names):
+                names = []
+        if not names:
+            return {'reloaded': {}}
+        unknown = [name for name in names if name not in artifacts]
+        if unknown:
+            raise KeyError(f'Unknown artifacts: {unknown}')
+        selected = _with_dependents(names)
+        files = {name: fingerprint(artifacts[name].paths) for name in selected}
+        staged = {name: _UNLOADED for name in selected}
+        start = time.perf_counter()
+        token = _staged.set(staged)
+        try:
+            for name in selected:
+                artifacts[name].get()
+        except Exception as e:
+            for name in names:
+                artifacts[name].reload_error = str(e)
+                artifacts[name].failed_files = files[name]
+            logger.error(f'Reloading {selected} failed, keeping the current versions: {e}')
+            return {'reloaded': {}, 'error': str(e), 'artifacts': selected}
+        finally:
+            _staged.reset(token)
+        elapsed = time.perf_counter() - start
+        # Every value is ready before any is published: new requests see all new versions at once
+        for name in selected:
+            artifacts[name].load_time = elapsed
+            artifacts[name]._install(staged[name], files[name])
+        _publish({name: staged[name] for name in selected})
+        logger.info(f'Reloaded {selected} in {elapsed:.2f}s')
+    for callback in _swap_callbacks:
+        try:
+            callback(selected)
+        except Exception as e:
+            logger.error(f'Swap callback failed: {e}')
+    return {'reloaded': {name: artifacts[name].version for name in selected}}
+
+
+def watch(interval, settle=2.0):
+    '''Start a daemon thread reloading artifacts whose files change, checked every interval seconds.
+
+    Returns:
+        threading.Thread: The watcher thread.
+    '''
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                reload(settle=settle)
+            except Exception as e:
+                logger.error(f'Artifact watch failed: {e}')
+
+    thread = threading.Thread(target=loop, name='artifact-watch', daemon=True)
+    thread.start()
+    return thread
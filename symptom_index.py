@@ -0,0 +1,127 @@
+"""Nearest-neighbour index over symptom embeddings."""
+
+import numpy as np
+
+INDEX_MODES = ('exact', 'int8', 'ivf')
+
+
+def l2_normalize(matrix):
+    '''Row-normalize a matrix to float32, leaving zero rows untouched (as sklearn does).'''
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores, k):
+    '''Indices and values of the k largest scores per row, best first.'''
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(part_scores, order, axis=1)
+
+
+def _spherical_kmeans(vectors, n_lists, n_iter=10, seed=0):
+    '''Cluster unit vectors by cosine similarity, returning unit centroids and assignments.'''
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = vectors[assign == c]
+            # Re-seed empty lists with a random vector
+            centroids[c] = members.sum(axis=0) if len(members) else vectors[rng.integers(len(vectors))]
+        centroids = l2_normalize(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+class SymptomIndex:
+    """Cosine top-k search over a fixed set of symptom embeddings.
+
+    Vectors are normalized once at build time, so a query is a single dot
+    product followed by ``argpartition``. Two approximate modes trade accuracy
+    for memory or speed on large vocabularies:
+
+    - ``int8``: vectors are stored as per-row scaled int8 (4x smaller).
+    - ``ivf``: vectors are grouped into ``n_lists`` k-means lists and only the
+      ``n_probe`` lists closest to the query are scored.
+
+    Args:
+        embeddings (np.ndarray): Reference embeddings, one row per symptom.
+        mode (str): 'exact', 'int8' or 'ivf'. Defaults to 'exact'.
+        n_lists (int, optional): IVF list count, defaults to about sqrt(n).
+        n_probe (int): IVF lists scanned per query. Defaults to 8.
+        normalized (bool): Embeddings are already unit float32 rows and are used without a copy.
+
+    Raises:
+        ValueError: If mode is unknown or embeddings are empty.
+    """
+
+    def __init__(self, embeddings, mode='exact', n_lists=None, n_probe=8, normalized=False):
+        if mode not in INDEX_MODES:
+            raise ValueError(f'Unknown index mode {mode!r}, expected one of {INDEX_MODES}')
+        if embeddings is None or len(embeddings) == 0:
+            raise ValueError('Embeddings must be a non-empty matrix')
+        vectors = embeddings if normalized and embeddings.dtype == np.float32 else l2_normalize(embeddings)
+        self.mode = mode
+        self.size, self.dim = vectors.shape
+        self.vectors = None
+        if mode == 'int8':
+            self.scales = np.abs(vectors).max(axis=1) / 127.0
+            self.scales[self.scales == 0] = 1.0
+            self.codes = np.round(vectors / self.scales[:, None]).astype(np.int8)
+        else:
+            self.vectors = vectors
+        if mode == 'ivf':
+            n_lists = n_lists or max(1, int(np.sqrt(self.size)))
+            self.n_lists = min(n_lists, self.size)
+            self.n_probe = min(n_probe, self.n_lists)
+            self.centroids, assign = _spherical_kmeans(self.vectors, self.n_lists)
+            self.lists = [np.flatnonzero(assign == c) for c in range(self.n_lists)]
+
+    def __len__(self):
+        return self.size
+
+    def search(self, queries, k=1):
+        '''Find the k most similar symptoms for each query vector.
+
+        Args:
+            queries (np.ndarray): Query embeddings, one row per query (a single vector is accepted).
+            k (int): Matches per query. Defaults to 1.
+
+        Returns:
+            tuple: (indices, scores), both of shape (n_queries, k), best match first.
+        '''
+        if k < 1:
+            raise ValueError('k must be at least 1')
+        queries = l2_normalize(queries)
+        if self.mode == 'exact':
+            return _top_k(queries @ self.vectors.T, k)
+        if self.mode == 'int8':
+            return _top_k(self._int8_scores(queries), k)
+        return self._search_ivf(queries, k)
+
+    def _int8_scores(self, queries, block=4096):
+        # Dequantize a block of rows at a time to keep the float32 working set bounded
+        scores = np.empty((len(queries), self.size), dtype=np.float32)
+        for start in range(0, self.size, block):
+            codes = self.codes[start:start + block].astype(np.float32)
+            scores[:, start:start + block] = (queries @ codes.T) * self.scales[start:start + block]
+        return scores
+
+    def _search_ivf(self, queries, k):
+        probes, _ = _top_k(queries @ self.centroids.T, self.n_probe)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([self.lists[c] for c in lists])
+            if not len(candidates):
+                continue
+            top_idx, top_scores = _top_k((self.vectors[candidates] @ query)[None, :], k)
+            indices[row, :top_idx.shape[1]] = candidates[top_idx[0]]
+            scores[row, :top_idx.shape[1]] = top_scores[0]
+        return indices, scores
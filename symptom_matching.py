@@ -1,24 +1,65 @@
 """Process user input for symptom matching."""
 
-import pandas as pd
 import numpy as np
 import spacy
-from sklearn.metrics.pairwise import cosine_similarity
-from biobert_utils import get_embedding, symptom_embeddings
+from biobert_utils import get_embeddings, get_symptom_embeddings
+from symptom_index import SymptomIndex
+from artifacts import SYMPTOM_VARIANTS_PATH, get_dataset_metadata, get_bundle
+from phrase_matcher import build_phrase_matcher, load_variants
+from startup import artifact
+from metrics import stage_timer, term_counts
 import os
 
 
-# Normalize input using spaCy
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError as e:
-    raise OSError(f"Ensure en_core_web_sm is installed via setup_spacy.py: {e}")
+# Normalize input using spaCy. Only tokens and stop words are used, both of which come
+# from the tokenizer, so the trained components are never loaded
+SPACY_EXCLUDE = ['tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'ner', 'senter']
+SPACY_N_PROCESS = int(os.getenv('SPACY_N_PROCESS', 1))
+SYMPTOM_INDEX_MODE = os.getenv('SYMPTOM_INDEX_MODE', 'exact')
+# Resolve symptom names found verbatim in the input without BioBERT; only the rest is embedded
+PHRASE_MATCHING = os.getenv('PHRASE_MATCHING', '1') == '1'
 
-try:
-    aug_df = pd.read_csv(os.path.join('data', 'aug_df.csv'))
-    symptoms_col = aug_df.columns[1:]
-except FileNotFoundError as e:
-    raise FileNotFoundError(f"Ensure aug_df.csv exists in data/: {e}")
+
+@artifact('spacy')
+def get_nlp():
+    """Tokenizer-only en_core_web_sm pipeline."""
+    try:
+        return spacy.load("en_core_web_sm", exclude=SPACY_EXCLUDE)
+    except OSError as e:
+        raise OSError(f"Ensure en_core_web_sm is installed via setup_spacy.py: {e}")
+
+
+def get_symptoms_col():
+    """Dataset symptom column names, in model input order."""
+    return get_dataset_metadata().symptoms_col
+
+
+@artifact('symptom_vocabulary')
+def get_symptom_to_index():
+    """Lowercase symptom name -> column index, for callers that send symptom names."""
+    return {name.lower(): idx for idx, name in enumerate(get_symptoms_col())}
+
+
+@artifact('symptom_index')
+def get_symptom_index():
+    """Symptom embedding index; SYMPTOM_INDEX_MODE=int8 or ivf trades exactness for larger vocabularies."""
+    embeddings = get_symptom_embeddings()
+    if len(embeddings) != len(get_symptoms_col()):
+        raise RuntimeError(f'{len(embeddings)} symptom embeddings for {len(get_symptoms_col())} symptom columns, '
+                           'rebuild them with build_embeddings.py')
+    # Bundle embeddings are stored unit-normalized and are searched in place from the shared mapping
+    return SymptomIndex(embeddings, mode=SYMPTOM_INDEX_MODE, normalized=get_bundle() is not None)
+
+
+@artifact('phrase_matcher', paths=(SYMPTOM_VARIANTS_PATH,))
+def get_phrase_matcher():
+    """Trie of symptom names and their variants (COMMON_VARIANTS plus SYMPTOM_VARIANTS_PATH if present)."""
+    return build_phrase_matcher(get_symptoms_col(), load_variants(SYMPTOM_VARIANTS_PATH))
+
+
+def _search(user_embs, k):
+    with stage_timer.time('similarity'):
+        return get_symptom_index().search(user_embs, k=k)
 
 
 def normalize_user_input(user_input):
@@ -36,47 +77,272 @@ def normalize_user_input(user_input):
     if not user_input.strip() or not isinstance(user_input, str):
         raise ValueError(f'User input must be a non-empty string.')
     try:
-        doc = nlp(user_input)
-        terms = [token.text.lower() for token in doc if not token.is_stop and len(token.text) > 2]
-        return terms if terms else [user_input.lower().strip()]
+        # Tokenizer-only fast path
+        with stage_timer.time('spacy'):
+            terms = _extract_terms(user_input, get_nlp().make_doc(user_input))
+        term_counts.observe(len(terms))
+        return terms
+    except Exception as e:
+        raise RuntimeError(f'Normalization failed: {e}')
+
+
+def _extract_terms(user_input, doc, fallback=True):
+    terms = [token.text.lower() for token in doc if not token.is_stop and len(token.text) > 2]
+    return terms if terms or not fallback else [user_input.lower().strip()]
+
+
+def _phrase_match(user_input):
+    """(lexically matched indices, leftover text or None) for one input; all of it is left over without matches."""
+    if not PHRASE_MATCHING:
+        return [], user_input
+    with stage_timer.time('phrase_match'):
+        indices, leftovers = get_phrase_matcher().match(user_input)
+    if not indices:
+        return [], user_input
+    # The tokenizer splits at commas, so joined spans give the same terms as separate ones
+    return indices, ', '.join(leftovers) if leftovers else None
+
+
+def resolve_user_input(user_input):
+    """Resolve known symptom phrases lexically and normalize only what is left.
+
+    Args:
+        user_input (str): Raw user symptom string.
+
+    Returns:
+        tuple: (column indices matched by phrase, leftover terms that still need embedding).
+
+    Raises:
+        ValueError: If input is empty or invalid.
+    """
+    if not isinstance(user_input, str) or not user_input.strip():
+        raise ValueError('User input must be a non-empty string.')
+    matched, leftover = _phrase_match(user_input)
+    if not matched:
+        return [], normalize_user_input(user_input)
+    terms = []
+    if leftover is not None:
+        try:
+            with stage_timer.time('spacy'):
+                terms = _extract_terms(leftover, get_nlp().make_doc(leftover), fallback=False)
+        except Exception as e:
+            raise RuntimeError(f'Normalization failed: {e}')
+    term_counts.observe(len(matched) + len(terms))
+    return matched, terms
+
+
+def resolve_many(user_inputs, batch_size=256, n_process=None):
+    """resolve_user_input for many inputs, with one batched spaCy pipe over the leftovers.
+
+    Args:
+        user_inputs (list of str): Raw user symptom strings.
+        batch_size (int): Texts per spaCy batch. Defaults to 256.
+        n_process (int, optional): spaCy worker processes, defaults to SPACY_N_PROCESS (1).
+
+    Returns:
+        list: (phrase-matched indices, leftover terms) for each input.
+
+    Raises:
+        ValueError: If any input is empty or invalid.
+    """
+    user_inputs = list(user_inputs)
+    if not all(isinstance(text, str) and text.strip() for text in user_inputs):
+        raise ValueError('User inputs must be non-empty strings.')
+    resolved = [_phrase_match(text) for text in user_inputs]
+    pending = [(i, leftover) for i, (_, leftover) in enumerate(resolved) if leftover is not None]
+    terms_per_input = [[] for _ in user_inputs]
+    try:
+        with stage_timer.time('spacy'):
+            docs = get_nlp().pipe([leftover for _, leftover in pending], batch_size=batch_size,
+                                  n_process=n_process or SPACY_N_PROCESS)
+            for (i, leftover), doc in zip(pending, docs):
+                # Inputs without any phrase match keep normalize_user_input's whole-text fallback
+                terms_per_input[i] = _extract_terms(leftover, doc, fallback=not resolved[i][0])
+    except Exception as e:
+        raise RuntimeError(f'Normalization failed: {e}')
+    for (matched, _), terms in zip(resolved, terms_per_input):
+        term_counts.observe(len(matched) + len(terms))
+    return [(matched, terms) for (matched, _), terms in zip(resolved, terms_per_input)]
+
+
+def normalize_many(user_inputs, batch_size=256, n_process=None):
+    """Normalizes many symptom inputs with one batched spaCy pipe.
+
+    Args:
+        user_inputs (list of str): Raw user symptom strings.
+        batch_size (int): Texts per spaCy batch. Defaults to 256.
+        n_process (int, optional): spaCy worker processes, defaults to SPACY_N_PROCESS (1).
+
+    Returns:
+        list: Normalized symptom terms for each input, as normalize_user_input returns them.
+
+    Raises:
+        ValueError: If any input is empty or invalid.
+    """
+    user_inputs = list(user_inputs)
+    if not all(isinstance(text, str) and text.strip() for text in user_inputs):
+        raise ValueError('User inputs must be non-empty strings.')
+    try:
+        with stage_timer.time('spacy'):
+            docs = get_nlp().pipe(user_inputs, batch_size=batch_size, n_process=n_process or SPACY_N_PROCESS)
+            terms_per_input = [_extract_terms(text, doc) for text, doc in zip(user_inputs, docs)]
+        for terms in terms_per_input:
+            term_counts.observe(len(terms))
+        return terms_per_input
     except Exception as e:
         raise RuntimeError(f'Normalization failed: {e}')
     
 
-def match_symptoms(user_ip, top_k=10, threshold=0.7):
+def symptom_names_to_indices(names):
+    """Map dataset symptom names to column indices (case-insensitive).
+
+    Args:
+        names (list of str): Symptom names as in aug_df.csv columns.
+
+    Returns:
+        list: Column indices, duplicates removed.
+
+    Raises:
+        ValueError: If a name is not a known symptom.
+    """
+    symptom_to_index = get_symptom_to_index()
+    unknown = [name for name in names if not isinstance(name, str) or name.strip().lower() not in symptom_to_index]
+    if unknown:
+        raise ValueError(f'Unknown symptoms: {unknown}')
+    return list(dict.fromkeys(symptom_to_index[name.strip().lower()] for name in names))
+
+
+def indices_to_vector(indices):
+    """Build the binary symptom vector from column indices.
+
+    Args:
+        indices (list of int): Matched symptom column indices.
+
+    Returns:
+        np.ndarray: Binary symptom vector.
+    """
+    ip_vec = np.zeros(len(get_symptoms_col()))
+    ip_vec[list(indices)] = 1
+    return ip_vec
+
+
+def indices_from_embeddings(user_embs, top_k=10, threshold=0.7, matched=()):
+    """Match user term embeddings to symptom column indices.
+
+    Args:
+        user_embs (np.ndarray): Embedding matrix, one row per user term, or None if there are no terms.
+        top_k (int): Maximum symptoms to match, Default set to 10.
+        threshold (float): Similarity threshold, Defaults to 0.7.
+        matched (list of int): Indices already matched by phrase, kept first.
+
+    Returns:
+        list: Matched column indices in term order, duplicates removed.
+    """
+    matched = list(matched)
+    if user_embs is not None and len(user_embs):
+        best_idx, best_scores = _search(user_embs, k=1)
+        matched += [int(idx) for idx, score in zip(best_idx[:, 0], best_scores[:, 0]) if score >= threshold]
+    return list(dict.fromkeys(matched))[:top_k]
+
+
+def vector_from_embeddings(user_embs, top_k=10, threshold=0.7):
+    """Build the binary symptom vector from user term embeddings.
+
+    Args:
+        user_embs (np.ndarray): Embedding matrix, one row per user term.
+        top_k (int): Maximum symptoms to match, Default set to 10.
+        threshold (float): Similarity threshold, Defaults to 0.7.
+
+    Returns:
+        np.ndarray: Binary symptom vector.
+    """
+    return indices_to_vector(indices_from_embeddings(user_embs, top_k=top_k, threshold=threshold))
+
+
+def match_symptoms(user_ip, top_k=10, threshold=0.7, as_indices=False):
     """Match user symptoms to dataset symptoms.
 
     Args:
         user_ip (str): User symptom input.
         top_k (int): Maximum symptoms to match, Default set to 10.
         threshold (float): Similarity threshold, Defaults to 0.7.
+        as_indices (bool): Return matched column indices instead of the dense vector. Defaults to False.
 
     Returns:
-        np.ndarray: Binary symptom vector.
+        np.ndarray or list: Binary symptom vector, or list of column indices if as_indices.
+
+    Raises:
+        ValueError: If input is invalid.
+    """
+    try:
+        matched, user_symptoms = resolve_user_input(user_ip)
+        # One forward pass for all leftover terms, none if every symptom matched by phrase
+        user_embs = get_embeddings(user_symptoms) if user_symptoms else None
+        indices = indices_from_embeddings(user_embs, top_k=top_k, threshold=threshold, matched=matched)
+        return indices if as_indices else indices_to_vector(indices)
+    except Exception as e:
+        raise RuntimeError(f'Symptom matching failed: {e}')
+
+
+def match_many(user_inputs, top_k=10, threshold=0.7, n_process=None):
+    """Match many symptom strings in bulk.
+
+    Known symptom phrases are resolved lexically; the leftovers of all inputs
+    share one spaCy pipe, one embedding pass over their unique terms and one
+    index search.
+
+    Args:
+        user_inputs (list of str): User symptom inputs.
+        top_k (int): Maximum symptoms to match per input, Default set to 10.
+        threshold (float): Similarity threshold, Defaults to 0.7.
+        n_process (int, optional): spaCy worker processes for normalization.
+
+    Returns:
+        list: Matched column indices for each input.
+
+    Raises:
+        ValueError: If any input is invalid.
+    """
+    try:
+        resolved = resolve_many(user_inputs, n_process=n_process)
+        unique_terms = list(dict.fromkeys(term for _, terms in resolved for term in terms))
+        best = {}
+        if unique_terms:
+            best_idx, best_scores = _search(get_embeddings(unique_terms), k=1)
+            best = {term: (int(idx), score) for term, idx, score in zip(unique_terms, best_idx[:, 0], best_scores[:, 0])}
+        matched = []
+        for phrase_indices, terms in resolved:
+            indices = phrase_indices + [best[term][0] for term in terms if best[term][1] >= threshold]
+            matched.append(list(dict.fromkeys(indices))[:top_k])
+        return matched
+    except Exception as e:
+        raise RuntimeError(f'Symptom matching failed: {e}')
+
+
+def match_terms(user_ip, k=5):
+    """Rank the closest dataset symptoms for every normalized user term.
+
+    Args:
+        user_ip (str): User symptom input.
+        k (int): Matches per term, Defaults to 5.
+
+    Returns:
+        dict: Term mapped to a list of (symptom, score) tuples, best first. Phrase matches are
+        keyed by their lowercase symptom name with a score of 1.0.
 
     Raises:
         ValueError: If input is invalid.
     """
     try:
-        user_symptoms = normalize_user_input(user_ip)
-        matched_symptoms = []
-        for symptom in user_symptoms:
-            user_emb = get_embedding(symptom).reshape(1, -1)
-            similarities = cosine_similarity(user_emb, symptom_embeddings)[0]
-            best_idx = np.argmax(similarities)
-            best_score = similarities[best_idx]
-            
-            if best_score >= threshold:
-                matched_symptoms.append(symptoms_col[best_idx])
-
-        matched_symptoms = list(dict.fromkeys(matched_symptoms))[:top_k]
-
-        # Create one-hot input vector
-        ip_vec = np.zeros(len(symptoms_col))
-        for match in matched_symptoms:
-            ip_vec[list(symptoms_col).index(match)] = 1
-
-        return ip_vec
+        matched, user_symptoms = resolve_user_input(user_ip)
+        symptoms_col = get_symptoms_col()
+        ranked = {symptoms_col[idx].lower(): [(symptoms_col[idx], 1.0)] for idx in matched}
+        if user_symptoms:
+            indices, scores = _search(get_embeddings(user_symptoms), k=k)
+            ranked.update({
+                term: [(symptoms_col[idx], float(score)) for idx, score in zip(term_idx, term_scores) if idx >= 0]
+                for term, term_idx, term_scores in zip(user_symptoms, indices, scores)
+            })
+        return ranked
     except Exception as e:
         raise RuntimeError(f'Symptom matching failed: {e}')
-    
\ No newline at end of file
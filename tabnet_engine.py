@@ -0,0 +1,265 @@
+"""Inference-only NumPy engine for the trained TabNet classifier."""
+
+import numpy as np
+import argparse
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_SQRT_HALF = np.float32(np.sqrt(0.5))
+
+
+def _numpy(tensor):
+    return tensor.detach().cpu().numpy().astype(np.float32)
+
+
+def _fold_bn(module):
+    '''Return (scale, shift) of an eval-mode BatchNorm1d (or the one inside a GBN).'''
+    bn = getattr(module, 'bn', module)
+    scale = _numpy(bn.weight) / np.sqrt(_numpy(bn.running_var) + np.float32(bn.eps))
+    shift = _numpy(bn.bias) - _numpy(bn.running_mean) * scale
+    return scale, shift
+
+
+def _is_identity(module):
+    return type(module).__name__ == 'Identity'
+
+
+def _sigmoid(x):
+    return np.float32(0.5) * (np.float32(1.0) + np.tanh(np.float32(0.5) * x))
+
+
+def sparsemax(x):
+    '''Sparsemax over the last axis (Martins & Astudillo, 2016).'''
+    z = x - x.max(axis=1, keepdims=True)
+    z_sorted = -np.sort(-z, axis=1)
+    k = np.arange(1, z.shape[1] + 1, dtype=z.dtype)
+    cumsum = np.cumsum(z_sorted, axis=1) - 1
+    support = (k * z_sorted > cumsum).sum(axis=1, keepdims=True)
+    tau = np.take_along_axis(cumsum, support - 1, axis=1) / support
+    return np.maximum(z - tau, 0)
+
+
+def entmax15(x):
+    '''1.5-entmax over the last axis, exact sort-based algorithm.'''
+    x = (x - x.max(axis=1, keepdims=True)) / 2
+    x_sorted = -np.sort(-x, axis=1)
+    rho = np.arange(1, x.shape[1] + 1, dtype=x.dtype)
+    mean = np.cumsum(x_sorted, axis=1) / rho
+    mean_sq = np.cumsum(x_sorted ** 2, axis=1) / rho
+    delta = (1 - rho * (mean_sq - mean ** 2)) / rho
+    tau = mean - np.sqrt(np.clip(delta, 0, None))
+    support = (tau <= x_sorted).sum(axis=1, keepdims=True)
+    tau_star = np.take_along_axis(tau, support - 1, axis=1)
+    return np.clip(x - tau_star, 0, None) ** 2
+
+
+class _GLULayer:
+    '''Linear + batch norm folded into one weight matrix, followed by a GLU.'''
+
+    def __init__(self, layer):
+        scale, shift = _fold_bn(layer.bn)
+        self.weight = _numpy(layer.fc.weight).T * scale
+        self.shift = shift
+        self.output_dim = layer.output_dim
+
+    def __call__(self, x):
+        x = x @ self.weight + self.shift
+        return x[:, :self.output_dim] * _sigmoid(x[:, self.output_dim:])
+
+
+class _GLUBlock:
+    def __init__(self, block):
+        self.first = block.first
+        self.layers = [_GLULayer(layer) for layer in block.glu_layers]
+
+    def __call__(self, x):
+        layers = self.layers
+        if self.first:
+            x = layers[0](x)
+            layers = layers[1:]
+        for layer in layers:
+            x = (x + layer(x)) * _SQRT_HALF
+        return x
+
+
+class _FeatTransformer:
+    def __init__(self, module):
+        self.blocks = [_GLUBlock(block) for block in (module.shared, module.specifics) if not _is_identity(block)]
+
+    def __call__(self, x):
+        for block in self.blocks:
+            x = block(x)
+        return x
+
+
+class _AttentiveTransformer:
+    def __init__(self, module):
+        scale, shift = _fold_bn(module.bn)
+        self.weight = _numpy(module.fc.weight).T * scale
+        self.shift = shift
+        self.selector = entmax15 if 'entmax' in type(module.selector).__name__.lower() else sparsemax
+
+    def __call__(self, prior, att):
+        return self.selector((att @ self.weight + self.shift) * prior)
+
+
+class TabNetEngine:
+    """Fused NumPy forward pass of a trained pytorch-tabnet network.
+
+    Batch norms are folded into the preceding linear layers at build time and
+    prediction is plain matrix algebra on float32 arrays, without a DataLoader or
+    torch round trip. Only networks without categorical embeddings are supported,
+    which is what the symptom model uses.
+
+    Args:
+        network (torch.nn.Module): ``TabNetClassifier.network`` in eval mode.
+
+    Raises:
+        ValueError: If the network uses categorical embeddings or multi-task outputs.
+    """
+
+    def __init__(self, network):
+        if not getattr(network.embedder, 'skip_embedding', False):
+            raise ValueError('TabNetEngine does not support categorical embeddings')
+        tabnet = network.tabnet
+        if getattr(tabnet, 'is_multi_task', False):
+            raise ValueError('TabNetEngine does not support multi-task outputs')
+        encoder = tabnet.encoder
+        self.input_dim = tabnet.input_dim
+        self.n_d = encoder.n_d
+        self.n_steps = encoder.n_steps
+        self.gamma = np.float32(encoder.gamma)
+        self.bn_scale, self.bn_shift = _fold_bn(encoder.initial_bn)
+        self.initial_splitter = _FeatTransformer(encoder.initial_splitter)
+        self.feat_transformers = [_FeatTransformer(module) for module in encoder.feat_transformers]
+        self.att_transformers = [_AttentiveTransformer(module) for module in encoder.att_transformers]
+        group_matrix = getattr(encoder, 'group_attention_matrix', None)
+        group_matrix = _numpy(group_matrix) if group_matrix is not None else None
+        # The common ungrouped case is an identity matrix, skip the matmul entirely
+        if group_matrix is not None and group_matrix.shape[0] == group_matrix.shape[1] and np.array_equal(group_matrix, np.eye(len(group_matrix))):
+            group_matrix = None
+        self.group_matrix = group_matrix
+        self.attention_dim = group_matrix.shape[0] if group_matrix is not None else self.input_dim
+        self.final_mapping = _numpy(tabnet.final_mapping.weight).T
+
+    def logits(self, x):
+        '''Network output before softmax for a dense float32 batch.'''
+        x = x * self.bn_scale + self.bn_shift
+        prior = np.ones((x.shape[0], self.attention_dim), dtype=np.float32)
+        att = self.initial_splitter(x)[:, self.n_d:]
+        res = np.zeros((x.shape[0], self.n_d), dtype=np.float32)
+        for step in range(self.n_steps):
+            mask = self.att_transformers[step](prior, att)
+            prior = (self.gamma - mask) * prior
+            if self.group_matrix is not None:
+                mask = mask @ self.group_matrix
+            out = self.feat_transformers[step](mask * x)
+            res += np.maximum(out[:, :self.n_d], 0)
+            att = out[:, self.n_d:]
+        return res @ self.final_mapping
+
+    def predict_proba(self, X, chunk_size=1024):
+        '''Class probabilities for a batch of symptom vectors.
+
+        Args:
+            X (np.ndarray or sparse matrix): Symptom matrix, one row per input.
+            chunk_size (int): Rows densified and scored at a time. Defaults to 1024.
+
+        Returns:
+            np.ndarray: Probability matrix, one row per input.
+        '''
+        sparse = hasattr(X, 'toarray')
+        X = X if sparse else np.atleast_2d(X)
+        if X.shape[1] != self.input_dim:
+            raise ValueError(f'Input vector size {X.shape[1]} does not match {self.input_dim} features')
+        results = []
+        for start in range(0, X.shape[0], chunk_size):
+            chunk = X[start:start + chunk_size]
+            chunk = chunk.toarray() if sparse else chunk
+            logits = self.logits(np.asarray(chunk, dtype=np.float32))
+            logits -= logits.max(axis=1, keepdims=True)
+            proba = np.exp(logits)
+            results.append(proba / proba.sum(axis=1, keepdims=True))
+        return np.vstack(results)
+
+
+def random_symptom_rows(n_rows, n_features, max_symptoms=8, seed=0):
+    '''Random sparse binary symptom vectors, used for validation and benchmarks.'''
+    rng = np.random.default_rng(seed)
+    X = np.zeros((n_rows, n_features), dtype=np.float32)
+    for row in range(n_rows):
+        X[row, rng.choice(n_features, rng.integers(1, max_symptoms + 1), replace=False)] = 1
+    return X
+
+
+def build_engine(model, n_check=64, atol=1e-4):
+    '''Compile a fitted TabNetClassifier and check it against the torch path.
+
+    Args:
+        model (TabNetClassifier): Loaded classifier.
+        n_check (int): Random symptom rows compared at build time. Defaults to 64.
+        atol (float): Largest allowed probability difference. Defaults to 1e-4.
+
+    Returns:
+        TabNetEngine: The validated engine.
+
+    Raises:
+        ValueError: If the network is unsupported or its output differs from TabNet's.
+    '''
+    model.network.eval()
+    engine = TabNetEngine(model.network)
+    if n_check:
+        X = random_symptom_rows(n_check, engine.input_dim)
+        diff = float(np.abs(engine.predict_proba(X) - model.predict_proba(X)).max())
+        if diff > atol:
+            raise ValueError(f'NumPy TabNet output differs from predict_proba by {diff:.2e}')
+    return engine
+
+
+def benchmark(model, engine, batch_sizes=(1, 32, 256), repeat=20):
+    '''Time TabNetClassifier.predict_proba against the NumPy engine.
+
+    Args:
+        model (TabNetClassifier): Loaded classifier.
+        engine (TabNetEngine): Engine built from it.
+        batch_sizes (tuple of int): Batch sizes to time.
+        repeat (int): Timed calls per batch size.
+
+    Returns:
+        list: One dict per batch size with mean milliseconds per call for both paths and their max difference.
+    '''
+    results = []
+    for batch_size in batch_sizes:
+        X = random_symptom_rows(batch_size, engine.input_dim, seed=batch_size)
+        timings = {}
+        for name, fn in (('torch', model.predict_proba), ('numpy', engine.predict_proba)):
+            fn(X)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                fn(X)
+            timings[name] = (time.perf_counter() - start) / repeat * 1000
+        results.append({
+            'batch_size': batch_size,
+            'torch_ms': timings['torch'],
+            'numpy_ms': timings['numpy'],
+            'speedup': timings['torch'] / timings['numpy'],
+            'max_abs_diff': float(np.abs(model.predict_proba(X) - engine.predict_proba(X)).max()),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the NumPy TabNet engine against predict_proba.')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32, 256])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    from tabnet_model import get_model
+    model_tab = get_model()
+    engine = build_engine(model_tab)
+    for result in benchmark(model_tab, engine, batch_sizes=args.batch_sizes, repeat=args.repeat):
+        logger.info(f"batch={result['batch_size']:>4}  torch={result['torch_ms']:.2f}ms  numpy={result['numpy_ms']:.2f}ms  "
+                    f"speedup={result['speedup']:.1f}x  max_abs_diff={result['max_abs_diff']:.1e}")
@@ -1,23 +1,126 @@
 """TabNet model for the disease predictions"""
 
-import pandas as pd
 import numpy as np
 from pytorch_tabnet.tab_model import TabNetClassifier
+from tabnet_engine import build_engine
+from artifacts import TABNET_MODEL_PATH, get_dataset_metadata
+from startup import artifact
+from metrics import stage_timer
 import os
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-try:
-    aug_df = pd.read_csv(os.path.join('data', 'aug_df.csv'))
-    disease_classes = pd.factorize(aug_df['Prognosis'])[1]
-    symptoms_col = aug_df.columns[1:]
-    model_tab = TabNetClassifier()
-    model_tab.load_model(os.path.join('data', 'tabnet_model.zip'))
-except Exception as e:
-    logger.error(f"Error loading TabNet data/model: {e}")
-    
+TABNET_ENGINE = os.getenv('TABNET_ENGINE', 'numpy')
+
+
+@artifact('tabnet_model', paths=(TABNET_MODEL_PATH,))
+def get_model():
+    """Trained TabNetClassifier, checked against the symptom columns and disease classes."""
+    try:
+        model_tab = TabNetClassifier()
+        model_tab.load_model(TABNET_MODEL_PATH)
+    except Exception as e:
+        raise RuntimeError(f"Error loading TabNet data/model: {e}")
+    metadata = get_dataset_metadata()
+    if (model_tab.input_dim, model_tab.output_dim) != (len(metadata.symptoms_col), len(metadata.disease_classes)):
+        raise RuntimeError(f'TabNet model maps {model_tab.input_dim} features to {model_tab.output_dim} classes, '
+                           f'the dataset has {len(metadata.symptoms_col)} symptoms and {len(metadata.disease_classes)} diseases')
+    return model_tab
+
+
+@artifact('tabnet_engine')
+def get_engine():
+    """Fused NumPy forward pass validated against predict_proba, None if disabled (TABNET_ENGINE=torch) or unavailable."""
+    if TABNET_ENGINE != 'numpy':
+        return None
+    try:
+        return build_engine(get_model())
+    except ValueError as e:
+        logger.warning(f"NumPy TabNet engine unavailable, using predict_proba: {e}")
+        return None
+
+
+def to_input_matrix(ip_vec):
+    '''Convert symptom input to the dense 2-D matrix TabNet expects.
+
+    Args:
+        ip_vec: Dense vector or matrix (np.ndarray), sparse matrix (anything with
+            ``toarray``), or a list/tuple/set of matched symptom column indices.
+
+    Returns:
+        np.ndarray: Matrix with one row per input (sparse input stays sparse for the NumPy engine).
+
+    Raises:
+        ValueError: If the number of columns or an index is out of range.
+    '''
+    symptoms_col = get_dataset_metadata().symptoms_col
+    if isinstance(ip_vec, (list, tuple, set, frozenset)):
+        indices = np.fromiter(ip_vec, dtype=np.int64, count=len(ip_vec))
+        if indices.size and (indices.min() < 0 or indices.max() >= len(symptoms_col)):
+            raise ValueError(f'Symptom indices must be in [0, {len(symptoms_col)})')
+        ip_matrix = np.zeros((1, len(symptoms_col)))
+        ip_matrix[0, indices] = 1
+        return ip_matrix
+    if hasattr(ip_vec, 'toarray'):
+        if ip_vec.shape[-1] != len(symptoms_col):
+            raise ValueError(f'Input vector size {ip_vec.shape[-1]} does not match {len(symptoms_col)} symptoms')
+        # The engine densifies sparse input chunk by chunk
+        return ip_vec if get_engine() is not None else ip_vec.toarray()
+    ip_matrix = np.atleast_2d(ip_vec)
+    if ip_matrix.shape[-1] != len(symptoms_col):
+        raise ValueError(f'Input vector size {ip_matrix.shape[-1]} does not match {len(symptoms_col)} symptoms')
+    return ip_matrix
+
+
+@stage_timer.timed('tabnet_predict')
+def predict_proba(ip_matrix):
+    '''Predict class probabilities for a batch of symptom vectors.
+
+    Args:
+        ip_matrix (np.ndarray): Symptom vectors, one row per input (sparse matrices accepted).
+
+    Returns:
+        np.ndarray: Probability matrix, one row per input.
+
+    Raises:
+        ValueError: If the number of columns is incorrect.
+    '''
+    ip_matrix = to_input_matrix(ip_matrix)
+    engine = get_engine()
+    if engine is not None:
+        return engine.predict_proba(ip_matrix)
+    return get_model().predict_proba(ip_matrix)
+
+
+def predict_proba_rows(ip_vecs):
+    '''Predict class probabilities for dense symptom vectors gathered from several requests.
+
+    Args:
+        ip_vecs (list of np.ndarray): Dense symptom vectors.
+
+    Returns:
+        np.ndarray: Probability matrix, one row per vector.
+    '''
+    return predict_proba(np.vstack(ip_vecs))
+
+
+def top_diseases_from_proba(pred_prob, top_k=3):
+    '''Pick the top diseases from one row of class probabilities.
+
+    Args:
+        pred_prob (np.ndarray): Class probabilities for one input.
+        top_k (int): No. of top predictions to return, Defaut set to 3.
+
+    Returns:
+        list: List of (disease, probability) tuples.
+    '''
+    top_k_ind = np.argsort(pred_prob)[::-1][:top_k]
+    top_k_prob = pred_prob[top_k_ind]
+    top_k_diseases = get_dataset_metadata().disease_classes[top_k_ind]
+    return list(zip(top_k_diseases, top_k_prob))
+
 
 # Retrieve top k diseases using TabNet
 
@@ -25,7 +128,7 @@ def retrieve_top_diseases(ip_vec, top_k=3):
     '''Predict top diseases based on symptom vector.
 
     Args:
-        ip_vec (np.ndarray): Input symptom vector.
+        ip_vec (np.ndarray, sparse matrix or list of int): Input symptom vector, or matched symptom column indices.
         top_k (int): No. of top predictions to return, Defaut set to 3.
 
     Returns:
@@ -34,14 +137,9 @@ def retrieve_top_diseases(ip_vec, top_k=3):
     Raises:
         ValueError: If input vector shape is incorrect.    
     '''
-    if ip_vec.shape[-1] != len(symptoms_col):
-        raise ValueError(f'Input vector size {ip_vec.shape[-1]} does not match {len(symptoms_col)} symptoms')
+    ip_matrix = to_input_matrix(ip_vec)
     try:
-        ip_vec = ip_vec.reshape(1, -1)
-        pred_prob = model_tab.predict_proba(ip_vec)
-        top_k_ind = np.argsort(pred_prob[0])[::-1][:top_k]
-        top_k_prob = pred_prob[0][top_k_ind]
-        top_k_diseases = disease_classes[top_k_ind]
-        return list(zip(top_k_diseases, top_k_prob))
+        pred_prob = predict_proba(ip_matrix[:1])
+        return top_diseases_from_proba(pred_prob[0], top_k=top_k)
     except Exception as e:
         raise RuntimeError(f'Prediction failed: {e}')
\ No newline at end of file